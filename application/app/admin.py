@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import LearningStatus, User, Word, WordStatus
+from .models import DictionaryEntry, LearningStatus, User, Word, WordStatus
 
 admin.site.register(User)
 
@@ -27,3 +27,10 @@ class LearningStatusAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'word__text', 'word__translate')
     filter_fields = ('user',)
     list_display = ('__str__', 'user', 'date_created', 'date_updated',)
+
+
+@admin.register(DictionaryEntry)
+class DictionaryEntryAdmin(admin.ModelAdmin):
+    search_fields = ('word',)
+    list_filter = ('has_sound',)
+    list_display = ('__str__', 'has_sound', 'expires_at', 'date_updated')
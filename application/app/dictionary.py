@@ -0,0 +1,225 @@
+"""
+Кэш поиска слов в словаре skyeng
+
+Поиск идет по уровням:
+- LRU в памяти процесса (SKYENG_CACHE_MEMORY_SIZE слов)
+- локальный файл словаря SKYENG_BUNDLE_PATH (см. app.dictionary_bundle), если он собран:
+  с ним бот работает, даже если skyeng недоступен. В файле только найденные слова
+- таблица DictionaryEntry (общая для всех процессов)
+- запрос в SkyengClient, ответ сохраняется в оба уровня
+
+Ответ хранится SKYENG_CACHE_TTL, а если слово не нашлось или у него нет произношения -
+SKYENG_CACHE_NEGATIVE_TTL. Ошибки запроса (ClientException) не кэшируются.
+
+В asyncio runtime бота (telegram.aio) поиск - корутина: запрос в skyeng выполняет event loop,
+а работу с БД - run_orm (поток executor-а runtime-а).
+"""
+import collections
+import contextlib
+import json
+import threading
+import typing
+
+from django.conf import settings
+from django.utils import timezone
+
+from app import metrics
+from app.models import DictionaryEntry, Word
+from clients.base import ClientException
+from clients.skyeng import AsyncSkyengClient, SkyengClient
+from clients.skyeng import schemas as skyeng_schemas
+from clients.skyeng.client import normalize_word
+
+from .dictionary_bundle import DictionaryBundle
+
+# выполняет синхронную функцию с ORM вне event loop-а, см. telegram.aio.AsyncRuntime.run_orm
+RunOrm = typing.Callable[..., typing.Awaitable]
+
+
+def get_expires_at(word_list: skyeng_schemas.WordList):
+    if word_list.get_first_word_with_sound():
+        return timezone.now() + settings.SKYENG_CACHE_TTL
+    return timezone.now() + settings.SKYENG_CACHE_NEGATIVE_TTL
+
+
+class DictionaryCache:
+    def __init__(self, memory_size: int, bundle: DictionaryBundle):
+        self.memory_size = memory_size
+        self.bundle = bundle
+        self._lock = threading.Lock()
+        # слово -> (WordList, expires_at)
+        self._memory: collections.OrderedDict = collections.OrderedDict()
+        self._counters = metrics.Counters(
+            'memory_hits', 'bundle_hits', 'db_hits', 'misses', 'negative_hits', 'errors',
+        )
+
+    def search_word_meanings(self, word: str) -> skyeng_schemas.WordList:
+        """ Бросает ClientException, если словарь недоступен """
+        key = normalize_word(word)
+        word_list = self._get_from_local(key)
+        if word_list is None:
+            word_list = self._get_from_db(key)
+        if word_list is None:
+            self._counters.incr('misses')
+            client = SkyengClient(settings.SKYENG_API_URL or None)
+            with self._counting_errors():
+                response = client.search_word_meanings(key)
+            return self._save(key, response)
+        return self._count_hit(word_list)
+
+    async def search_word_meanings_async(self, word: str,
+                                         run_orm: RunOrm) -> skyeng_schemas.WordList:
+        """ Как search_word_meanings, для asyncio runtime-а """
+        key = normalize_word(word)
+        word_list = self._get_from_local(key)
+        if word_list is None:
+            word_list = await run_orm(self._get_from_db, key)
+        if word_list is None:
+            self._counters.incr('misses')
+            client = AsyncSkyengClient(settings.SKYENG_API_URL or None)
+            with self._counting_errors():
+                response = await client.search_word_meanings(key)
+            return await run_orm(self._save, key, response)
+        return self._count_hit(word_list)
+
+    def _get_from_local(self, key: str) -> typing.Optional[skyeng_schemas.WordList]:
+        """ Из памяти или из файла словаря: без сети и БД """
+        word_list = self._get_from_memory(key)
+        if word_list is None:
+            word_list = self._get_from_bundle(key)
+        return word_list
+
+    def _count_hit(self, word_list: skyeng_schemas.WordList) -> skyeng_schemas.WordList:
+        if not word_list.get_first_word_with_sound():
+            self._counters.incr('negative_hits')
+        return word_list
+
+    @contextlib.contextmanager
+    def _counting_errors(self):
+        try:
+            yield
+        except ClientException:
+            self._counters.incr('errors')
+            raise
+
+    def find_word(self, word: str) -> typing.Optional[skyeng_schemas.Word]:
+        try:
+            return self.search_word_meanings(word).get_first_word_with_sound()
+        except ClientException:
+            return None
+
+    def _get_from_memory(self, key: str) -> typing.Optional[skyeng_schemas.WordList]:
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            word_list, expires_at = item
+            if expires_at <= timezone.now():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+        self._counters.incr('memory_hits')
+        return word_list
+
+    def _set_to_memory(self, key: str, word_list: skyeng_schemas.WordList, expires_at):
+        with self._lock:
+            self._memory[key] = (word_list, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _get_from_bundle(self, key: str) -> typing.Optional[skyeng_schemas.WordList]:
+        data = self.bundle.get(key)
+        if data is None:
+            return None
+
+        word_list = skyeng_schemas.WordList.parse_obj(json.loads(data))
+        if not word_list.get_first_word_with_sound():
+            # "не нашлось" из файла не кэшируем: ищем в кэше и skyeng (SKYENG_CACHE_NEGATIVE_TTL)
+            return None
+        self._set_to_memory(key, word_list, get_expires_at(word_list))
+        self._counters.incr('bundle_hits')
+        return word_list
+
+    def _get_from_db(self, key: str) -> typing.Optional[skyeng_schemas.WordList]:
+        entry = DictionaryEntry.objects.filter(word=key, expires_at__gt=timezone.now()).first()
+        if not entry:
+            return None
+
+        word_list = skyeng_schemas.WordList.parse_obj(json.loads(entry.data))
+        self._set_to_memory(key, word_list, entry.expires_at)
+        self._counters.incr('db_hits')
+        return word_list
+
+    def _save(self, key: str, word_list: skyeng_schemas.WordList) -> skyeng_schemas.WordList:
+        expires_at = get_expires_at(word_list)
+        fields = dict(
+            data=json.dumps(word_list.dict(by_alias=True)['__root__']),
+            has_sound=word_list.get_first_word_with_sound() is not None,
+            expires_at=expires_at,
+        )
+        # слово могли одновременно искать в другом процессе: вставка без ошибки на конфликт
+        is_updated = DictionaryEntry.objects.filter(word=key).update(
+            date_updated=timezone.now(), **fields,
+        )
+        if not is_updated:
+            DictionaryEntry.objects.bulk_create(
+                [DictionaryEntry(word=key, **fields)], ignore_conflicts=True,
+            )
+        self._set_to_memory(key, word_list, expires_at)
+        return word_list
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            memory_words = len(self._memory)
+        return {'memory_words': memory_words, **self._counters.as_dict()}
+
+
+def enrich_word(word: Word):
+    """
+    Сохраняет в слово данные из словаря: произношение, картинку и слово в словаре
+
+    Если словарь недоступен - бросает ClientException, слово остается не обогащенным
+    """
+    eng_word = word.get_english_word()
+    found_word = eng_word and cache.search_word_meanings(eng_word).get_first_word_with_sound()
+    save_found_word(word, found_word)
+
+
+async def enrich_word_async(word: Word, run_orm: RunOrm):
+    """ Как enrich_word, для asyncio runtime-а """
+    eng_word = word.get_english_word()
+    found_word = None
+    if eng_word:
+        word_list = await cache.search_word_meanings_async(eng_word, run_orm)
+        found_word = word_list.get_first_word_with_sound()
+    await run_orm(save_found_word, word, found_word)
+
+
+def save_found_word(word: Word, found_word: typing.Optional[skyeng_schemas.Word]):
+    word.dictionary_text = found_word.text if found_word else ''
+    word.sound_url = found_word.get_sound_url() if found_word else ''
+    word.image_url = (found_word.get_image_url() or '') if found_word else ''
+    word.date_enriched = timezone.now()
+    # не нашлось - поищем снова, когда истечет ответ в кэше (SKYENG_CACHE_NEGATIVE_TTL);
+    # не английское слово искать бесполезно
+    word.enrich_retry_after = None
+    if found_word is None and word.get_english_word():
+        word.enrich_retry_after = word.date_enriched + settings.SKYENG_CACHE_NEGATIVE_TTL
+    word.save(update_fields=(
+        'dictionary_text', 'sound_url', 'image_url', 'date_enriched', 'enrich_retry_after',
+    ))
+
+
+cache = DictionaryCache(
+    memory_size=settings.SKYENG_CACHE_MEMORY_SIZE,
+    bundle=DictionaryBundle(settings.SKYENG_BUNDLE_PATH),
+)
+metrics.register('dictionary_cache', cache.get_metrics)
+metrics.register('dictionary_bundle', cache.bundle.get_metrics)
+metrics.register('skyeng_circuit_breaker', SkyengClient.circuit_breaker.get_metrics)
+metrics.register('skyeng_single_flight', SkyengClient.single_flight.get_metrics)
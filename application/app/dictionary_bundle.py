@@ -0,0 +1,149 @@
+"""
+Локальный файл словаря (bundle): ответы skyeng, отсортированные по слову
+
+Файл открывается через mmap, поэтому все процессы бота читают его из page cache ОС,
+без копии в памяти каждого процесса. Поиск - бинарный поиск по индексу.
+
+Формат (все числа little-endian):
+    заголовок: MAGIC, количество слов (uint32)
+    индекс: для каждого слова по порядку (uint32 x4):
+        смещение слова, длина слова, смещение ответа, длина ответа
+    данные: слова (utf-8) и ответы словаря (json списка WordList)
+
+Собирается командой `manage.py dictionary_bundle build` во временный файл, который
+атомарно заменяет старый: процессы, открывшие старый файл, продолжают его читать,
+новый подхватят при следующей проверке (см. DictionaryBundle.reload_interval).
+"""
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WKDICT01'
+HEADER = struct.Struct('<8sI')
+INDEX_ITEM = struct.Struct('<IIII')
+
+
+def write_bundle(path: str, entries: typing.Dict[str, bytes]):
+    """ entries: нормализованное слово -> ответ словаря (json) """
+    items = sorted((word.encode('utf-8'), data) for word, data in entries.items())
+
+    offset = HEADER.size + INDEX_ITEM.size * len(items)
+    index = []
+    for word, data in items:
+        index.append(INDEX_ITEM.pack(offset, len(word), offset + len(word), len(data)))
+        offset += len(word) + len(data)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.dictionary-bundle-')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, len(items)))
+            file.writelines(index)
+            for word, data in items:
+                file.write(word)
+                file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class BundleFile:
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self.stat = os.fstat(file.fileno())
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a dictionary bundle')
+
+    def _get_index_item(self, position: int) -> typing.Tuple[int, int, int, int]:
+        return INDEX_ITEM.unpack_from(self.mmap, HEADER.size + INDEX_ITEM.size * position)
+
+    def _get_word(self, position: int) -> bytes:
+        word_offset, word_length, _, _ = self._get_index_item(position)
+        return self.mmap[word_offset:word_offset + word_length]
+
+    def get(self, word: str) -> typing.Optional[bytes]:
+        key = word.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_word(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == self.count or self._get_word(low) != key:
+            return None
+        _, _, data_offset, data_length = self._get_index_item(low)
+        return self.mmap[data_offset:data_offset + data_length]
+
+    def items(self) -> typing.Iterator[typing.Tuple[str, bytes]]:
+        for position in range(self.count):
+            word_offset, word_length, data_offset, data_length = self._get_index_item(position)
+            yield (
+                self.mmap[word_offset:word_offset + word_length].decode('utf-8'),
+                self.mmap[data_offset:data_offset + data_length],
+            )
+
+    def is_same_file(self, stat: os.stat_result) -> bool:
+        return (self.stat.st_ino, self.stat.st_mtime) == (stat.st_ino, stat.st_mtime)
+
+
+class DictionaryBundle:
+    """ Открывает файл при первом поиске и переоткрывает, если его пересобрали """
+
+    def __init__(self, path: str, reload_interval=60):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._file: typing.Optional[BundleFile] = None
+        self._checked_at = None
+
+    def get(self, word: str) -> typing.Optional[bytes]:
+        bundle_file = self._get_file()
+        if bundle_file is None:
+            return None
+        return bundle_file.get(word)
+
+    def _get_file(self) -> typing.Optional[BundleFile]:
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return self._file
+
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+                return self._file
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path) if self.path else None
+            except FileNotFoundError:
+                stat = None
+
+            if stat is None:
+                self._file = None
+            elif self._file is None or not self._file.is_same_file(stat):
+                try:
+                    self._file = BundleFile(self.path)
+                    logger.info('Dictionary bundle %s opened: %d words',
+                                self.path, self._file.count)
+                except (OSError, ValueError):
+                    logger.exception('Fail open dictionary bundle %s', self.path)
+                    self._file = None
+            return self._file
+
+    def get_metrics(self) -> dict:
+        bundle_file = self._file
+        return {'words': bundle_file.count if bundle_file else 0}
@@ -0,0 +1,73 @@
+"""
+Очередь слов для изучения
+
+Пользователь учит сначала свои слова, затем общие (user=None) - по возрастанию id,
+курсор - LearningStatus.learn_word_id (текущее слово).
+
+Свои слова достаются запросом по индексу app_word_user_id_id_idx (index-only, без сортировки
+таблицы, останавливается на LIMIT), общие - из каталога в памяти процесса (app.word_catalog).
+Слова запоминаются на время обработки обновления: next_learn_word, set_next_learn_word
+и get_upcoming_learn_words в одном обновлении делают один запрос
+(проверка планов: app.tests.test_learning_queue, на большой базе - benchmarks.learning_queue).
+"""
+import typing
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+from app.models import LearningStatus, Word
+from app.word_catalog import general_words
+
+
+def get_user_words(user_id: int, from_id: int, count: int) -> QuerySet:
+    # id следующих слов находит Index Only Scan по app_word_user_id_id_idx (строки таблицы
+    # не читаются, пока идем по индексу), строки достаются по первичному ключу только для них
+    word_ids = (
+        Word.objects
+        .filter(user_id=user_id, id__gt=from_id)
+        .order_by('id')
+        .values('id')[:count]
+    )
+    return Word.objects.filter(id__in=word_ids).order_by('id')
+
+
+class LearningQueue:
+    def __init__(self, learning_status: LearningStatus):
+        self.learning_status = learning_status
+        # текущее слово, следующее за ним и слова, которые загрузит app.prefetch
+        self.batch_size = settings.SKYENG_PREFETCH_WORDS + 2
+        self._from_id = None
+        self._words: typing.List[Word] = []
+        self._is_complete = False  # загружены все оставшиеся слова
+
+    def peek(self, count: int) -> typing.List[Word]:
+        """ Следующие count слов после курсора """
+        from_id = self.learning_status.learn_word_id or 0
+        if from_id != self._from_id:
+            self._move_to(from_id)
+        if len(self._words) < count and not self._is_complete:
+            self._load(from_id, max(count, self.batch_size))
+        return self._words[:count]
+
+    def next_word(self) -> typing.Optional[Word]:
+        words = self.peek(1)
+        return words[0] if words else None
+
+    def _move_to(self, from_id: int):
+        # set_next_learn_word сдвигает курсор на одно из загруженных слов
+        for position, word in enumerate(self._words):
+            if word.id == from_id:
+                self._words = self._words[position + 1:]
+                self._from_id = from_id
+                return
+        self._words = []
+        self._is_complete = False
+        self._from_id = from_id
+
+    def _load(self, from_id: int, count: int):
+        self._words = list(get_user_words(self.learning_status.user_id, from_id, count))
+        if len(self._words) < count:
+            last_id = self._words[-1].id if self._words else from_id
+            self._words += general_words.get_after(last_id, count - len(self._words))
+        self._is_complete = len(self._words) < count
+        self._from_id = from_id
@@ -0,0 +1,111 @@
+import json
+import os
+import random
+import time
+import typing
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from app.dictionary_bundle import BundleFile, write_bundle
+from app.models import DictionaryEntry
+from clients.skyeng import schemas as skyeng_schemas
+from clients.skyeng.client import normalize_word
+
+
+class Command(BaseCommand):
+    help = (
+        'Локальный файл словаря skyeng. build - собрать из кэша (DictionaryEntry) '
+        'и/или дампа, lookup - найти слово, benchmark - замерить скорость поиска'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('build', 'lookup', 'benchmark'))
+        parser.add_argument('words', nargs='*', help='Слова для lookup')
+        parser.add_argument('--path', default=settings.SKYENG_BUNDLE_PATH)
+        parser.add_argument(
+            '--import', dest='import_path',
+            help='Дамп в формате JSON Lines: {"word": "hello", "data": [ответ skyeng]}',
+        )
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Не добавлять ответы из таблицы DictionaryEntry')
+        parser.add_argument('--merge', action='store_true',
+                            help='Сохранить слова из текущего файла, которых нет в источниках')
+        parser.add_argument('--lookups', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        getattr(self, options['action'])(**options)
+
+    def build(self, path, import_path=None, no_cache=False, merge=False, **options):
+        entries: typing.Dict[str, bytes] = {}
+        if merge and os.path.exists(path):
+            entries.update(BundleFile(path).items())
+            self.stdout.write(f'Merge {len(entries)} words from {path}')
+        if import_path:
+            entries.update(self.read_dump(import_path))
+        if not no_cache:
+            # устаревшие и "не нашлось" не кладем: файл проверяется раньше кэша и skyeng,
+            # такой ответ жил бы до следующей сборки, а не SKYENG_CACHE_(NEGATIVE_)TTL
+            cached = DictionaryEntry.objects.filter(
+                expires_at__gt=timezone.now(), has_sound=True,
+            ).values_list('word', 'data').iterator()
+            entries.update((word, data.encode('utf-8')) for word, data in cached)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        write_bundle(path, entries)
+        size = os.path.getsize(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Bundle {path}: {len(entries)} words, {size / 1024 / 1024:.1f} MB'
+        ))
+
+    def read_dump(self, import_path: str) -> typing.Iterator[typing.Tuple[str, bytes]]:
+        with open(import_path, encoding='utf-8') as file:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                    word_list = skyeng_schemas.WordList.parse_obj(item['data'])
+                except (ValueError, KeyError, TypeError) as e:
+                    raise CommandError(f'{import_path}:{line_number}: {e}')
+                if word_list.get_first_word_with_sound():
+                    yield normalize_word(item['word']), json.dumps(item['data']).encode('utf-8')
+
+    def lookup(self, path, words, **options):
+        bundle_file = BundleFile(path)
+        for word in words:
+            data = bundle_file.get(normalize_word(word))
+            self.stdout.write(f'{word}: {data.decode("utf-8") if data else None}')
+
+    def benchmark(self, path, lookups, **options):
+        bundle_file = BundleFile(path)
+        if not bundle_file.count:
+            raise CommandError('Bundle is empty')
+        words = [word for word, _ in bundle_file.items()]
+        # половина поисков - слов, которых нет в словаре
+        sample = [
+            random.choice(words) if number % 2 else f'{random.choice(words)}-missing'
+            for number in range(lookups)
+        ]
+
+        started = time.perf_counter()
+        for word in sample:
+            bundle_file.get(word)
+        lookup_time = (time.perf_counter() - started) / lookups
+
+        started = time.perf_counter()
+        for word in sample[1::2][:1000]:
+            skyeng_schemas.WordList.parse_obj(json.loads(bundle_file.get(word)))
+        parse_time = (time.perf_counter() - started) / len(sample[1::2][:1000])
+
+        db_sample = sample[:200]
+        started = time.perf_counter()
+        for word in db_sample:
+            DictionaryEntry.objects.filter(word=word).first()
+        db_time = (time.perf_counter() - started) / len(db_sample)
+
+        self.stdout.write(f'Bundle: {bundle_file.count} words')
+        self.stdout.write(f'bundle lookup:          {lookup_time * 1e6:8.1f} us')
+        self.stdout.write(f'bundle lookup + parse:  {(lookup_time + parse_time) * 1e6:8.1f} us')
+        self.stdout.write(f'DictionaryEntry query:  {db_time * 1e6:8.1f} us')
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from app.dictionary import enrich_word
+from app.models import Word
+from clients.base import ClientException
+
+
+def safe_enrich_word(word: Word) -> bool:
+    try:
+        enrich_word(word)
+        return True
+    except ClientException:
+        return False
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет в слова произношение и картинку из словаря skyeng'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Обогатить все слова, а не только новые и не найденные в словаре',
+        )
+        parser.add_argument(
+            '--start-id', type=int, default=0,
+            help='Продолжить с этого id слова (id выводится в прогрессе)',
+        )
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Сколько запросов в словарь выполнять параллельно')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        words = Word.objects.order_by('id')
+        if not options['all']:
+            # пропущенные из-за ошибки слова останутся необогащенными до следующего запуска,
+            # не найденные в словаре - ищутся снова после enrich_retry_after
+            words = words.filter(
+                Q(date_enriched=None) | Q(enrich_retry_after__lte=timezone.now()),
+            )
+        words = words.filter(id__gte=options['start_id'])
+        total = words.count()
+
+        processed = failed = 0
+        with ThreadPoolExecutor(options['threads']) as executor:
+            last_id = options['start_id'] - 1
+            while True:
+                batch = list(words.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+
+                results = list(executor.map(safe_enrich_word, batch))
+                last_id = batch[-1].id
+                processed += len(batch)
+                failed += results.count(False)
+                self.stdout.write(
+                    f'Enriched {processed}/{total} words, failed={failed}, '
+                    f'checkpoint: --start-id {last_id + 1}'
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {processed} words, failed={failed}'))
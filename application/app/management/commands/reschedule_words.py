@@ -0,0 +1,36 @@
+import time
+
+from django.core.management import BaseCommand
+
+from app.models import WordStatus
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит слова, которые ждут повторения, по алгоритму пользователя и текущим '
+        'настройкам (REPETITION_TIMES, REPETITION_DESIRED_RETENTION). Запускать по ночам'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start-id', type=int, default=0,
+            help='Продолжить с этого id WordStatus (id выводится в прогрессе)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        processed = changed = 0
+        chunks = WordStatus.reschedule(
+            last_id=options['start_id'] - 1, chunk_size=options['chunk_size'],
+        )
+        for last_id, count, chunk_changed in chunks:
+            processed += count
+            changed += chunk_changed
+            self.stdout.write(
+                f'Rescheduled {changed}/{processed} words, '
+                f'{processed / (time.monotonic() - started):.0f} words/s, '
+                f'checkpoint: --start-id {last_id + 1}'
+            )
+        self.stdout.write(f'Done: rescheduled {changed}/{processed} words '
+                          f'in {time.monotonic() - started:.1f}s')
@@ -0,0 +1,52 @@
+import logging
+import threading
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+_collectors: typing.Dict[str, typing.Callable[[], dict]] = {}
+
+
+def register(name: str, collector: typing.Callable[[], dict]):
+    """
+    collector - функция без аргументов, которая возвращает dict с текущими значениями метрик
+
+    пример:
+        metrics.register('dispatcher', dispatcher.get_metrics)
+    """
+    _collectors[name] = collector
+
+
+def collect() -> dict:
+    return {name: collector() for name, collector in _collectors.items()}
+
+
+class Counters:
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(names, 0)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+class PeriodicLogger:
+    """ Пишет все метрики в лог не чаще чем раз в interval секунд """
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self._last_time = time.monotonic()
+
+    def maybe_log(self):
+        now = time.monotonic()
+        if now - self._last_time < self.interval:
+            return
+        self._last_time = now
+        for name, values in collect().items():
+            logger.info('Metrics %s: %s', name, values)
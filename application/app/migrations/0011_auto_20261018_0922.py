@@ -0,0 +1,28 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_auto_20190822_1126'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DictionaryEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('word', models.CharField(max_length=256, unique=True, verbose_name='Слово в нижнем регистре')),
+                ('data', models.TextField(verbose_name='Ответ словаря (json)')),
+                ('has_sound', models.BooleanField(default=False, verbose_name='Нашлось слово с произношением')),
+                ('expires_at', models.DateTimeField(verbose_name='Время, до которого ответ актуален')),
+            ],
+            options={
+                'verbose_name': 'Слово из словаря skyeng',
+            },
+        ),
+    ]
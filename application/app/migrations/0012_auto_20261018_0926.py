@@ -0,0 +1,33 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_auto_20261018_0922'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='word',
+            name='date_enriched',
+            field=models.DateTimeField(blank=True, help_text='Если стоит None -> слово еще не искали', null=True, verbose_name='Когда искали слово в словаре'),
+        ),
+        migrations.AddField(
+            model_name='word',
+            name='dictionary_text',
+            field=models.CharField(blank=True, max_length=256, verbose_name='Слово в словаре skyeng'),
+        ),
+        migrations.AddField(
+            model_name='word',
+            name='image_url',
+            field=models.URLField(blank=True, max_length=500, verbose_name='Картинка'),
+        ),
+        migrations.AddField(
+            model_name='word',
+            name='sound_url',
+            field=models.URLField(blank=True, max_length=500, verbose_name='Произношение'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:41
+
+from django.db import migrations
+
+# Триггеры для app.state_cache: после commit-а любого изменения состояния пользователя
+# (бот, админка, telegram_tasks, bulk update) в канал user_state уходит
+# "<pid процесса postgres>:<user_id>,<user_id>,..." ('*' - изменилось общее слово).
+# Триггеры на весь запрос (transition tables), чтобы bulk update давал несколько уведомлений,
+# а не по одному на строку; в уведомлении до 500 id (лимит payload - 8000 байт).
+
+NOTIFY_FUNCTION = '''
+CREATE FUNCTION app_notify_user_state() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    payload text;
+BEGIN
+    FOR payload IN EXECUTE format(
+        'SELECT pg_backend_pid() || '':'' || string_agg(user_id, '','') FROM ('
+        '    SELECT user_id, (dense_rank() OVER (ORDER BY user_id) - 1) / 500 AS chunk'
+        '    FROM (SELECT DISTINCT user_id FROM (%s) AS changed_users) AS users'
+        ') AS chunks GROUP BY chunk',
+        TG_ARGV[0]
+    ) LOOP
+        PERFORM pg_notify('user_state', payload);
+    END LOOP;
+    RETURN NULL;
+END
+$$;
+'''
+
+# таблица -> запрос, который возвращает колонку user_id (text) по измененным строкам changed_rows
+USERS_QUERIES = {
+    'app_user': 'SELECT id::text AS user_id FROM changed_rows',
+    'app_learningstatus': 'SELECT user_id::text FROM changed_rows',
+    'app_wordstatus': 'SELECT user_id::text FROM changed_rows',
+    'app_learningstatus_repeat_words': (
+        'SELECT s.user_id::text FROM changed_rows r '
+        'JOIN app_learningstatus s ON s.id = r.learningstatus_id'
+    ),
+}
+# слова кэшируются как learn_word и repeat_words: важны только изменения текста
+WORD_USERS_QUERY = (
+    "SELECT COALESCE(n.user_id::text, '*') AS user_id "
+    'FROM changed_rows n JOIN old_rows o ON o.id = n.id '
+    'WHERE (n.text, n.translate, n.phrase) IS DISTINCT FROM (o.text, o.translate, o.phrase)'
+)
+
+TRANSITION_TABLES = {
+    'INSERT': 'NEW TABLE AS changed_rows',
+    'UPDATE': 'NEW TABLE AS changed_rows OLD TABLE AS old_rows',
+    'DELETE': 'OLD TABLE AS changed_rows',
+}
+
+
+def create_trigger(table, event, users_query):
+    users_query = users_query.replace("'", "''")
+    return (
+        f'CREATE TRIGGER {table}_{event.lower()}_notify_user_state '
+        f'AFTER {event} ON {table} REFERENCING {TRANSITION_TABLES[event]} '
+        f"FOR EACH STATEMENT EXECUTE PROCEDURE app_notify_user_state('{users_query}');"
+    )
+
+
+def drop_trigger(table, event):
+    return f'DROP TRIGGER {table}_{event.lower()}_notify_user_state ON {table};'
+
+
+TRIGGERS = [
+    (table, event, users_query)
+    for table, users_query in USERS_QUERIES.items()
+    for event in TRANSITION_TABLES
+] + [('app_word', 'UPDATE', WORD_USERS_QUERY)]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_auto_20261018_0926'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[NOTIFY_FUNCTION] + [create_trigger(*trigger) for trigger in TRIGGERS],
+            reverse_sql=[drop_trigger(table, event) for table, event, _ in TRIGGERS] + [
+                'DROP FUNCTION app_notify_user_state();',
+            ],
+        ),
+    ]
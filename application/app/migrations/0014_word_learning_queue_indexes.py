@@ -0,0 +1,41 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:44
+
+from django.db import migrations, models
+
+# индексы строятся CONCURRENTLY: таблица слов большая, запись в нее не блокируется
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('app', '0013_user_state_notify'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS "app_word_user_id_id_idx" '
+                        'ON "app_word" ("user_id", "id");',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "app_word_user_id_id_idx";',
+                ),
+                migrations.RunSQL(
+                    sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS "app_word_general_id_idx" '
+                        'ON "app_word" ("id") WHERE "user_id" IS NULL;',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "app_word_general_id_idx";',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='word',
+                    index=models.Index(fields=['user', 'id'], name='app_word_user_id_id_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='word',
+                    index=models.Index(condition=models.Q(user=None), fields=['id'],
+                                       name='app_word_general_id_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.10 on 2026-10-18 12:05
+
+from django.db import migrations
+
+# Удаление слова уведомляет app.state_cache так же, как изменение (см. 0013_user_state_notify):
+# '*' - удалили общее слово, процессы бота перезагрузят и каталог общих слов (app.word_catalog)
+
+CREATE_TRIGGER = '''
+CREATE TRIGGER app_word_delete_notify_user_state
+AFTER DELETE ON app_word REFERENCING OLD TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE PROCEDURE app_notify_user_state(
+    'SELECT COALESCE(user_id::text, ''*'') AS user_id FROM changed_rows'
+);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_word_learning_queue_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_TRIGGER,
+            reverse_sql='DROP TRIGGER app_word_delete_notify_user_state ON app_word;',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.10 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+# индекс строится CONCURRENTLY: запись в таблицу статусов слов не блокируется
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('app', '0015_word_delete_notify'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS "app_wordstatus_user_repeat_idx" '
+                        'ON "app_wordstatus" ("user_id", "start_repetition_time");',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS '
+                                '"app_wordstatus_user_repeat_idx";',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='wordstatus',
+                    index=models.Index(fields=['user', 'start_repetition_time'],
+                                       name='app_wordstatus_user_repeat_idx'),
+                ),
+            ],
+        ),
+    ]
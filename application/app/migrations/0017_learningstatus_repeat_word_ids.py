@@ -0,0 +1,63 @@
+# Generated by Django 2.2.10 on 2026-10-18 13:40
+
+import importlib
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+# Слова для повторения: вместо M2M repeat_words - отсортированный массив id WordStatus.
+# Текущие сессии повторения переносятся в массив (и обратно при откате миграции).
+
+user_state_notify = importlib.import_module('app.migrations.0013_user_state_notify')
+
+COPY_TO_ARRAY = '''
+UPDATE app_learningstatus s SET repeat_word_ids = m.ids
+FROM (
+    SELECT learningstatus_id, array_agg(wordstatus_id ORDER BY wordstatus_id) AS ids
+    FROM app_learningstatus_repeat_words
+    GROUP BY learningstatus_id
+) AS m
+WHERE m.learningstatus_id = s.id;
+'''
+
+COPY_TO_TABLE = '''
+INSERT INTO app_learningstatus_repeat_words (learningstatus_id, wordstatus_id)
+SELECT s.id, ws.id
+FROM app_learningstatus s, unnest(s.repeat_word_ids) AS ids(id)
+JOIN app_wordstatus ws ON ws.id = ids.id;
+'''
+
+THROUGH_TRIGGERS = [
+    trigger for trigger in user_state_notify.TRIGGERS
+    if trigger[0] == 'app_learningstatus_repeat_words'
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_wordstatus_user_repeat_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='learningstatus',
+            name='repeat_word_ids',
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.IntegerField(), blank=True, default=list, size=None,
+                help_text='id WordStatus по возрастанию, repetition_word_status - текущее слово',
+                verbose_name='Слова для повторения',
+            ),
+        ),
+        migrations.RunSQL(
+            sql=COPY_TO_ARRAY,
+            # таблица M2M уже создана обратно (RemoveField), а ее триггеры app 0013 - нет
+            reverse_sql=[COPY_TO_TABLE] + [
+                user_state_notify.create_trigger(*trigger) for trigger in THROUGH_TRIGGERS
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='learningstatus',
+            name='repeat_words',
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.10 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+# Ближайшее время повторения слов пользователя: notify_repetition выбирает по индексу
+# только тех, кому пора повторять, вместо join всех WordStatus при каждом запуске.
+
+FILL_NEXT_REPETITION_TIME = '''
+UPDATE app_learningstatus s SET next_repetition_time = w.next_repetition_time
+FROM (
+    SELECT user_id, min(start_repetition_time) AS next_repetition_time
+    FROM app_wordstatus
+    GROUP BY user_id
+) AS w
+WHERE w.user_id = s.user_id AND w.next_repetition_time IS NOT NULL;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_learningstatus_repeat_word_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='learningstatus',
+            name='next_repetition_time',
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name='Когда пора повторять слова',
+                help_text='Ближайшее start_repetition_time слов пользователя, обновляется ботом',
+            ),
+        ),
+        migrations.RunSQL(
+            sql=FILL_NEXT_REPETITION_TIME,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='learningstatus',
+            index=models.Index(
+                condition=models.Q(repetition_notified__isnull=True),
+                fields=['next_repetition_time'], name='app_learningstatus_due_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.10 on 2026-10-18 15:30
+
+import datetime
+
+from django.db import migrations, models
+
+import app.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_learningstatus_next_repetition_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='timezone',
+            field=models.CharField(
+                default='Europe/Moscow', help_text='Например, Europe/Moscow', max_length=64,
+                validators=[app.utils.validate_timezone], verbose_name='Часовой пояс',
+            ),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='quiet_hours_start',
+            field=models.TimeField(default=datetime.time(23, 0), verbose_name='Не оповещать с'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='quiet_hours_end',
+            field=models.TimeField(
+                default=datetime.time(10, 0), verbose_name='Не оповещать до',
+                help_text='Если равно началу, оповещать в любое время',
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.10 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+# Состояние слов для алгоритмов повторения (app.scheduling). Время последнего повторения
+# слов, которые ждут повторения, восстанавливается по лестнице REPETITION_TIMES:
+# по нему WordStatus.reschedule переносит слова при смене алгоритма.
+
+FILL_LAST_REPETITION_TIME = '''
+UPDATE app_wordstatus SET last_repetition_time = start_repetition_time - CASE count_repetitions
+    WHEN 1 THEN interval '1 hour'
+    WHEN 2 THEN interval '6 hours'
+    WHEN 3 THEN interval '1 day'
+    WHEN 4 THEN interval '3 days'
+END
+WHERE start_repetition_time IS NOT NULL AND count_repetitions BETWEEN 1 AND 4;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_user_notification_settings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='repetition_algorithm',
+            field=models.CharField(
+                choices=[('fixed', 'по расписанию'), ('sm2', 'SuperMemo 2'), ('fsrs', 'FSRS')],
+                default='fixed', max_length=10, verbose_name='Алгоритм повторения слов',
+            ),
+        ),
+        migrations.AddField(
+            model_name='wordstatus',
+            name='difficulty',
+            field=models.FloatField(default=0, verbose_name='Сложность FSRS'),
+        ),
+        migrations.AddField(
+            model_name='wordstatus',
+            name='ease_factor',
+            field=models.FloatField(default=2.5, verbose_name='Фактор легкости SM-2'),
+        ),
+        migrations.AddField(
+            model_name='wordstatus',
+            name='last_repetition_time',
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name='Время последнего повторения',
+            ),
+        ),
+        migrations.AddField(
+            model_name='wordstatus',
+            name='repetition_mistakes',
+            field=models.IntegerField(default=0, verbose_name='Ошибок в текущем повторении'),
+        ),
+        migrations.AddField(
+            model_name='wordstatus',
+            name='stability',
+            field=models.FloatField(
+                default=0, verbose_name='Стабильность, дней',
+                help_text='Последний интервал SM-2 или стабильность FSRS, 0 - слово еще не повторяли',
+            ),
+        ),
+        migrations.RunSQL(
+            sql=FILL_LAST_REPETITION_TIME,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
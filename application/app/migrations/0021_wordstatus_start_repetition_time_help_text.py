@@ -0,0 +1,21 @@
+# Generated by Django 2.2.10 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+# help_text поля добавили в модель без миграции (после 0010), и makemigrations
+# подхватывал его в следующую миграцию. Меняется только состояние моделей, схема БД - нет.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_repetition_scheduler'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wordstatus',
+            name='start_repetition_time',
+            field=models.DateTimeField(blank=True, help_text='Если стоит None -> слово уже повторили', null=True, verbose_name='Время когда нужно будет повторить слово'),
+        ),
+    ]
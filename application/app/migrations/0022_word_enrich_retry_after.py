@@ -0,0 +1,18 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_wordstatus_start_repetition_time_help_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='word',
+            name='enrich_retry_after',
+            field=models.DateTimeField(blank=True, help_text='Слово не нашлось: manage.py enrich_words поищет его снова после этого времени', null=True, verbose_name='Когда снова искать слово в словаре'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+# LearningStatus.next_repetition_time = min(start_repetition_time) слов пользователя
+# поддерживает триггер на app_wordstatus: любое изменение слов (бот, админка, reschedule_words,
+# удаление слова или пользователя) пересчитывает его только для затронутых пользователей.
+# Триггеры на весь запрос (transition tables), как в 0013_user_state_notify.
+
+UPDATE_FUNCTION = '''
+CREATE FUNCTION app_update_next_repetition_time() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    EXECUTE format(
+        'UPDATE app_learningstatus AS status SET next_repetition_time = next.repetition_time'
+        ' FROM ('
+        '    SELECT users.user_id, ('
+        '        SELECT min(start_repetition_time) FROM app_wordstatus'
+        '        WHERE user_id = users.user_id'
+        '    ) AS repetition_time'
+        '    FROM (SELECT DISTINCT user_id FROM (%s) AS changed_users) AS users'
+        ' ) AS next'
+        ' WHERE status.user_id = next.user_id'
+        '    AND status.next_repetition_time IS DISTINCT FROM next.repetition_time',
+        TG_ARGV[0]
+    );
+    RETURN NULL;
+END
+$$;
+'''
+
+# событие -> (transition tables, запрос пользователей, у которых изменились слова для повторения)
+TRIGGERS = {
+    'INSERT': (
+        'NEW TABLE AS new_rows',
+        'SELECT user_id FROM new_rows WHERE start_repetition_time IS NOT NULL',
+    ),
+    'UPDATE': (
+        'NEW TABLE AS new_rows OLD TABLE AS old_rows',
+        'SELECT unnest(ARRAY[n.user_id, o.user_id]) AS user_id '
+        'FROM new_rows n JOIN old_rows o ON o.id = n.id '
+        'WHERE (n.start_repetition_time, n.user_id) '
+        'IS DISTINCT FROM (o.start_repetition_time, o.user_id)',
+    ),
+    'DELETE': (
+        'OLD TABLE AS old_rows',
+        'SELECT user_id FROM old_rows WHERE start_repetition_time IS NOT NULL',
+    ),
+}
+
+
+def create_trigger(event, transition_tables, users_query):
+    users_query = users_query.replace("'", "''")
+    return (
+        f'CREATE TRIGGER app_wordstatus_{event.lower()}_next_repetition_time '
+        f'AFTER {event} ON app_wordstatus REFERENCING {transition_tables} '
+        f"FOR EACH STATEMENT EXECUTE PROCEDURE app_update_next_repetition_time('{users_query}');"
+    )
+
+
+def drop_trigger(event):
+    return f'DROP TRIGGER app_wordstatus_{event.lower()}_next_repetition_time ON app_wordstatus;'
+
+
+# значения, которые бот мог не обновить (админка, удаление слов)
+FILL_NEXT_REPETITION_TIME = '''
+UPDATE app_learningstatus AS status SET next_repetition_time = (
+    SELECT min(start_repetition_time) FROM app_wordstatus WHERE user_id = status.user_id
+);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_word_enrich_retry_after'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[UPDATE_FUNCTION] + [
+                create_trigger(event, *trigger) for event, trigger in TRIGGERS.items()
+            ],
+            reverse_sql=[drop_trigger(event) for event in TRIGGERS] + [
+                'DROP FUNCTION app_update_next_repetition_time();',
+            ],
+        ),
+        migrations.RunSQL(
+            sql=FILL_NEXT_REPETITION_TIME,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='learningstatus',
+            name='next_repetition_time',
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name='Когда пора повторять слова',
+                help_text='Ближайшее start_repetition_time слов пользователя, '
+                          'обновляется триггером на app_wordstatus',
+            ),
+        ),
+    ]
@@ -1,17 +1,20 @@
+import bisect
+import datetime
 import logging
 import random
 import typing
 import uuid
 
 import enchant
+import numpy as np
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.db import connection, models
 from django.db.transaction import atomic
 from django.utils.functional import cached_property
 
-from app.utils import get_datetime_now, safe_str
-from clients.base import ClientException
-from clients.skyeng import SkyengClient
+from app import scheduling
+from app.utils import get_datetime_now, validate_timezone
 from clients.skyeng import schemas as skyeng_schemas
 
 logger = logging.getLogger(__name__)
@@ -55,16 +58,54 @@ class User(CreatedUpdateBaseModel):
     )
     auth_token = models.UUIDField(null=True)
 
+    # оповещения (telegram.tasks) не отправляются в тихие часы по времени пользователя
+    timezone = models.CharField(
+        max_length=64, default=settings.DEFAULT_TIMEZONE, validators=[validate_timezone],
+        verbose_name='Часовой пояс', help_text='Например, Europe/Moscow',
+    )
+    quiet_hours_start = models.TimeField(
+        default=datetime.time(23), verbose_name='Не оповещать с',
+    )
+    quiet_hours_end = models.TimeField(
+        default=datetime.time(10), verbose_name='Не оповещать до',
+        help_text='Если равно началу, оповещать в любое время',
+    )
+    repetition_algorithm = models.CharField(
+        max_length=10, choices=scheduling.CHOICES, default=scheduling.FIXED,
+        verbose_name='Алгоритм повторения слов',
+    )
+
     def __str__(self):
         return self.username
 
+    def update_notification_settings(self, **values):
+        """ timezone, quiet_hours_start, quiet_hours_end """
+        for name, value in values.items():
+            setattr(self, name, value)
+        self.save(update_fields=tuple(values))
+
+        from app.state_cache import state_cache  # app.state_cache импортирует модели
+        state_cache.write_through(self, self.__dict__.get('learning_status'))
+
+    @atomic
+    def set_repetition_algorithm(self, algorithm: str):
+        """ Слова, которые ждут повторения, сразу переносятся по новому алгоритму """
+        self.repetition_algorithm = algorithm
+        self.save(update_fields=('repetition_algorithm',))
+        for _ in WordStatus.reschedule(user_id=self.id):
+            pass
+
+        # next_repetition_time изменен триггером
+        from app.state_cache import state_cache  # app.state_cache импортирует модели
+        state_cache.invalidate(self.id)
+        self.__dict__.pop('learning_status', None)
+
     @cached_property
     def learning_status(self) -> 'LearningStatus':
         status = (
             LearningStatus.objects
             .filter(user_id=self.id)
-            .prefetch_related('repeat_words')
-            .select_related('repetition_word_status', 'learn_word')
+            .select_related('repetition_word_status__word', 'learn_word')
             .first()
         )
         if not status:
@@ -74,10 +115,16 @@ class User(CreatedUpdateBaseModel):
     @atomic
     def update_status(self, new_status):
         logger.debug('User=%s update status from %s - %s', self.id, self.status, new_status)
+        if self.status == self.Status.LEARNING and new_status != self.Status.LEARNING:
+            from app.prefetch import prefetcher  # app.prefetch импортирует модели
+            prefetcher.cancel(self.id)
         self.perform_last_status_actions(old_status=self.status, new_status=new_status)
         self.status = new_status
         self.save(update_fields=('status',))
 
+        from app.state_cache import state_cache  # app.state_cache импортирует модели
+        state_cache.write_through(self, self.__dict__.get('learning_status'))
+
     def perform_last_status_actions(self, old_status, new_status):
         old_status = self.Status.REPETITION
         if old_status == self.Status.REPETITION:
@@ -106,6 +153,37 @@ class User(CreatedUpdateBaseModel):
         self.save(update_fields=('auth_token', 'auth_code'))
 
 
+class LocalTime(models.Func):
+    """ Время now в часовом поясе из колонки: (now AT TIME ZONE timezone)::time """
+    arg_joiner = ' AT TIME ZONE '
+    template = '(%(expressions)s)::time'
+    output_field = models.TimeField()
+
+
+def filter_notifiable(queryset: models.QuerySet, now: datetime.datetime,
+                      user_field: str = '') -> models.QuerySet:
+    """
+    Пользователи, у которых в момент now не тихие часы: условие в самом запросе
+    (часовой пояс у каждого свой), user_field - путь до User, например 'user__'
+    """
+    start = models.F(f'{user_field}quiet_hours_start')
+    end = models.F(f'{user_field}quiet_hours_end')
+    local_time = 'notify_local_time'
+    # тихие часы внутри дня (13:00-15:00): оповещать до начала или после конца
+    in_day = models.Q(**{f'{user_field}quiet_hours_start__lte': end}) & (
+        models.Q(**{f'{local_time}__lt': start}) | models.Q(**{f'{local_time}__gte': end})
+    )
+    # через полночь (23:00-10:00): оповещать между концом и началом
+    over_midnight = models.Q(**{
+        f'{user_field}quiet_hours_start__gt': end,
+        f'{local_time}__gte': end,
+        f'{local_time}__lt': start,
+    })
+    return queryset.annotate(**{
+        local_time: LocalTime(models.Value(now), models.F(f'{user_field}timezone')),
+    }).filter(in_day | over_midnight)
+
+
 class Word(CreatedUpdateBaseModel):
     text = models.CharField(max_length=256)
     translate = models.CharField(max_length=256)
@@ -114,6 +192,28 @@ class Word(CreatedUpdateBaseModel):
     phrase = models.CharField(max_length=256, verbose_name='Текст для лучшего запоминания',
                               blank=True)
 
+    # данные из словаря skyeng, заполняет app.dictionary.enrich_word
+    dictionary_text = models.CharField(max_length=256, blank=True,
+                                       verbose_name='Слово в словаре skyeng')
+    sound_url = models.URLField(max_length=500, blank=True, verbose_name='Произношение')
+    image_url = models.URLField(max_length=500, blank=True, verbose_name='Картинка')
+    date_enriched = models.DateTimeField(
+        null=True, blank=True, verbose_name='Когда искали слово в словаре',
+        help_text='Если стоит None -> слово еще не искали',
+    )
+    enrich_retry_after = models.DateTimeField(
+        null=True, blank=True, verbose_name='Когда снова искать слово в словаре',
+        help_text='Слово не нашлось: manage.py enrich_words поищет его снова после этого времени',
+    )
+
+    class Meta:
+        indexes = [
+            # очередь изучения (app.learning_queue): слова пользователя, затем общие слова
+            models.Index(fields=['user', 'id'], name='app_word_user_id_id_idx'),
+            models.Index(fields=['id'], name='app_word_general_id_idx',
+                         condition=models.Q(user=None)),
+        ]
+
     def __str__(self):
         return f'{self.text} - {self.translate}'
 
@@ -131,21 +231,20 @@ class Word(CreatedUpdateBaseModel):
         phrase = self.phrase.replace('*', ' ').replace('_', ' ')
         return text + f'\n_* {phrase} *_'  # set italic phrase
 
-    def find_word_in_skyeng_dict(self) -> typing.Optional[skyeng_schemas.Word]:
-        eng_word = None
+    def get_english_word(self) -> typing.Optional[str]:
         if settings.LANG_DICT['en'].check(self.text):
-            eng_word = self.text
-        elif settings.LANG_DICT['en'].check(self.translate):
-            eng_word = self.translate
+            return self.text
+        if settings.LANG_DICT['en'].check(self.translate):
+            return self.translate
+        return None
+
+    def find_word_in_skyeng_dict(self) -> typing.Optional[skyeng_schemas.Word]:
+        eng_word = self.get_english_word()
         if not eng_word:
             return None
 
-        eng_word: typing.cast(str, eng_word)
-        try:
-            eng_word_meaning = SkyengClient().search_word_meanings(eng_word)
-        except ClientException:
-            return None
-        return eng_word_meaning.get_first_word_with_sound()
+        from app.dictionary import cache  # app.dictionary импортирует модели
+        return cache.find_word(eng_word)
 
 
 class WordStatus(CreatedUpdateBaseModel):
@@ -159,38 +258,132 @@ class WordStatus(CreatedUpdateBaseModel):
     count_repetitions = models.IntegerField(default=0, verbose_name='Количество повторений слова')
     number_not_guess = models.IntegerField(default=0, verbose_name='Сколько раз не угадал слово')
 
+    # состояние для алгоритма повторения пользователя (app.scheduling)
+    last_repetition_time = models.DateTimeField(
+        null=True, blank=True, verbose_name='Время последнего повторения',
+    )
+    repetition_mistakes = models.IntegerField(default=0, verbose_name='Ошибок в текущем повторении')
+    stability = models.FloatField(
+        default=0, verbose_name='Стабильность, дней',
+        help_text='Последний интервал SM-2 или стабильность FSRS, 0 - слово еще не повторяли',
+    )
+    difficulty = models.FloatField(default=0, verbose_name='Сложность FSRS')
+    ease_factor = models.FloatField(default=2.5, verbose_name='Фактор легкости SM-2')
+
     class Meta:
         verbose_name = 'Статус изучения слова'
         ordering = ('id',)
         unique_together = ('user', 'word')
+        indexes = [
+            # слова, которые пора повторять (LearningStatus.add_words_for_repetition)
+            models.Index(fields=['user', 'start_repetition_time'],
+                         name='app_wordstatus_user_repeat_idx'),
+        ]
 
     def __str__(self):
         return f'WordStatus "{self.word}", user={self.user}'
 
     def increase_not_guess(self):
         self.number_not_guess += 1
-        self.save(update_fields=('number_not_guess',))
+        self.repetition_mistakes += 1
+        self.save(update_fields=('number_not_guess', 'repetition_mistakes'))
 
     def set_next_repetition_time(self, from_time):
-        self.count_repetitions += 1
-
-        next_repetition_time = settings.REPETITION_TIMES.get(self.count_repetitions)
-        if next_repetition_time:
-            self.start_repetition_time = from_time + next_repetition_time
-        else:
-            self.stop_learning(save=False)
-        self.save(update_fields=('count_repetitions', 'start_repetition_time'))
+        self.set_next_repetition_times([self.id], from_time)
+
+    @classmethod
+    def _format_query(cls, query: str, **kwargs) -> str:
+        return query.format(
+            word_status=connection.ops.quote_name(cls._meta.db_table),
+            user=connection.ops.quote_name(User._meta.db_table),
+            status=connection.ops.quote_name(LearningStatus._meta.db_table),
+            **kwargs,
+        )
 
-        logger.debug(
-            'WordStatus %d %s update count_repetitions=%d time=%s',
-            self.user_id, safe_str(str(self.word)),
-            self.count_repetitions, self.start_repetition_time,
+    @classmethod
+    def set_next_repetition_times(cls, word_status_ids: typing.List[int], from_time):
+        """
+        Следующее повторение для повторенных слов по алгоритму пользователя:
+        интервалы всех слов считаются массивами numpy, сохраняются одним UPDATE
+        """
+        if not word_status_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(cls._format_query(REVIEW_WORDS_SELECT_QUERY),
+                           {'ids': word_status_ids, 'from_time': from_time})
+            groups = scheduling.split_rows(cursor.fetchall())
+            for algorithm, (ids, mistakes, elapsed, *state) in groups.items():
+                scheduler = scheduling.get_scheduler(algorithm)
+                words = scheduler.review(
+                    scheduling.Words.from_columns(state), mistakes.astype(int),
+                    elapsed / scheduling.DAY,
+                )
+                cursor.execute(cls._format_query(REVIEW_WORDS_UPDATE_QUERY), {
+                    'ids': ids.astype(int).tolist(),
+                    'count_repetitions': words.count_repetitions.tolist(),
+                    'stability': words.stability.tolist(),
+                    'difficulty': words.difficulty.tolist(),
+                    'ease_factor': words.ease_factor.tolist(),
+                    'intervals': scheduling.get_intervals(scheduler, words).tolist(),
+                    'from_time': from_time,
+                })
+
+        logger.debug('WordStatus update next repetition time: ids=%s', word_status_ids)
+
+    @classmethod
+    def reschedule(cls, user_id: int = None, last_id: int = 0,
+                   chunk_size: int = 10000) -> typing.Iterator[typing.Tuple[int, int, int]]:
+        """
+        Переносит слова, которые ждут повторения, по текущему алгоритму пользователя
+        и настройкам (REPETITION_TIMES, REPETITION_DESIRED_RETENTION): от last_repetition_time.
+        Слова читаются частями по chunk_size (keyset по id), каждая часть - в своей транзакции:
+        интервалы части считаются массивами numpy, сохраняются одним UPDATE
+        только изменившиеся слова (next_repetition_time их пользователей пересчитает триггер).
+        Выдает (последний id части, слов в части, перенесено)
+        """
+        select_query = cls._format_query(
+            RESCHEDULE_WORDS_SELECT_QUERY,
+            user_filter='AND word_status.user_id = %(user_id)s' if user_id else '',
         )
+        while True:
+            with atomic(), connection.cursor() as cursor:
+                cursor.execute(select_query,
+                               {'last_id': last_id, 'user_id': user_id, 'limit': chunk_size})
+                rows = cursor.fetchall()
+                if not rows:
+                    return
+
+                now = get_datetime_now()
+                user_ids = []
+                groups = scheduling.split_rows(rows)
+                for algorithm, (ids, last_times, start_times, *state) in groups.items():
+                    scheduler = scheduling.get_scheduler(algorithm)
+                    words = scheduling.Words.from_columns(state)
+                    intervals = scheduling.get_intervals(scheduler, words)
+                    # сохраняются только слова, у которых повторение сдвинулось больше чем на 1мс
+                    changed = scheduler.has_state(words) & ~(
+                        np.abs(last_times + intervals * scheduling.DAY - start_times) < 0.001
+                    )
+                    if not changed.any():
+                        continue
+                    cursor.execute(cls._format_query(RESCHEDULE_WORDS_UPDATE_QUERY), {
+                        'ids': ids[changed].astype(int).tolist(),
+                        'intervals': intervals[changed].tolist(),
+                        # диапазон части: UPDATE по первичному ключу, а не по всей таблице
+                        'first_id': rows[0][1], 'last_id': rows[-1][1],
+                        'now': now,
+                    })
+                    user_ids.extend(changed_user_id for changed_user_id, in cursor.fetchall())
+            last_id = rows[-1][1]
+            yield last_id, len(rows), len(user_ids)
 
     def stop_learning(self, save=True):
         self.start_repetition_time = None
         if save:
             self.save(update_fields=('start_repetition_time', ))
+            # next_repetition_time пользователя изменен триггером: снимок в кэше устарел
+            from app.state_cache import state_cache  # app.state_cache импортирует модели
+            state_cache.invalidate(self.user_id)
 
     @property
     def is_conversely(self):
@@ -212,9 +405,78 @@ class WordStatus(CreatedUpdateBaseModel):
         return self.word.translate if self.is_conversely else self.word.text
 
 
+ADD_WORDS_FOR_REPETITION_QUERY = '''
+UPDATE {status} SET date_updated = %(now)s, repeat_word_ids = ARRAY(
+    SELECT unnest(repeat_word_ids)
+    UNION
+    SELECT id FROM {word_status}
+    WHERE user_id = %(user_id)s AND start_repetition_time < %(now)s
+    ORDER BY 1
+)
+WHERE id = %(learning_status_id)s AND EXISTS (
+    SELECT 1 FROM {word_status}
+    WHERE user_id = %(user_id)s AND start_repetition_time < %(now)s
+        AND id <> ALL (repeat_word_ids)
+)
+RETURNING repeat_word_ids
+'''
+
+# состояние слов для app.scheduling: алгоритм пользователя, затем числа
+# (date_part - double precision, extract в Postgres 14+ возвращает медленный numeric)
+REVIEW_WORDS_SELECT_QUERY = '''
+SELECT {user}.repetition_algorithm, word_status.id, word_status.repetition_mistakes,
+    date_part('epoch', %(from_time)s - coalesce(word_status.last_repetition_time,
+                                                word_status.date_created)),
+    word_status.count_repetitions, word_status.stability, word_status.difficulty,
+    word_status.ease_factor
+FROM {word_status} AS word_status JOIN {user} ON {user}.id = word_status.user_id
+WHERE word_status.id = ANY(%(ids)s)
+'''
+
+# интервал NaN - слово больше не повторять
+REVIEW_WORDS_UPDATE_QUERY = '''
+UPDATE {word_status} AS word_status SET
+    count_repetitions = new.count_repetitions, stability = new.stability,
+    difficulty = new.difficulty, ease_factor = new.ease_factor, repetition_mistakes = 0,
+    last_repetition_time = %(from_time)s, date_updated = %(from_time)s,
+    start_repetition_time = %(from_time)s + NULLIF(new.interval, 'NaN') * interval '1 day'
+FROM unnest(
+    %(ids)s::integer[], %(count_repetitions)s::integer[], %(stability)s::float8[],
+    %(difficulty)s::float8[], %(ease_factor)s::float8[], %(intervals)s::float8[]
+) AS new(id, count_repetitions, stability, difficulty, ease_factor, interval)
+WHERE word_status.id = new.id AND word_status.id = ANY(%(ids)s)
+'''
+
+RESCHEDULE_WORDS_SELECT_QUERY = '''
+SELECT {user}.repetition_algorithm, word_status.id,
+    date_part('epoch', word_status.last_repetition_time),
+    date_part('epoch', word_status.start_repetition_time),
+    word_status.count_repetitions, word_status.stability, word_status.difficulty,
+    word_status.ease_factor
+FROM {word_status} AS word_status JOIN {user} ON {user}.id = word_status.user_id
+WHERE word_status.id > %(last_id)s {user_filter}
+    AND word_status.start_repetition_time IS NOT NULL
+    AND word_status.last_repetition_time IS NOT NULL
+ORDER BY word_status.id
+LIMIT %(limit)s
+'''
+
+RESCHEDULE_WORDS_UPDATE_QUERY = '''
+UPDATE {word_status} AS word_status SET date_updated = %(now)s,
+    start_repetition_time = last_repetition_time + NULLIF(new.interval, 'NaN') * interval '1 day'
+FROM unnest(%(ids)s::integer[], %(intervals)s::float8[]) AS new(id, interval)
+WHERE word_status.id = new.id AND word_status.id BETWEEN %(first_id)s AND %(last_id)s
+RETURNING word_status.user_id
+'''
+
+
 class LearningStatus(CreatedUpdateBaseModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    repeat_words = models.ManyToManyField(WordStatus, blank=True, null=True)
+    repeat_word_ids = ArrayField(
+        models.IntegerField(), default=list, blank=True,
+        verbose_name='Слова для повторения',
+        help_text='id WordStatus по возрастанию, repetition_word_status - текущее слово',
+    )
     count_words = models.IntegerField(
         default=5, verbose_name='Количество слов, которые пользователь будет учить за раз')
     repetition_word_status = models.ForeignKey(
@@ -229,32 +491,52 @@ class LearningStatus(CreatedUpdateBaseModel):
     repetition_notified = models.DateTimeField(
         null=True, verbose_name='Когда оповещали о повторении слов',
     )  # TODO rename to repetition_notified_time
+    next_repetition_time = models.DateTimeField(
+        null=True, blank=True, verbose_name='Когда пора повторять слова',
+        help_text='Ближайшее start_repetition_time слов пользователя, '
+                  'обновляется триггером на app_wordstatus',
+    )
 
     class Meta:
         verbose_name = 'Статус пользователя повторения/изучения слов'
+        indexes = [
+            # пользователи, которым пора напомнить о повторении (telegram.tasks.notify_repetition)
+            models.Index(fields=['next_repetition_time'], name='app_learningstatus_due_idx',
+                         condition=models.Q(repetition_notified__isnull=True)),
+        ]
 
     def __str__(self):
         return self.user.username + ' learning_status'
 
-    def set_repetition_word_status_id(self, word_status_id):
+    def set_repetition_word_status(self, word_status: typing.Optional[WordStatus]):
         logger.debug(
             'LearningStatus update: user=%s next repetition_word_status_id=%s',
-            self.user_id, word_status_id,
+            self.user_id, word_status and word_status.id,
         )
-        self.repetition_word_status_id = word_status_id
+        self.repetition_word_status = word_status
         self.save(update_fields=('repetition_word_status_id',))
+        self.write_through_state()
+
+    @cached_property
+    def learning_queue(self):
+        from app.learning_queue import LearningQueue  # app.learning_queue импортирует модели
+        return LearningQueue(self)
 
     @property
     def next_learn_word(self) -> typing.Optional[Word]:
-        from_word_id = self.learn_word_id or 0
-
         # if user added words => return user word; else return general word
-        user_word = Word.objects.filter(user_id=self.user_id, id__gt=from_word_id).first()
-        if user_word:
-            return user_word
+        return self.learning_queue.next_word()
+
+    def get_upcoming_learn_words(self, count: int) -> typing.List[Word]:
+        """ Слова, которые по очереди вернет next_learn_word (начиная с текущего) """
+        return self.learning_queue.peek(count)
 
-        logger.debug('User=%s without words', self.user_id)
-        return Word.objects.filter(user=None, id__gt=from_word_id).first()
+    def add_repeat_word(self, word_status: WordStatus):
+        position = bisect.bisect_left(self.repeat_word_ids, word_status.id)
+        if self.repeat_word_ids[position:position + 1] == [word_status.id]:
+            return
+        self.repeat_word_ids.insert(position, word_status.id)
+        self.save(update_fields=('repeat_word_ids',))
 
     def get_next_repeat_word_status(self, start_repetition=False) -> typing.Optional[WordStatus]:
         """
@@ -266,16 +548,24 @@ class LearningStatus(CreatedUpdateBaseModel):
         if self.repetition_word_status_id and not start_repetition:
             repetition_word_status_id = self.repetition_word_status_id
 
-        # мы не фильтруем sql-ем т.k. это лишний запрос, а repeat_words.all() его не делает,
-        # если до этого был prefetch
-        next_repeat_words = filter(
-            lambda x: x.id > repetition_word_status_id, self.repeat_words.all(),
-        )
-        next_repeat_words = sorted(next_repeat_words, key=lambda x: x.id)
-        if next_repeat_words:
-            return next_repeat_words[0]
+        # repeat_word_ids отсортирован: следующее слово находим bisect-ом и загружаем только его
+        position = bisect.bisect_right(self.repeat_word_ids, repetition_word_status_id)
+        while position < len(self.repeat_word_ids):
+            word_status = self._get_repeat_word_status(self.repeat_word_ids[position])
+            if word_status is not None:
+                return word_status
+            position += 1  # WordStatus удалили вместе со словом
         return None
 
+    def _get_repeat_word_status(self, word_status_id: int) -> typing.Optional[WordStatus]:
+        # за одно обновление следующее слово ищется несколько раз: запоминаем загруженные
+        loaded = self.__dict__.setdefault('_repeat_word_statuses', {})
+        if word_status_id not in loaded:
+            loaded[word_status_id] = (
+                WordStatus.objects.select_related('word').filter(id=word_status_id).first()
+            )
+        return loaded[word_status_id]
+
     def set_next_learn_word(self):
         word = self.next_learn_word
         logger.debug(
@@ -286,6 +576,12 @@ class LearningStatus(CreatedUpdateBaseModel):
         self.learn_word_id = word.id
         self.learn_word = word
         self.save(update_fields=('learn_word_id',))
+        self.write_through_state()
+
+    def write_through_state(self):
+        """ Обновляет состояние пользователя в кэше процесса после commit-а """
+        from app.state_cache import state_cache  # app.state_cache импортирует модели
+        state_cache.write_through_learning_status(self)
 
     @property
     def is_words_were_repeated(self):
@@ -300,8 +596,10 @@ class LearningStatus(CreatedUpdateBaseModel):
         Устанавливаем следующее слово для повторения в None
         """
         self.update_repetition_time_for_repeated_words()
-        self.repeat_words.clear()
-        self.set_repetition_word_status_id(None)
+        self.repeat_word_ids = []
+        self.repetition_word_status = None
+        self.save(update_fields=('repeat_word_ids', 'repetition_word_status_id'))
+        self.write_through_state()
 
     def update_notification_time(self, time=None):
         logger.debug(
@@ -311,6 +609,18 @@ class LearningStatus(CreatedUpdateBaseModel):
         self.repetition_notified = time
         self.save(update_fields=('repetition_notified',))
 
+    def mark_notified(self, time) -> bool:
+        """
+        Отмечает оповещение о повторении, только если пользователя еще не оповестили:
+        False - его уже отметил другой процесс (см. telegram.tasks.notify_repetition)
+        """
+        is_marked = LearningStatus.objects.filter(
+            pk=self.pk, repetition_notified__isnull=True,
+        ).update(repetition_notified=time)
+        if is_marked:
+            self.repetition_notified = time
+        return bool(is_marked)
+
     @atomic()
     def update_repetition_time_for_repeated_words(self):
         if self.is_words_were_repeated:
@@ -320,12 +630,7 @@ class LearningStatus(CreatedUpdateBaseModel):
         else:
             next_repeat_id = 0
 
-        # делаем ручную фильтрацию вместо sql, т.k. до этого был выполнен prefetch_related,
-        # который вытащил все repeat_words
-        repeat_words = filter(lambda w: w.id < next_repeat_id, self.repeat_words.all())
-        now = get_datetime_now()
-        for word_status in repeat_words:
-            word_status.set_next_repetition_time(now)
+        self._set_next_repetition_times(next_repeat_id)
 
     @atomic()
     def update_repeated_words(self):
@@ -334,26 +639,51 @@ class LearningStatus(CreatedUpdateBaseModel):
         # значит устанавливаем float(inf) - бесконечно большое число
         next_repeat_id = next_repeat_word_status and next_repeat_word_status.id or float('Inf')
 
-        def check_words_were_repeated(w: WordStatus):
-            """
-            Проверка, что слово было повторено
-            id слова, которое нужно повторять больше id, повторенного слова
-            """
-            return next_repeat_id > w.id
-
-        # делаем ручную фильтрацию вместо sql, т.k. до этого был выполнен prefetch_related,
-        # который вытащил все repeat_words
-        repeat_words = filter(check_words_were_repeated, self.repeat_words.all())
-        now = get_datetime_now()
-        for word_status in repeat_words:
-            word_status.set_next_repetition_time(now)
+        self._set_next_repetition_times(next_repeat_id)
+
+    def _set_next_repetition_times(self, next_repeat_id):
+        """ Слова до next_repeat_id (id слова, которое нужно повторять) были повторены """
+        position = bisect.bisect_left(self.repeat_word_ids, next_repeat_id)
+        repeated_ids = self.repeat_word_ids[:position]
+        if repeated_ids:
+            WordStatus.set_next_repetition_times(repeated_ids, get_datetime_now())
+            self.refresh_next_repetition_time()
+
+    def refresh_next_repetition_time(self):
+        """ next_repetition_time пересчитал триггер (0023) после изменения слов пользователя """
+        self.next_repetition_time = (
+            LearningStatus.objects.filter(id=self.id)
+            .values_list('next_repetition_time', flat=True)
+            .first()
+        )
 
     def add_words_for_repetition(self):
-        repetition_words = (
-            WordStatus.objects
-            .filter(user=self.user, start_repetition_time__lt=get_datetime_now())
-            .exclude(id__in=[  # исключаем добавленные слова
-                status_word.id for status_word in self.user.learning_status.repeat_words.all()
-            ])
-        )
-        self.repeat_words.add(*repetition_words)
+        """ Добавляет в repeat_word_ids слова, которые пора повторять: один UPDATE """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                ADD_WORDS_FOR_REPETITION_QUERY.format(
+                    status=connection.ops.quote_name(self._meta.db_table),
+                    word_status=connection.ops.quote_name(WordStatus._meta.db_table),
+                ),
+                {'learning_status_id': self.id, 'user_id': self.user_id,
+                 'now': get_datetime_now()},
+            )
+            row = cursor.fetchone()
+        if row is not None:
+            self.repeat_word_ids = row[0]
+
+
+class DictionaryEntry(CreatedUpdateBaseModel):
+    """
+    Ответ словаря skyeng на поиск слова (см. app.dictionary)
+    """
+    word = models.CharField(max_length=256, unique=True, verbose_name='Слово в нижнем регистре')
+    data = models.TextField(verbose_name='Ответ словаря (json)')
+    has_sound = models.BooleanField(default=False, verbose_name='Нашлось слово с произношением')
+    expires_at = models.DateTimeField(verbose_name='Время, до которого ответ актуален')
+
+    class Meta:
+        verbose_name = 'Слово из словаря skyeng'
+
+    def __str__(self):
+        return f'DictionaryEntry {self.word}'
@@ -0,0 +1,140 @@
+"""
+Фоновая загрузка данных словаря для следующих слов, которые будет учить пользователь
+
+Пока пользователь учит слово, следующие SKYENG_PREFETCH_WORDS слов (см.
+LearningStatus.get_upcoming_learn_words) обогащаются данными словаря пулом потоков
+(app.dictionary.enrich_word), поэтому на "Учить"/"Пропустить" запроса в skyeng нет.
+
+Когда пользователь заканчивает учить слова, его незапущенные загрузки отменяются.
+
+В asyncio runtime бота (set_event_loop) слова загружают корутины event loop-а,
+не больше threads_count одновременно, а работу с БД выполняет run_orm.
+"""
+import asyncio
+import logging
+import threading
+import typing
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from app import metrics
+from app.dictionary import RunOrm, enrich_word, enrich_word_async
+from app.models import Word
+
+logger = logging.getLogger(__name__)
+
+
+class WordsPrefetcher:
+    def __init__(self, threads_count: int, max_pending: int):
+        self.threads_count = threads_count
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor = None
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._run_orm: typing.Optional[RunOrm] = None
+        self._semaphore: typing.Optional[asyncio.Semaphore] = None
+        self._user_futures: typing.Dict[int, typing.List[Future]] = {}
+        self._in_flight: typing.Set[int] = set()  # id слов, которые уже загружаются
+        self._counters = metrics.Counters('scheduled', 'cancelled', 'dropped', 'failed')
+
+    def set_event_loop(self, loop: typing.Optional[asyncio.AbstractEventLoop],
+                       run_orm: typing.Optional[RunOrm] = None):
+        """ Вызывается из event loop-а asyncio runtime-а при старте, None - при остановке """
+        with self._lock:
+            self._loop = loop
+            self._run_orm = run_orm
+            self._semaphore = asyncio.Semaphore(self.threads_count) if loop else None
+
+    def prefetch(self, user_id: int, words: typing.List[Word]):
+        """ Заменяет незапущенные загрузки пользователя на загрузку words """
+        self.cancel(user_id)
+        enriched_ids = self._get_enriched_ids(words)
+
+        with self._lock:
+            futures = []
+            for word in words:
+                if word.id in enriched_ids or word.id in self._in_flight:
+                    continue
+                if len(self._in_flight) >= self.max_pending:
+                    self._counters.incr('dropped')
+                    break
+                self._in_flight.add(word.id)
+                if self._loop:
+                    future = Future()
+                    asyncio.run_coroutine_threadsafe(
+                        self._fetch_async(future, word, self._semaphore, self._run_orm),
+                        self._loop,
+                    )
+                else:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(
+                            self.threads_count, thread_name_prefix='words-prefetch',
+                        )
+                    future = self._executor.submit(self._fetch, word)
+                future.add_done_callback(lambda _, word_id=word.id: self._on_done(word_id))
+                futures.append(future)
+            self._user_futures[user_id] = futures
+        self._counters.incr('scheduled', len(futures))
+
+    @staticmethod
+    def _get_enriched_ids(words: typing.List[Word]) -> typing.Set[int]:
+        # у общих слов из app.word_catalog date_enriched не загружен: проверяем их одним запросом
+        deferred_ids = [word.id for word in words if 'date_enriched' in word.get_deferred_fields()]
+        enriched_ids = {word.id for word in words
+                        if word.id not in deferred_ids and word.date_enriched is not None}
+        if deferred_ids:
+            enriched_ids.update(
+                Word.objects
+                .filter(id__in=deferred_ids)
+                .exclude(date_enriched=None)
+                .values_list('id', flat=True)
+            )
+        return enriched_ids
+
+    def cancel(self, user_id: int):
+        with self._lock:
+            futures = self._user_futures.pop(user_id, [])
+        cancelled = sum(future.cancel() for future in futures)
+        if cancelled:
+            self._counters.incr('cancelled', cancelled)
+
+    def _fetch(self, word: Word):
+        try:
+            enrich_word(word)
+        except Exception:
+            self._counters.incr('failed')
+            logger.exception('Fail prefetch word id=%s', word.id)
+        finally:
+            close_old_connections()
+
+    async def _fetch_async(self, future: Future, word: Word, semaphore: asyncio.Semaphore,
+                           run_orm: RunOrm):
+        async with semaphore:
+            # как у executor-а: отмененная до запуска загрузка не выполняется
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                await enrich_word_async(word, run_orm)
+            except Exception:
+                self._counters.incr('failed')
+                logger.exception('Fail prefetch word id=%s', word.id)
+            finally:
+                future.set_result(None)
+
+    def _on_done(self, word_id: int):
+        with self._lock:
+            self._in_flight.discard(word_id)
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            pending = len(self._in_flight)
+        return {'pending_words': pending, **self._counters.as_dict()}
+
+
+prefetcher = WordsPrefetcher(
+    threads_count=settings.SKYENG_PREFETCH_THREADS,
+    max_pending=settings.SKYENG_PREFETCH_MAX_PENDING,
+)
+metrics.register('words_prefetch', prefetcher.get_metrics)
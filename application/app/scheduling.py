@@ -0,0 +1,194 @@
+"""
+Алгоритмы интервальных повторений слов
+
+Алгоритм выбирает пользователь (User.repetition_algorithm):
+- fixed - прежняя лестница settings.REPETITION_TIMES, ошибки не учитываются,
+  после последней ступени слово больше не повторяется
+- sm2 - SuperMemo 2: интервал растет в ease_factor раз, ошибка начинает повторения заново
+- fsrs - модель памяти FSRS (v4): стабильность и сложность слова, интервал - время,
+  за которое вероятность вспомнить слово падает до settings.REPETITION_DESIRED_RETENTION
+
+Алгоритмы считают сразу пачку слов: состояние слов - столбцы numpy (Words),
+оценка повторения - число ошибок в нем (WordStatus.repetition_mistakes).
+Загрузка и сохранение пачки - WordStatus.set_next_repetition_times и WordStatus.reschedule.
+"""
+import collections
+import typing
+from abc import ABC, abstractmethod
+
+import numpy as np
+from django.conf import settings
+
+FIXED = 'fixed'
+SM2 = 'sm2'
+FSRS = 'fsrs'
+
+DAY = 24 * 60 * 60
+
+
+class Words(typing.NamedTuple):
+    """ Состояние пачки слов: столбцы одинаковой длины, как в WordStatus """
+    count_repetitions: np.ndarray
+    stability: np.ndarray  # дней: последний интервал SM-2, стабильность FSRS; 0 - не повторяли
+    difficulty: np.ndarray  # сложность FSRS, 1..10
+    ease_factor: np.ndarray  # SM-2
+
+    @classmethod
+    def from_columns(cls, columns: typing.Sequence[np.ndarray]) -> 'Words':
+        """ Из столбцов count_repetitions, stability, difficulty, ease_factor """
+        count_repetitions, *values = columns
+        return cls(count_repetitions.astype(int), *values)
+
+
+class Scheduler(ABC):
+    name = ''
+    title = ''
+
+    def review(self, words: Words, mistakes: np.ndarray, elapsed: np.ndarray) -> Words:
+        """
+        Состояние после повторения
+        mistakes - ошибок в повторении, elapsed - дней с предыдущего повторения (изучения)
+        """
+        return words._replace(count_repetitions=words.count_repetitions + 1)
+
+    @abstractmethod
+    def intervals(self, words: Words) -> np.ndarray:
+        """ Дней до следующего повторения; nan - слово больше не повторять """
+        pass
+
+    def has_state(self, words: Words) -> np.ndarray:
+        """
+        Слова, по состоянию которых алгоритм может назначить повторение;
+        у остальных (повторяли по другому алгоритму) повторение остается прежним
+        """
+        return words.count_repetitions > 0
+
+
+class FixedScheduler(Scheduler):
+    name = FIXED
+    title = 'по расписанию'
+
+    def intervals(self, words: Words) -> np.ndarray:
+        # ladder[n] - интервал после n-го повторения, за концом лестницы - nan
+        count = max(settings.REPETITION_TIMES) + 1
+        ladder = np.full(count + 1, np.nan)
+        for number, repetition_time in settings.REPETITION_TIMES.items():
+            ladder[number] = repetition_time.total_seconds() / DAY
+        return ladder[np.clip(words.count_repetitions, 0, count)]
+
+    def has_state(self, words: Words) -> np.ndarray:
+        # слово повторяли по SM-2 или FSRS (stability > 0) больше раз, чем ступеней лестницы:
+        # с повторения не снимаем, иначе после возврата к тому алгоритму его не перенести
+        from_other = (words.stability > 0) & np.isnan(self.intervals(words))
+        return super().has_state(words) & ~from_other
+
+
+class SM2Scheduler(Scheduler):
+    name = SM2
+    title = 'SuperMemo 2'
+
+    FIRST_INTERVAL = 1
+    SECOND_INTERVAL = 6
+    MIN_EASE_FACTOR = 1.3
+
+    def review(self, words: Words, mistakes: np.ndarray, elapsed: np.ndarray) -> Words:
+        words = super().review(words, mistakes, elapsed)
+        # качество ответа: без ошибок - 5, одна ошибка (опечатка) - 3, больше - 1
+        quality = np.array([5, 3, 1])[np.minimum(mistakes, 2)]
+        passed = quality >= 3
+
+        ease_factor = np.maximum(
+            words.ease_factor + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02),
+            self.MIN_EASE_FACTOR,
+        )
+        interval = np.select(
+            [words.stability <= 0, words.stability <= self.FIRST_INTERVAL],
+            [self.FIRST_INTERVAL, self.SECOND_INTERVAL],
+            words.stability * ease_factor,
+        )
+        return words._replace(
+            # не вспомнил - повторения сначала, ease_factor не меняется
+            stability=np.where(passed, interval, self.FIRST_INTERVAL),
+            ease_factor=np.where(passed, ease_factor, words.ease_factor),
+        )
+
+    def intervals(self, words: Words) -> np.ndarray:
+        return words.stability.astype(float)
+
+    def has_state(self, words: Words) -> np.ndarray:
+        return words.stability > 0
+
+
+class FSRSScheduler(Scheduler):
+    name = FSRS
+    title = 'FSRS'
+
+    # параметры FSRS v4 по умолчанию
+    W = np.array([
+        0.4, 0.6, 2.4, 5.8, 4.93, 0.94, 0.86, 0.01, 1.49, 0.14, 0.94, 2.18, 0.05, 0.34, 1.26,
+        0.29, 2.61,
+    ])
+    DECAY = -0.5
+    FACTOR = 19 / 81
+
+    def retrievability(self, elapsed: np.ndarray, stability: np.ndarray) -> np.ndarray:
+        return (1 + self.FACTOR * elapsed / stability) ** self.DECAY
+
+    def review(self, words: Words, mistakes: np.ndarray, elapsed: np.ndarray) -> Words:
+        words = super().review(words, mistakes, elapsed)
+        w = self.W
+        # оценка: без ошибок - good (3), одна ошибка - hard (2), больше - again (1)
+        grade = 3 - np.minimum(mistakes, 2)
+        is_new = words.stability <= 0
+
+        stability = np.where(is_new, 1, words.stability)
+        difficulty = np.clip(words.difficulty, 1, 10)
+        retrievability = self.retrievability(elapsed, stability)
+
+        recall_growth = np.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+        recall_growth *= np.exp(w[10] * (1 - retrievability)) - 1
+        recall_stability = stability * (1 + recall_growth * np.where(grade == 2, w[15], 1))
+        forget_stability = w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1)
+        forget_stability = np.minimum(
+            forget_stability * np.exp(w[14] * (1 - retrievability)), stability,
+        )
+        # сложность сдвигается оценкой и возвращается к начальной сложности оценки good
+        next_difficulty = w[7] * w[4] + (1 - w[7]) * (difficulty - w[6] * (grade - 3))
+        return words._replace(
+            stability=np.where(
+                is_new, w[grade - 1], np.where(grade > 1, recall_stability, forget_stability),
+            ),
+            difficulty=np.clip(
+                np.where(is_new, w[4] - (grade - 3) * w[5], next_difficulty), 1, 10,
+            ),
+        )
+
+    def intervals(self, words: Words) -> np.ndarray:
+        retention = settings.REPETITION_DESIRED_RETENTION
+        return words.stability / self.FACTOR * (retention ** (1 / self.DECAY) - 1)
+
+    def has_state(self, words: Words) -> np.ndarray:
+        return words.stability > 0
+
+
+SCHEDULERS = {scheduler.name: scheduler
+              for scheduler in (FixedScheduler(), SM2Scheduler(), FSRSScheduler())}
+CHOICES = tuple((scheduler.name, scheduler.title) for scheduler in SCHEDULERS.values())
+
+
+def get_scheduler(name: str) -> Scheduler:
+    return SCHEDULERS[name]
+
+
+def get_intervals(scheduler: Scheduler, words: Words) -> np.ndarray:
+    """ Интервалы алгоритма, не больше settings.REPETITION_MAX_INTERVAL """
+    max_interval = settings.REPETITION_MAX_INTERVAL.total_seconds() / DAY
+    return np.minimum(scheduler.intervals(words), max_interval)
+
+
+def split_rows(rows: typing.Iterable[typing.Sequence]) -> typing.Dict[str, np.ndarray]:
+    """ Строки (алгоритм, числа...) из БД -> {алгоритм: столбцы чисел} """
+    groups = collections.defaultdict(list)
+    for algorithm, *values in rows:
+        groups[algorithm].append(values)
+    return {algorithm: np.array(values, dtype=float).T for algorithm, values in groups.items()}
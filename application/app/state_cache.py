@@ -0,0 +1,359 @@
+"""
+Кэш состояния пользователей в памяти процесса бота
+
+Для каждого чата хранится снимок User, LearningStatus (repetition_word_status со словом,
+learn_word) - то, что telegram.users.resolve_user загружает на каждое обновление.
+Если снимок есть и username не изменился, пользователь собирается без запроса в БД.
+
+Запись (write-through): User.update_status, LearningStatus.set_repetition_word_status,
+clear_repeated_words и set_next_learn_word после commit-а кладут в кэш состояние из моделей.
+Если состояние загружено не целиком (например, repetition_word_status без слова) - снимок
+удаляется.
+
+Инвалидация между процессами: триггеры в БД (миграция app 0013) после commit-а любого
+изменения пользователя (бот, админка, telegram_tasks) шлют NOTIFY user_state с pid процесса
+postgres и id пользователей, поток StateCache слушает канал и удаляет снимки.
+Уведомление о собственной записи (тот же pid) снимок из write-through не удаляет, поэтому
+изменения SQL-ем в обход моделей в одной транзакции с write-through нужно отметить
+вызовом state_cache.invalidate(user_id).
+
+Пока поток не слушает канал (не запущен или потерял соединение), кэш не используется.
+"""
+import collections
+import logging
+import select
+import threading
+import typing
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import DEFERRED
+
+from app import metrics
+from app.models import LearningStatus, User, Word, WordStatus
+from app.word_catalog import general_words
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'user_state'
+
+
+class UserState(typing.NamedTuple):
+    """ Значения полей (concrete_fields) моделей """
+    user: tuple
+    learning_status: tuple
+    repetition_word_status: typing.Optional[tuple]
+    repetition_word: typing.Optional[tuple]  # repetition_word_status.word
+    learn_word: typing.Optional[tuple]
+
+
+def freeze_values(values: typing.Iterable) -> tuple:
+    """ Массивы (LearningStatus.repeat_word_ids) - в кортежи: снимок не меняется с моделью """
+    return tuple(tuple(value) if isinstance(value, list) else value for value in values)
+
+
+def get_values(instance) -> tuple:
+    # слова из app.word_catalog загружены не полностью: незагруженные поля остаются deferred
+    return freeze_values(
+        instance.__dict__.get(field.attname, DEFERRED) for field in instance._meta.concrete_fields
+    )
+
+
+def from_values(model, values: typing.Sequence):
+    return model.from_db(DEFAULT_DB_ALIAS, None, [
+        list(value) if isinstance(value, tuple) else value for value in values
+    ])
+
+
+def _get_cached_related(instance, field_name: str, related_id):
+    """ Связанный объект, если он загружен и соответствует id; иначе None """
+    field = instance._meta.get_field(field_name)
+    if field.is_cached(instance):
+        related = field.get_cached_value(instance)
+        if related is not None and related.id == related_id:
+            return related
+    return None
+
+
+def get_state(user: User, learning_status: LearningStatus) -> typing.Optional[UserState]:
+    """ Снимок из моделей; None, если что-то не загружено и снимок будет неполным """
+    if learning_status.user_id != user.id:
+        return None
+
+    repetition_word_status = learn_word = None
+    if learning_status.repetition_word_status_id:
+        repetition_word_status = _get_cached_related(
+            learning_status, 'repetition_word_status', learning_status.repetition_word_status_id,
+        )
+        if repetition_word_status is None \
+                or not WordStatus._meta.get_field('word').is_cached(repetition_word_status):
+            return None
+    if learning_status.learn_word_id:
+        learn_word = _get_cached_related(
+            learning_status, 'learn_word', learning_status.learn_word_id,
+        )
+        if learn_word is None:
+            return None
+
+    return UserState(
+        user=get_values(user),
+        learning_status=get_values(learning_status),
+        repetition_word_status=repetition_word_status and get_values(repetition_word_status),
+        repetition_word=repetition_word_status and get_values(repetition_word_status.word),
+        learn_word=learn_word and get_values(learn_word),
+    )
+
+
+def build_user(state: UserState, seq: int) -> User:
+    """
+    Новые объекты моделей из снимка, связанные так же, как после select_related:
+    user.learning_status, repetition_word_status (со словом) и learn_word не делают запросов
+
+    seq - StateCache.get_seq() на момент чтения состояния (см. StateCache.write_through)
+    """
+    user = from_values(User, state.user)
+    learning_status = from_values(LearningStatus, state.learning_status)
+
+    repetition_word_status = None
+    if state.repetition_word_status:
+        repetition_word_status = from_values(WordStatus, state.repetition_word_status)
+        WordStatus._meta.get_field('word').set_cached_value(
+            repetition_word_status, from_values(Word, state.repetition_word),
+        )
+    learn_word = from_values(Word, state.learn_word) if state.learn_word else None
+
+    LearningStatus._meta.get_field('user').set_cached_value(learning_status, user)
+    LearningStatus._meta.get_field('repetition_word_status').set_cached_value(
+        learning_status, repetition_word_status,
+    )
+    LearningStatus._meta.get_field('learn_word').set_cached_value(learning_status, learn_word)
+
+    user.__dict__['learning_status'] = learning_status  # cached_property
+    user._state_cache_seq = seq
+    return user
+
+
+class _Entry:
+    __slots__ = ('user_id', 'username', 'state', 'own_pid')
+
+    def __init__(self, user_id: int, username: str, state: UserState, own_pid=None):
+        self.user_id = user_id
+        self.username = username
+        self.state = state
+        # уведомление о записи с этого pid - наше собственное, снимок уже актуален
+        self.own_pid = own_pid
+
+
+class StateCache:
+    def __init__(self, max_size: int, poll_interval=5):
+        self.max_size = max_size
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._listening = False
+        # chat_id -> _Entry, в порядке использования (LRU)
+        self._entries: typing.Dict[str, _Entry] = collections.OrderedDict()
+        self._chat_ids: typing.Dict[int, str] = {}
+
+        # номер последней инвалидации: снимок, прочитанный до нее, сохранять нельзя
+        self._seq = 0
+        # user_id -> {pid записи в postgres: seq}, pid None - invalidate() в этом процессе
+        self._invalidated: typing.Dict[int, typing.Dict] = collections.OrderedDict()
+        self._forgotten_seq = 0  # для пользователей, которых нет в _invalidated
+        self._counters = metrics.Counters(
+            'hits', 'misses', 'stores', 'write_throughs', 'stale_writes',
+            'invalidations', 'evictions', 'reconnects',
+        )
+
+    @property
+    def is_enabled(self) -> bool:
+        return self._listening
+
+    def get_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def get(self, chat_id: str, username: str) -> typing.Optional[User]:
+        if not self.is_enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None or entry.username != username:
+                self._counters.incr('misses')
+                return None
+            self._entries.move_to_end(chat_id)
+            seq = self._seq
+        self._counters.incr('hits')
+        return build_user(entry.state, seq)
+
+    def store(self, user: User, state: UserState, seq: int, own_pid=None) -> bool:
+        """
+        seq - get_seq() до чтения состояния из БД
+        own_pid - pid соединения postgres, которое записало это состояние: уведомление
+            об этой записи не удалит снимок
+        """
+        if not self.is_enabled:
+            return False
+        with self._lock:
+            invalidated = self._invalidated.get(user.id, {})
+            is_changed = self._forgotten_seq > seq or any(
+                invalidated_seq > seq
+                for pid, invalidated_seq in invalidated.items() if pid is None or pid != own_pid
+            )
+            if not self._listening or is_changed:
+                # пока читали, состояние изменил кто-то другой
+                self._counters.incr('stale_writes')
+                self._remove(user.id)
+                return False
+            if invalidated.get(own_pid, 0) > seq:
+                # уведомление о нашей записи уже пришло
+                own_pid = None
+
+            self._remove(user.id)
+            self._entries[user.chat_id] = _Entry(user.id, user.username, state, own_pid)
+            self._chat_ids[user.id] = user.chat_id
+            while len(self._entries) > self.max_size:
+                _, entry = self._entries.popitem(last=False)
+                del self._chat_ids[entry.user_id]
+                self._counters.incr('evictions')
+        self._counters.incr('stores')
+        return True
+
+    def write_through(self, user: User, learning_status: typing.Optional[LearningStatus]):
+        """ После commit-а текущей транзакции сохранит состояние из моделей """
+        if not self.is_enabled:
+            return
+        seq = getattr(user, '_state_cache_seq', None)
+        if seq is None or learning_status is None:
+            # объекты загружены не через resolve_user: неизвестно, насколько они свежие
+            self.invalidate(user.id)
+            return
+
+        own_pid = connection.connection.get_backend_pid()
+
+        def on_commit():
+            state = get_state(user, learning_status)
+            if state is None:
+                self.invalidate(user.id)
+            elif self.store(user, state, seq, own_pid=own_pid):
+                self._counters.incr('write_throughs')
+
+        transaction.on_commit(on_commit)
+
+    def write_through_learning_status(self, learning_status: LearningStatus):
+        user_field = LearningStatus._meta.get_field('user')
+        if user_field.is_cached(learning_status):
+            self.write_through(learning_status.user, learning_status)
+        else:
+            self.invalidate(learning_status.user_id)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._invalidate(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _remove(self, user_id: int):
+        chat_id = self._chat_ids.pop(user_id, None)
+        if chat_id is not None:
+            del self._entries[chat_id]
+
+    def _invalidate(self, user_id: int, pid=None):
+        self._seq += 1
+        self._invalidated.setdefault(user_id, {})[pid] = self._seq
+        self._invalidated.move_to_end(user_id)
+        while len(self._invalidated) > max(self.max_size, 1000):
+            _, invalidated = self._invalidated.popitem(last=False)
+            self._forgotten_seq = max(self._forgotten_seq, *invalidated.values())
+        self._remove(user_id)
+        self._counters.incr('invalidations')
+
+    def _clear(self):
+        self._seq += 1
+        self._forgotten_seq = self._seq
+        self._invalidated.clear()
+        self._entries.clear()
+        self._chat_ids.clear()
+
+    def on_notify(self, payload: str):
+        """ payload: "<pid>:<user_id>,<user_id>,..."; '*' - изменилось общее слово """
+        pid, _, user_ids = payload.partition(':')
+        pid = int(pid)
+        with self._lock:
+            for user_id in user_ids.split(','):
+                if user_id == '*':
+                    self._clear()
+                    general_words.invalidate()
+                    continue
+                user_id = int(user_id)
+                chat_id = self._chat_ids.get(user_id)
+                entry = self._entries[chat_id] if chat_id is not None else None
+                if entry is not None and entry.own_pid == pid:
+                    entry.own_pid = None
+                else:
+                    self._invalidate(user_id, pid)
+
+    def start(self):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(
+                target=self._listen, name='user-state-cache', daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self):
+        """ Закрывает соединение слушателя (тесты: тестовую БД нельзя удалить, пока оно открыто) """
+        with self._lock:
+            thread = self._thread
+        if thread:
+            self._stopped.set()
+            thread.join()
+
+    def _set_listening(self, is_listening: bool):
+        # пока не слушали канал, уведомления могли потеряться: начинаем с пустого кэша
+        with self._lock:
+            self._listening = is_listening
+            self._clear()
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            db_connection = None
+            try:
+                wrapper = connections[DEFAULT_DB_ALIAS]
+                db_connection = wrapper.get_new_connection(wrapper.get_connection_params())
+                db_connection.autocommit = True
+                with db_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                self._set_listening(True)
+                logger.info('User state cache: listen %s', CHANNEL)
+                while not self._stopped.is_set():
+                    if select.select([db_connection], [], [], self.poll_interval) == ([], [], []):
+                        # долго тихо: проверяем, что соединение живо
+                        with db_connection.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                    db_connection.poll()
+                    while db_connection.notifies:
+                        self.on_notify(db_connection.notifies.pop(0).payload)
+            except Exception:
+                logger.exception('User state cache: listener exception')
+            finally:
+                self._set_listening(False)
+                if db_connection is not None:
+                    db_connection.close()
+            if not self._stopped.wait(self.poll_interval):
+                self._counters.incr('reconnects')
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {'size': size, 'listening': self._listening, **self._counters.as_dict()}
+
+
+state_cache = StateCache(max_size=settings.USER_STATE_CACHE_SIZE)
+metrics.register('user_state_cache', state_cache.get_metrics)
@@ -0,0 +1,75 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from app.dictionary import DictionaryCache
+from app.dictionary_bundle import BundleFile, DictionaryBundle, write_bundle
+from app.models import DictionaryEntry
+
+
+def make_data(word: str, has_sound=True) -> str:
+    return json.dumps([{
+        'id': 1, 'text': word,
+        'meanings': [{
+            'id': 1, 'soundUrl': f'//sound/?text={word}' if has_sound else None,
+            'imageUrl': f'//images/{word}.jpeg', 'previewUrl': None,
+            'translation': {'text': f'перевод {word}', 'note': None},
+        }],
+    }])
+
+
+class DictionaryBundleTests(TestCase):
+    """ В файле словаря только действующие ответы, "не нашлось" из него не берется """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'dictionary.bundle')
+
+    def create_entry(self, word: str, has_sound=True, expires_in=datetime.timedelta(days=1)):
+        DictionaryEntry.objects.create(
+            word=word, data=make_data(word, has_sound), has_sound=has_sound,
+            expires_at=timezone.now() + expires_in,
+        )
+
+    def test_build_skips_expired_and_negative_entries(self):
+        self.create_entry('apple')
+        self.create_entry('pear', expires_in=-datetime.timedelta(seconds=1))
+        self.create_entry('xray', has_sound=False)
+
+        call_command('dictionary_bundle', 'build', '--path', self.path, stdout=io.StringIO())
+
+        self.assertEqual([word for word, _ in BundleFile(self.path).items()], ['apple'])
+
+    def test_build_skips_negative_dump_entries(self):
+        dump_path = os.path.join(os.path.dirname(self.path), 'dump.jsonl')
+        with open(dump_path, 'w', encoding='utf-8') as file:
+            for word, has_sound in (('plum', True), ('xenon', False)):
+                data = json.loads(make_data(word, has_sound))
+                file.write(json.dumps({'word': word, 'data': data}) + '\n')
+
+        call_command('dictionary_bundle', 'build', '--path', self.path, '--import', dump_path,
+                     '--no-cache', stdout=io.StringIO())
+
+        self.assertEqual([word for word, _ in BundleFile(self.path).items()], ['plum'])
+
+    def test_negative_bundle_entry_falls_through(self):
+        # файл собран раньше: в нем "не нашлось", а в кэше уже найденное слово
+        write_bundle(self.path, {
+            'apple': make_data('apple').encode('utf-8'),
+            'xray': make_data('xray', has_sound=False).encode('utf-8'),
+        })
+        self.create_entry('xray')
+        cache = DictionaryCache(memory_size=10, bundle=DictionaryBundle(self.path))
+
+        self.assertIsNotNone(cache.search_word_meanings('apple').get_first_word_with_sound())
+        self.assertIsNotNone(cache.search_word_meanings('xray').get_first_word_with_sound())
+        metrics = cache.get_metrics()
+        self.assertEqual(metrics['bundle_hits'], 1)
+        self.assertEqual(metrics['db_hits'], 1)
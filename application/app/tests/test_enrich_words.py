@@ -0,0 +1,101 @@
+import datetime
+import io
+
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from app.dictionary import cache
+from app.models import DictionaryEntry, Word
+from project.testing import FakeServer
+
+
+class EnrichWordsTests(TransactionTestCase):
+    """ manage.py enrich_words против fake сервера словаря (utils/fake_skyeng_api.py) """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.skyeng_api = FakeServer('fake_skyeng_api', 'FakeSkyengApi')
+        cls.skyeng_api.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.skyeng_api.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear_memory()
+        self.addCleanup(cache.clear_memory)
+        settings_override = override_settings(SKYENG_API_URL=self.skyeng_api.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def enrich_words(self, *args) -> str:
+        stdout = io.StringIO()
+        call_command('enrich_words', '--threads', '2', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def get_requests(self) -> int:
+        return self.skyeng_api.api.stats['requests']
+
+    def test_found_word(self):
+        word = Word.objects.create(text='apple', translate='яблоко')
+
+        self.enrich_words()
+
+        word.refresh_from_db()
+        self.assertIsNotNone(word.date_enriched)
+        self.assertIsNone(word.enrich_retry_after)
+        self.assertEqual(word.dictionary_text, 'apple')
+        self.assertIn('text=apple', word.sound_url)
+        self.assertIn('apple.jpeg', word.image_url)
+
+    def test_enriched_words_are_skipped(self):
+        Word.objects.create(text='apple', translate='яблоко')
+        self.enrich_words()
+        requests = self.get_requests()
+
+        output = self.enrich_words()
+
+        self.assertEqual(self.get_requests(), requests)
+        self.assertIn('Done: 0 words', output)
+
+    def test_not_found_word_is_retried(self):
+        # у слов на "x" в fake словаре нет произношения
+        word = Word.objects.create(text='xylophone', translate='ксилофон')
+
+        self.enrich_words()
+
+        word.refresh_from_db()
+        self.assertIsNotNone(word.date_enriched)
+        self.assertEqual(word.sound_url, '')
+        self.assertGreater(word.enrich_retry_after, timezone.now())
+
+        # до enrich_retry_after слово не ищем
+        requests = self.get_requests()
+        self.enrich_words()
+        self.assertEqual(self.get_requests(), requests)
+
+        # ответ в кэше истек вместе с enrich_retry_after: ищем снова
+        past = timezone.now() - datetime.timedelta(minutes=1)
+        Word.objects.filter(id=word.id).update(enrich_retry_after=past)
+        DictionaryEntry.objects.update(expires_at=past)
+        cache.clear_memory()
+        output = self.enrich_words()
+
+        self.assertEqual(self.get_requests(), requests + 1)
+        self.assertIn('Done: 1 words', output)
+        word.refresh_from_db()
+        self.assertGreater(word.enrich_retry_after, timezone.now())
+
+    def test_not_english_word_is_not_retried(self):
+        word = Word.objects.create(text='яблоко', translate='фрукт')
+        requests = self.get_requests()
+
+        self.enrich_words()
+
+        word.refresh_from_db()
+        self.assertIsNotNone(word.date_enriched)
+        self.assertIsNone(word.enrich_retry_after)
+        self.assertEqual(self.get_requests(), requests)
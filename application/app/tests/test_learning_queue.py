@@ -0,0 +1,76 @@
+from django.db import connection
+from django.test import TransactionTestCase
+
+from app.learning_queue import get_user_words
+from app.models import User, Word
+from project.testing import get_plan_nodes
+
+
+class LearningQueuePlanTests(TransactionTestCase):
+    """ Запрос очереди изучения идет по индексу, id слов - без чтения таблицы """
+
+    users_count = 200
+    words_per_user = 50
+    # общие слова: как у users_count пользователей, но с user_id = NULL
+    general_words_count = 10000
+
+    def setUp(self):
+        users = User.objects.bulk_create([
+            User(chat_id=f'queue-{number}', username='queue')
+            for number in range(self.users_count)
+        ])
+        self.user = users[0]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO app_word (text, translate, phrase, user_id, dictionary_text,
+                                      sound_url, image_url, date_created, date_updated)
+                SELECT 'word' || number, 'слово', '', user_id, '', '', '', now(), now()
+                FROM unnest(%(user_ids)s || array_fill(NULL::integer, ARRAY[%(general)s]))
+                    AS user_id,
+                    generate_series(1, %(user_words)s) AS number
+                ''',
+                {
+                    'user_ids': [user.id for user in users],
+                    'general': self.general_words_count // self.words_per_user,
+                    'user_words': self.words_per_user,
+                },
+            )
+            # index-only scan возможен, когда страницы таблицы отмечены в visibility map
+            cursor.execute('VACUUM ANALYZE app_word')
+
+    def get_word_nodes(self, from_id: int) -> list:
+        queryset = get_user_words(self.user.id, from_id, 7)
+        nodes = get_plan_nodes(*queryset.query.sql_with_params())
+        return [node for node in nodes if node.get('Relation Name') == Word._meta.db_table]
+
+    def assert_index_only(self, from_id: int):
+        nodes = self.get_word_nodes(from_id)
+        node_types = [node['Node Type'] for node in nodes]
+        self.assertNotIn('Seq Scan', node_types)
+        self.assertNotIn('Bitmap Heap Scan', node_types)
+        self.assertIn(
+            ('Index Only Scan', 'app_word_user_id_id_idx'),
+            [(node['Node Type'], node.get('Index Name')) for node in nodes],
+        )
+        # строки таблицы - только для найденных слов, по первичному ключу
+        self.assertEqual(
+            {node.get('Index Name') for node in nodes if node['Node Type'] == 'Index Scan'},
+            {'app_word_pkey'},
+        )
+
+    def test_plan_from_start(self):
+        self.assert_index_only(0)
+
+    def test_plan_from_cursor(self):
+        word_ids = list(
+            Word.objects.filter(user=self.user).order_by('id').values_list('id', flat=True)
+        )
+        self.assert_index_only(word_ids[len(word_ids) // 2])
+
+    def test_words(self):
+        word_ids = list(
+            Word.objects.filter(user=self.user).order_by('id').values_list('id', flat=True)
+        )
+        words = list(get_user_words(self.user.id, word_ids[10], 7))
+        self.assertEqual([word.id for word in words], word_ids[11:18])
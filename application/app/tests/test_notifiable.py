@@ -0,0 +1,56 @@
+import datetime
+
+from django.db.models import F, Value
+from django.test import TestCase
+
+from app.models import LocalTime, User, filter_notifiable
+
+
+def utc(hour: int, minute: int = 0) -> datetime.datetime:
+    return datetime.datetime(2026, 1, 10, hour, minute, tzinfo=datetime.timezone.utc)
+
+
+class FilterNotifiableTests(TestCase):
+    """ Тихие часы в часовом поясе пользователя, в том числе через полночь (22:00-07:00) """
+
+    def setUp(self):
+        self.users = {
+            name: User.objects.create(
+                chat_id=name, username=name, timezone=timezone,
+                quiet_hours_start=datetime.time(start), quiet_hours_end=datetime.time(end),
+            )
+            for name, timezone, start, end in (
+                ('utc_night', 'UTC', 22, 7),
+                ('moscow_night', 'Europe/Moscow', 22, 7),  # UTC+3
+                ('utc_day', 'UTC', 13, 15),
+                ('never', 'UTC', 0, 0),
+            )
+        }
+
+    def get_notifiable(self, now: datetime.datetime) -> set:
+        return set(filter_notifiable(User.objects.all(), now).values_list('chat_id', flat=True))
+
+    def test_local_time(self):
+        local_times = dict(User.objects.annotate(
+            local_time=LocalTime(Value(utc(21, 30)), F('timezone')),
+        ).values_list('chat_id', 'local_time'))
+        self.assertEqual(local_times['utc_night'], datetime.time(21, 30))
+        self.assertEqual(local_times['moscow_night'], datetime.time(0, 30))
+
+    def test_quiet_hours(self):
+        cases = (
+            # UTC, кого можно оповещать; Москва на 3 часа впереди
+            (utc(21, 59), {'utc_night', 'utc_day', 'never'}),  # Москва 00:59
+            (utc(22), {'utc_day', 'never'}),  # начало тихих часов - уже тихо
+            (utc(23, 30), {'utc_day', 'never'}),  # после полуночи в Москве
+            (utc(3, 59), {'utc_day', 'never'}),  # Москва 06:59
+            (utc(4), {'moscow_night', 'utc_day', 'never'}),  # Москва 07:00 - конец
+            (utc(7), {'utc_night', 'moscow_night', 'utc_day', 'never'}),
+            (utc(13), {'utc_night', 'moscow_night', 'never'}),  # тихие часы внутри дня
+            (utc(15), {'utc_night', 'moscow_night', 'utc_day', 'never'}),
+            (utc(18, 59), {'utc_night', 'moscow_night', 'utc_day', 'never'}),
+            (utc(19), {'utc_night', 'utc_day', 'never'}),  # Москва 22:00
+        )
+        for now, expected in cases:
+            with self.subTest(now=now.time()):
+                self.assertEqual(self.get_notifiable(now), expected)
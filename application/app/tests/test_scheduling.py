@@ -0,0 +1,199 @@
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from app import scheduling
+from app.models import User, Word, WordStatus
+from app.utils import get_datetime_now
+
+HOUR = 1 / 24
+
+
+def make_words(count_repetitions=0, stability=0.0, difficulty=0.0,
+               ease_factor=2.5) -> scheduling.Words:
+    return scheduling.Words(*(np.array([value]) for value in (
+        count_repetitions, stability, difficulty, ease_factor,
+    )))
+
+
+def review(scheduler: scheduling.Scheduler, words: scheduling.Words, mistakes=0,
+           elapsed=None) -> scheduling.Words:
+    if elapsed is None:
+        elapsed = scheduler.intervals(words) if words.stability[0] > 0 else np.zeros(1)
+    return scheduler.review(words, np.array([mistakes]), np.asarray(elapsed, dtype=float))
+
+
+@override_settings(
+    REPETITION_TIMES={1: timedelta(hours=1), 2: timedelta(hours=6), 3: timedelta(days=1),
+                      4: timedelta(days=3)},
+    REPETITION_DESIRED_RETENTION=0.9,
+    REPETITION_MAX_INTERVAL=timedelta(days=365),
+)
+class SchedulerTests(SimpleTestCase):
+    """ Интервалы алгоритмов повторения по таблицам: рост, ease floor, ошибки, предел """
+
+    def test_fixed_ladder(self):
+        scheduler = scheduling.get_scheduler(scheduling.FIXED)
+        cases = (
+            (0, math.nan),
+            (1, HOUR),
+            (2, 6 * HOUR),
+            (3, 1),
+            (4, 3),
+            (5, math.nan),  # за концом лестницы слово больше не повторяется
+            (20, math.nan),
+        )
+        for count_repetitions, expected in cases:
+            with self.subTest(count_repetitions=count_repetitions):
+                interval = scheduler.intervals(make_words(count_repetitions))[0]
+                if math.isnan(expected):
+                    self.assertTrue(math.isnan(interval))
+                else:
+                    self.assertAlmostEqual(interval, expected)
+
+        # ошибки лестницу не меняют
+        words = review(scheduler, make_words(2), mistakes=3)
+        self.assertEqual(words.count_repetitions[0], 3)
+        self.assertAlmostEqual(scheduler.intervals(words)[0], 1)
+
+    def test_sm2(self):
+        scheduler = scheduling.get_scheduler(scheduling.SM2)
+        cases = (
+            # (ошибок, stability, ease_factor) -> (stability, ease_factor)
+            ((0, 0, 2.5), (1, 2.6)),
+            ((0, 1, 2.6), (6, 2.7)),
+            ((0, 6, 2.7), (6 * 2.8, 2.8)),
+            ((1, 6, 2.5), (6 * 2.36, 2.36)),
+            ((1, 6, 1.4), (6 * 1.3, 1.3)),  # ease_factor не ниже 1.3
+            ((1, 6, 1.3), (6 * 1.3, 1.3)),
+            ((2, 16.8, 2.8), (1, 2.8)),  # не вспомнил: сначала, ease_factor прежний
+            ((5, 100, 2.0), (1, 2.0)),
+        )
+        for (mistakes, stability, ease_factor), (expected_stability, expected_ease) in cases:
+            with self.subTest(mistakes=mistakes, stability=stability, ease_factor=ease_factor):
+                words = review(
+                    scheduler, make_words(3, stability, ease_factor=ease_factor), mistakes,
+                    elapsed=[stability],
+                )
+                self.assertEqual(words.count_repetitions[0], 4)
+                self.assertAlmostEqual(words.stability[0], expected_stability)
+                self.assertAlmostEqual(words.ease_factor[0], expected_ease)
+                self.assertAlmostEqual(scheduler.intervals(words)[0], expected_stability)
+
+    def test_sm2_intervals_grow(self):
+        scheduler = scheduling.get_scheduler(scheduling.SM2)
+        words, intervals = make_words(), []
+        for _ in range(5):
+            words = review(scheduler, words)
+            intervals.append(scheduler.intervals(words)[0])
+        self.assertEqual(intervals[:2], [1, 6])
+        self.assertTrue(all(later > earlier for earlier, later in zip(intervals, intervals[1:])))
+
+    def test_fsrs_first_review(self):
+        scheduler = scheduling.get_scheduler(scheduling.FSRS)
+        w = scheduler.W
+        cases = (
+            # ошибок -> (stability, difficulty): начальные значения оценки
+            (0, (w[2], w[4])),
+            (1, (w[1], w[4] + w[5])),
+            (2, (w[0], w[4] + 2 * w[5])),
+        )
+        for mistakes, (expected_stability, expected_difficulty) in cases:
+            with self.subTest(mistakes=mistakes):
+                words = review(scheduler, make_words(), mistakes)
+                self.assertAlmostEqual(words.stability[0], expected_stability)
+                self.assertAlmostEqual(words.difficulty[0], expected_difficulty)
+                # при retention 0.9 интервал равен стабильности
+                self.assertAlmostEqual(scheduler.intervals(words)[0], expected_stability)
+
+    def test_fsrs_review(self):
+        scheduler = scheduling.get_scheduler(scheduling.FSRS)
+        words = make_words(3, stability=10, difficulty=5)
+
+        good = review(scheduler, words, 0)
+        hard = review(scheduler, words, 1)
+        again = review(scheduler, words, 2)
+        self.assertGreater(good.stability[0], hard.stability[0])
+        self.assertGreater(hard.stability[0], 10)
+        # забыл: стабильность падает, сложность растет
+        self.assertLess(again.stability[0], 10)
+        self.assertGreater(again.difficulty[0], good.difficulty[0])
+
+        # интервалы растут, пока слово вспоминают
+        intervals = []
+        for _ in range(5):
+            words = review(scheduler, words)
+            intervals.append(scheduler.intervals(words)[0])
+        self.assertTrue(all(later > earlier for earlier, later in zip(intervals, intervals[1:])))
+
+    @override_settings(REPETITION_DESIRED_RETENTION=0.8)
+    def test_fsrs_retention(self):
+        scheduler = scheduling.get_scheduler(scheduling.FSRS)
+        # меньше желаемая вероятность вспомнить - длиннее интервал
+        self.assertGreater(scheduler.intervals(make_words(3, stability=10))[0], 10)
+
+    @override_settings(REPETITION_MAX_INTERVAL=timedelta(days=30))
+    def test_max_interval(self):
+        cases = (
+            (scheduling.SM2, make_words(10, stability=400), 30),
+            (scheduling.SM2, make_words(2, stability=6), 6),
+            (scheduling.FSRS, make_words(10, stability=400, difficulty=5), 30),
+            (scheduling.FIXED, make_words(4), 3),
+        )
+        for algorithm, words, expected in cases:
+            with self.subTest(algorithm=algorithm, stability=words.stability[0]):
+                scheduler = scheduling.get_scheduler(algorithm)
+                self.assertAlmostEqual(scheduling.get_intervals(scheduler, words)[0], expected)
+        # слово, которое больше не повторять, пределом не получает повторение
+        fixed = scheduling.get_scheduler(scheduling.FIXED)
+        self.assertTrue(math.isnan(scheduling.get_intervals(fixed, make_words(5))[0]))
+
+
+@override_settings(
+    REPETITION_TIMES={1: timedelta(hours=1), 2: timedelta(hours=6), 3: timedelta(days=1),
+                      4: timedelta(days=3)},
+    REPETITION_DESIRED_RETENTION=0.9,
+)
+class RescheduleTests(TestCase):
+    """ Перенос слов при смене алгоритма пользователя """
+
+    def setUp(self):
+        self.user = User.objects.create(chat_id='reschedule', username='reschedule',
+                                        repetition_algorithm=scheduling.SM2)
+        self.now = get_datetime_now()
+
+    def make_word_status(self, **fields) -> WordStatus:
+        word = Word.objects.create(text='check - проверка', user=self.user)
+        return WordStatus.objects.create(user=self.user, word=word, last_repetition_time=self.now,
+                                         **fields)
+
+    def get_days(self, word_status: WordStatus) -> float:
+        word_status.refresh_from_db()
+        if word_status.start_repetition_time is None:
+            return math.nan
+        return (word_status.start_repetition_time - self.now) / timedelta(days=1)
+
+    def test_words_past_fixed_ladder_are_kept(self):
+        # повторяли по SM-2 больше раз, чем ступеней в REPETITION_TIMES
+        word_status = self.make_word_status(
+            count_repetitions=6, stability=10, ease_factor=2.5,
+            start_repetition_time=self.now + timedelta(days=10),
+        )
+        for algorithm, expected in ((scheduling.FIXED, 10), (scheduling.SM2, 10),
+                                    (scheduling.FSRS, 10), (scheduling.FIXED, 10)):
+            with self.subTest(algorithm=algorithm):
+                self.user.set_repetition_algorithm(algorithm)
+                self.assertAlmostEqual(self.get_days(word_status), expected, places=3)
+
+    def test_fixed_words_follow_ladder(self):
+        word_status = self.make_word_status(
+            count_repetitions=2, start_repetition_time=self.now + timedelta(days=5),
+        )
+        # у слова нет состояния SM-2: повторение остается прежним
+        self.user.set_repetition_algorithm(scheduling.SM2)
+        self.assertAlmostEqual(self.get_days(word_status), 5, places=3)
+
+        self.user.set_repetition_algorithm(scheduling.FIXED)
+        self.assertAlmostEqual(self.get_days(word_status), 6 * HOUR, places=3)
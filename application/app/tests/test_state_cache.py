@@ -0,0 +1,89 @@
+import threading
+import time
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+
+from app.models import LearningStatus, User
+from app.state_cache import StateCache
+from telegram import users
+
+
+class StateCacheTests(TransactionTestCase):
+    """ Снимки пользователей: инвалидация через NOTIFY (миграция 0013), свои записи, откат """
+
+    def setUp(self):
+        self.cache = StateCache(max_size=100, poll_interval=0.1)
+        patcher = mock.patch.object(users, 'state_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache.start()
+        self.addCleanup(self.cache.stop)
+        self.assertTrue(self.wait(lambda: self.cache.is_enabled))
+
+    def wait(self, condition, timeout=5) -> bool:
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return condition()
+
+    def in_other_connection(self, func):
+        """ Запись другого процесса: свое соединение с БД """
+        def run():
+            try:
+                func()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join(5)
+
+    def get_entry(self, chat_id: str):
+        with self.cache._lock:
+            return self.cache._entries.get(chat_id)
+
+    def test_write_in_other_connection_evicts(self):
+        user, _ = users.resolve_user(401, 'name')
+        with self.assertNumQueries(0):
+            users.resolve_user(401, 'name')
+
+        self.in_other_connection(
+            lambda: LearningStatus.objects.filter(user_id=user.id).update(count_words=7),
+        )
+
+        self.assertTrue(self.wait(lambda: self.get_entry('401') is None))
+        with self.assertNumQueries(1):
+            user, _ = users.resolve_user(401, 'name')
+        self.assertEqual(user.learning_status.count_words, 7)
+
+    def test_own_write_notification_keeps_entry(self):
+        users.resolve_user(402, 'name')
+        self.assertIsNotNone(self.get_entry('402'))
+
+        # уведомление о создании пользователя этим же соединением (до или после store)
+        # снимок не удаляет
+        self.assertTrue(self.wait(lambda: self.get_entry('402').own_pid is None))
+        time.sleep(0.3)
+        with self.assertNumQueries(0):
+            users.resolve_user(402, 'name')
+
+        users.resolve_user(402, 'new_name')
+        self.assertTrue(self.wait(lambda: self.get_entry('402').own_pid is None))
+        time.sleep(0.3)
+        with self.assertNumQueries(0):
+            user, _ = users.resolve_user(402, 'new_name')
+        self.assertEqual(user.username, 'new_name')
+
+    def test_rolled_back_user_is_not_cached(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            users.resolve_user(403, 'name')
+            raise ValueError
+
+        self.assertFalse(User.objects.filter(chat_id='403').exists())
+        self.assertIsNone(self.get_entry('403'))
+        self.assertEqual(self.cache.get_metrics()['stores'], 0)
+        with self.assertNumQueries(1):
+            users.resolve_user(403, 'name')
+        self.assertIsNotNone(self.get_entry('403'))
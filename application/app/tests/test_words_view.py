@@ -0,0 +1,47 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from app.models import User, Word
+from app.views import WordView
+from app.word_catalog import WordsCatalog, general_words
+
+
+@mock.patch.object(WordView, 'paginate_by', 2)
+class WordViewTests(TestCase):
+    """ Список слов на сайте по страницам: из общего каталога - без списка всех слов """
+
+    def setUp(self):
+        Word.objects.bulk_create([
+            Word(text=f'word{number}', translate='слово') for number in range(5)
+        ])
+        general_words.invalidate()
+        self.addCleanup(general_words.invalidate)
+
+    def get_texts(self, page: int) -> list:
+        response = self.client.get(reverse('words'), {'page': page})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['paginator'].count, 5)
+        return [word.text for word in response.context['object_list']]
+
+    def test_general_words_pages(self):
+        with mock.patch.object(WordsCatalog, 'get_word', autospec=True,
+                               side_effect=WordsCatalog.get_word) as get_word:
+            self.assertEqual(self.get_texts(1), ['word4', 'word3'])
+            self.assertEqual(get_word.call_count, 2)
+            self.assertEqual(self.get_texts(2), ['word2', 'word1'])
+            self.assertEqual(self.get_texts(3), ['word0'])
+        self.assertEqual(get_word.call_count, 5)
+
+    def test_user_words_pages(self):
+        user = User.objects.create(chat_id='words-view', username='words')
+        user.generate_auth_token()
+        Word.objects.bulk_create([
+            Word(text=f'own{number}', translate='свое', user=user) for number in range(3)
+        ])
+        self.client.cookies['wordknow_auth'] = str(user.auth_token)
+
+        response = self.client.get(reverse('words'), {'page': 2})
+        self.assertEqual(response.context['paginator'].count, 3)
+        self.assertEqual([word.text for word in response.context['object_list']], ['own0'])
@@ -9,4 +9,5 @@ urlpatterns = [
     path('login', views.LoginView.as_view(), name='login'),
     path('words', views.WordView.as_view(), name='words'),
     path('create_word', views.CreateWordsView.as_view(), name='create_words'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
 ]
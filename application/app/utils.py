@@ -1,10 +1,13 @@
 import logging
-from functools import wraps
+import typing
+from functools import lru_cache, wraps
 from time import sleep
 
 import pytz
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.management import BaseCommand
+from django.db import connection
 from django.utils import autoreload, timezone
 
 log = logging.getLogger(__name__)
@@ -29,6 +32,20 @@ def get_datetime_now():
     return use_timezone(timezone.now())
 
 
+@lru_cache(maxsize=None)
+def get_db_timezone_names() -> typing.FrozenSet[str]:
+    """ Часовые пояса, которые знает Postgres: по ним запросы считают местное время """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT name FROM pg_timezone_names')
+        return frozenset(name for name, in cursor.fetchall())
+
+
+def validate_timezone(value: str):
+    # база pytz может отличаться от базы часовых поясов Postgres
+    if value not in get_db_timezone_names():
+        raise ValidationError(f'Неизвестный часовой пояс: {value}')
+
+
 def retry_if_false(attempts_count=3, sleep_time=0.5, use_logging=False):
     """ retry ryb function
 
@@ -74,7 +91,7 @@ def safe_str(obj):
 
 class BaseCommandWithAutoreload(BaseCommand):
     def handle(self, *args, **options):
-        autoreload.run_with_reloader(self.main)
+        autoreload.run_with_reloader(self.main, *args, **options)
 
-    def main(self):
+    def main(self, *args, **options):
         pass
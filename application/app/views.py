@@ -1,12 +1,16 @@
 from urllib.parse import urlencode
 
 from django.conf import settings
-from django.http import HttpResponseRedirect
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseRedirect, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
 from django.views.generic import FormView, ListView, TemplateView
 
-from app import forms
+from app import forms, metrics
 from app.mixins import AuthenticationMixin, TemplateFormMixin
 from app.models import Word
+from app.word_catalog import general_words
 from telegram.utils import safe_send_message
 
 
@@ -61,12 +65,13 @@ class WordView(AuthenticationMixin, ListView):
     model = Word
     template_name = 'app/words.html'
     ordering = '-id'
+    paginate_by = 100
 
     def get_queryset(self):
-        qs = super().get_queryset()
         if self._user:
-            return qs.filter(user=self._user)
-        return qs.filter(user=None)
+            return super().get_queryset().filter(user=self._user)
+        # в общем каталоге сотни тысяч слов: Paginator берет из него только страницу
+        return general_words.get_newest_first()
 
 
 class CreateWordsView(AuthenticationMixin, TemplateFormMixin, FormView):
@@ -96,3 +101,9 @@ class CreateWordsView(AuthenticationMixin, TemplateFormMixin, FormView):
         words = [Word(text=text, translate=translate, phrase=phrase, user=self._user)
                  for text, translate, phrase in form.get_translates()]
         Word.objects.bulk_create(words, batch_size=500)
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class MetricsView(View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(metrics.collect())
@@ -0,0 +1,224 @@
+"""
+Каталог общих слов (Word.user=None) в памяти процесса
+
+Общие слова одинаковы для всех пользователей и меняются редко, поэтому очередь изучения
+(app.learning_queue), inline-запрос бота и список общих слов на сайте берут их отсюда.
+
+Хранение компактное: id и дата создания - в array, text, translate и phrase всех слов -
+в одном utf-8 буфере со смещениями: ~65 MB на 1М слов против ~500 MB списком Word
+(python -m benchmarks.word_catalog).
+Поиск следующих слов после id - bisect по отсортированным id.
+
+Каталог неизменяемый: обновление собирает новый и подменяет ссылку, читатели не блокируются.
+Раз в GENERAL_WORDS_REFRESH_INTERVAL догружаются новые слова (id больше последнего);
+если у загруженных слов не сошлись количество (слово удалили) или max(date_updated)
+(слово изменили), или прошло GENERAL_WORDS_RELOAD_INTERVAL - каталог загружается целиком.
+В процессах бота изменение и удаление общих слов приходит сразу через NOTIFY user_state
+(app.state_cache), в web-процессе (список общих слов на сайте) - при следующем refresh.
+
+Слова из каталога - объекты Word, у которых загружены только id, text, translate, phrase
+и date_created; остальные поля (данные словаря) загрузятся из БД при обращении.
+"""
+import array
+import bisect
+import threading
+import time
+import typing
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, Max
+
+from app import metrics
+from app.models import Word
+
+FIELDS = ('id', 'text', 'translate', 'phrase', 'date_created')
+STRING_FIELDS_COUNT = 3  # text, translate, phrase
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class WordsCatalog:
+    """ Неизменяемый набор слов, отсортированных по id """
+
+    def __init__(self, ids: array.array, created: array.array, offsets: array.array, data: bytes):
+        self.ids = ids
+        self.created = created  # date_created в микросекундах от EPOCH
+        # границы строк в data: у слова в позиции i text - data[offsets[3i]:offsets[3i + 1]] и т.д.
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def build(cls, rows: typing.Iterable[tuple],
+              base: typing.Optional['WordsCatalog'] = None) -> 'WordsCatalog':
+        """ rows: (id, text, translate, phrase, date_created) по возрастанию id, после слов base """
+        ids = array.array('I', base.ids if base else ())
+        created = array.array('q', base.created if base else ())
+        offsets = array.array('I', base.offsets if base else (0,))
+        data = bytearray(base.data if base else b'')
+        for word_id, text, translate, phrase, date_created in rows:
+            ids.append(word_id)
+            created.append((date_created - EPOCH) // MICROSECOND)
+            for value in (text, translate, phrase):
+                data += value.encode('utf-8')
+                offsets.append(len(data))
+        return cls(ids, created, offsets, bytes(data))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def last_id(self) -> int:
+        return self.ids[-1] if self.ids else 0
+
+    def get_memory_size(self) -> int:
+        return sum(
+            values.itemsize * len(values) for values in (self.ids, self.created, self.offsets)
+        ) + len(self.data)
+
+    def get_word(self, position: int) -> Word:
+        start = position * STRING_FIELDS_COUNT
+        text, translate, phrase = (
+            self.data[self.offsets[start + number]:self.offsets[start + number + 1]].decode('utf-8')
+            for number in range(STRING_FIELDS_COUNT)
+        )
+        values = {
+            'id': self.ids[position],
+            'date_created': EPOCH + self.created[position] * MICROSECOND,
+            'text': text,
+            'translate': translate,
+            'user_id': None,
+            'phrase': phrase,
+        }
+        # from_db ждет значения в порядке полей модели, отсутствующие поля будут deferred
+        return Word.from_db(DEFAULT_DB_ALIAS, values.keys(), [
+            values[field.attname] for field in Word._meta.concrete_fields
+            if field.attname in values
+        ])
+
+    def get_after(self, word_id: int, count: int) -> typing.List[Word]:
+        """ count слов с id больше word_id """
+        start = bisect.bisect_right(self.ids, word_id)
+        end = min(start + count, len(self.ids))
+        return [self.get_word(position) for position in range(start, end)]
+
+
+class NewestWords:
+    """
+    Слова каталога от новых к старым для django Paginator (список общих слов на сайте):
+    Word создаются только для запрошенной страницы
+    """
+
+    def __init__(self, catalog: WordsCatalog):
+        self.catalog = catalog
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __getitem__(self, index: typing.Union[int, slice]):
+        positions = range(len(self.catalog) - 1, -1, -1)[index]
+        if isinstance(index, slice):
+            return [self.catalog.get_word(position) for position in positions]
+        return self.catalog.get_word(positions)
+
+
+class GeneralWordsCatalog:
+    def __init__(self, refresh_interval: float, reload_interval: float):
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._catalog: typing.Optional[WordsCatalog] = None
+        # max(date_updated) слов каталога: изменение слова (save) его увеличит
+        self._max_updated: typing.Optional[datetime] = None
+        self._refreshed_at = 0
+        self._reloaded_at = 0
+        self._is_reload_needed = False
+        self._counters = metrics.Counters('lookups', 'refreshes', 'reloads', 'added_words')
+
+    def get_after(self, word_id: int, count: int) -> typing.List[Word]:
+        self._counters.incr('lookups')
+        return self._get_catalog().get_after(word_id, count)
+
+    def get_last(self) -> typing.Optional[Word]:
+        catalog = self._get_catalog()
+        return catalog.get_word(len(catalog) - 1) if len(catalog) else None
+
+    def get_newest_first(self) -> 'NewestWords':
+        return NewestWords(self._get_catalog())
+
+    def invalidate(self):
+        """ Общие слова изменились: при следующем обращении каталог загрузится целиком """
+        self._is_reload_needed = True
+
+    def _get_catalog(self) -> WordsCatalog:
+        now = time.monotonic()
+        catalog = self._catalog
+        if catalog is not None and not self._is_reload_needed \
+                and now - self._refreshed_at < self.refresh_interval:
+            return catalog
+
+        # обновляет один поток, остальные пока читают старый каталог
+        if not self._lock.acquire(blocking=catalog is None):
+            return catalog
+        try:
+            if self._catalog is None or self._is_reload_needed \
+                    or now - self._reloaded_at >= self.reload_interval:
+                self._reload(now)
+            elif now - self._refreshed_at >= self.refresh_interval:
+                self._refresh(now)
+            return self._catalog
+        finally:
+            self._lock.release()
+
+    def _reload(self, now: float):
+        self._is_reload_needed = False
+        self._max_updated = None
+        words = Word.objects.filter(user=None).order_by('id').values_list(*FIELDS, 'date_updated')
+        self._catalog = WordsCatalog.build(self._track_updated(words.iterator(chunk_size=10000)))
+        self._reloaded_at = self._refreshed_at = now
+        self._counters.incr('reloads')
+
+    def _refresh(self, now: float):
+        catalog = self._catalog
+        loaded = Word.objects.filter(user=None, id__lte=catalog.last_id).aggregate(
+            count=Count('id'), max_updated=Max('date_updated'),
+        )
+        if loaded['count'] != len(catalog) or loaded['max_updated'] != self._max_updated:
+            # слова удалили или изменили
+            self._reload(now)
+            return
+
+        new_words = list(self._track_updated(
+            Word.objects
+            .filter(user=None, id__gt=catalog.last_id)
+            .order_by('id')
+            .values_list(*FIELDS, 'date_updated')
+        ))
+        if new_words:
+            self._catalog = WordsCatalog.build(new_words, base=catalog)
+            self._counters.incr('added_words', len(new_words))
+        self._refreshed_at = now
+        self._counters.incr('refreshes')
+
+    def _track_updated(self, rows: typing.Iterable[tuple]) -> typing.Iterator[tuple]:
+        """ Строки FIELDS + date_updated -> строки FIELDS, запоминает max(date_updated) """
+        for *fields, date_updated in rows:
+            if self._max_updated is None or date_updated > self._max_updated:
+                self._max_updated = date_updated
+            yield fields
+
+    def get_metrics(self) -> dict:
+        catalog = self._catalog
+        return {
+            'words': len(catalog) if catalog else 0,
+            'memory_bytes': catalog.get_memory_size() if catalog else 0,
+            **self._counters.as_dict(),
+        }
+
+
+general_words = GeneralWordsCatalog(
+    refresh_interval=settings.GENERAL_WORDS_REFRESH_INTERVAL.total_seconds(),
+    reload_interval=settings.GENERAL_WORDS_RELOAD_INTERVAL.total_seconds(),
+)
+metrics.register('general_words', general_words.get_metrics)
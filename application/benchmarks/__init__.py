@@ -0,0 +1,13 @@
+"""
+Бенчмарки горячих путей бота
+
+    cd application
+    python -m benchmarks.get_user
+"""
+import os
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    import django
+    django.setup()
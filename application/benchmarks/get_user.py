@@ -0,0 +1,110 @@
+"""
+Запросы в БД и время на определение пользователя для одного обновления
+
+Сравнивает прежний get_or_create + save(username) + learning_status (с prefetch),
+telegram.users.resolve_user и resolve_user с кэшем app.state_cache.
+Создает пользователей с chat_id, начинающимся на bench-, и удаляет их в конце.
+
+    python -m benchmarks.get_user --iterations 500
+"""
+import time
+import uuid
+from argparse import ArgumentParser
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from app.models import LearningStatus, User, Word, WordStatus  # noqa: E402
+from app.state_cache import state_cache  # noqa: E402
+from telegram.users import resolve_user  # noqa: E402
+
+
+def legacy_get_user(chat_id, username):
+    """ get_user до перехода на resolve_user """
+    user, _ = User.objects.get_or_create(chat_id=chat_id, defaults=dict(username=username))
+    if user.username != username:
+        user.username = username
+        user.save(update_fields=('username',))
+    return user
+
+
+def new_get_user(chat_id, username):
+    return resolve_user(chat_id, username)[0]
+
+
+def touch_learning_status(user: User):
+    """ что обычно читают хэндлеры """
+    learning_status = user.learning_status
+    if learning_status.repetition_word_status:
+        learning_status.repetition_word_status.word.text  # noqa: B018
+    learning_status.learn_word  # noqa: B018
+
+
+def count_queries(get_user, chat_id, username) -> int:
+    with CaptureQueriesContext(connection) as context:
+        touch_learning_status(get_user(chat_id, username))
+    return len(context.captured_queries)
+
+
+def create_user_with_words(chat_id, words_count=5):
+    user = User.objects.create(chat_id=chat_id, username='bench')
+    learning_status = LearningStatus.objects.create(user=user)
+    words = Word.objects.bulk_create([
+        Word(text=f'bench{number}', translate='бенч', user=user) for number in range(words_count)
+    ])
+    word_statuses = WordStatus.objects.bulk_create([
+        WordStatus(user=user, word=word) for word in words
+    ])
+    learning_status.repeat_word_ids = [word_status.id for word_status in word_statuses]
+    learning_status.repetition_word_status = word_statuses[0]
+    learning_status.learn_word = words[-1]
+    learning_status.save()
+    return user
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=300)
+    args = parser.parse_args()
+
+    prefix = f'bench-{uuid.uuid4().hex[:8]}'
+    try:
+        existing = create_user_with_words(f'{prefix}-existing')
+        print(f'{"case":<32}{"legacy":>8}{"new":>8}  queries per update')
+        for case, chat_id_suffix, username in (
+            ('new user', 'new', 'bench'),
+            ('existing user', 'existing', 'bench'),
+            ('existing user, new username', 'existing', 'renamed'),
+        ):
+            legacy = count_queries(legacy_get_user, f'{prefix}-legacy-{chat_id_suffix}'
+                                   if chat_id_suffix == 'new' else existing.chat_id, username)
+            User.objects.filter(id=existing.id).update(username='bench')
+            new = count_queries(new_get_user, f'{prefix}-{chat_id_suffix}'
+                                if chat_id_suffix == 'new' else existing.chat_id, username)
+            User.objects.filter(id=existing.id).update(username='bench')
+            print(f'{case:<32}{legacy:>8}{new:>8}')
+
+        print(f'\n{"":<32}{"legacy":>8}{"new":>8}{"cached":>8}  ms per update (existing user)')
+        timings = []
+        for get_user in (legacy_get_user, new_get_user, None):
+            if get_user is None:
+                state_cache.start()
+                while not state_cache.is_enabled:
+                    time.sleep(0.1)
+                get_user = new_get_user
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                touch_learning_status(get_user(existing.chat_id, 'bench'))
+            timings.append((time.perf_counter() - started) / args.iterations * 1000)
+        print(f'{"":<32}' + ''.join(f'{timing:>8.2f}' for timing in timings))
+        print(f'state cache: {state_cache.get_metrics()}')
+    finally:
+        User.objects.filter(chat_id__startswith=prefix).delete()
+
+
+if __name__ == '__main__':
+    main()
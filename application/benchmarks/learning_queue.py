@@ -0,0 +1,154 @@
+"""
+Очередь изучения слов (app.learning_queue): планы запросов, запросы и время на одно обновление
+
+Создает общие слова и пользователя со своими словами (text начинается на bench-),
+проверяет, что запросы очереди идут только по индексам app_word (без Seq Scan и сортировки
+таблицы) на объеме, близком к боевому, и сравнивает с прежним next_learn_word.
+Общие слова новая очередь берет из каталога в памяти (app.word_catalog).
+В конце созданное удаляется. Index-only план очереди на тестовой базе проверяет
+app.tests.test_learning_queue.
+Запускать на dev базе: пока идет бенчмарк, созданные общие слова видны пользователям.
+
+    python -m benchmarks.learning_queue --general-words 200000
+"""
+import time
+import uuid
+from argparse import ArgumentParser
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from app.learning_queue import get_user_words  # noqa: E402
+from app.models import LearningStatus, User, Word  # noqa: E402
+from app.word_catalog import general_words  # noqa: E402
+from project.testing import get_plan_nodes  # noqa: E402
+
+UPCOMING_WORDS = 6
+
+
+def legacy_next_learn_word(learning_status: LearningStatus):
+    """ next_learn_word до app.learning_queue """
+    from_word_id = learning_status.learn_word_id or 0
+    user_word = Word.objects.filter(user_id=learning_status.user_id, id__gt=from_word_id).first()
+    if user_word:
+        return user_word
+    return Word.objects.filter(user=None, id__gt=from_word_id).first()
+
+
+def legacy_get_upcoming_learn_words(learning_status: LearningStatus, count: int):
+    from_word_id = learning_status.learn_word_id or 0
+    words = list(
+        Word.objects
+        .filter(user_id=learning_status.user_id, id__gt=from_word_id)
+        .order_by('id')[:count]
+    )
+    if len(words) < count:
+        last_word_id = words[-1].id if words else from_word_id
+        words += Word.objects.filter(
+            user=None, id__gt=last_word_id,
+        ).order_by('id')[:count - len(words)]
+    return words
+
+
+def learn_interaction(learning_status: LearningStatus, is_legacy: bool):
+    """ Чтения очереди в LearnWordRunner.run: слово выучено, показываем следующее """
+    if is_legacy:
+        word = legacy_next_learn_word(learning_status)  # set_learn_word
+        word = legacy_next_learn_word(learning_status)  # set_next_learn_word
+        learning_status.learn_word_id = word.id
+        legacy_next_learn_word(learning_status)  # choice_next_word
+        legacy_get_upcoming_learn_words(learning_status, UPCOMING_WORDS)  # prefetch_next_words
+    else:
+        word = learning_status.next_learn_word
+        word = learning_status.next_learn_word
+        learning_status.learn_word_id = word.id
+        learning_status.next_learn_word  # noqa: B018
+        learning_status.get_upcoming_learn_words(UPCOMING_WORDS)
+
+
+def check_plan(name: str, sql: str, params):
+    nodes = get_plan_nodes(sql, params)
+    word_scans = [node for node in nodes if node.get('Relation Name') == Word._meta.db_table]
+    indexes = sorted({node.get('Index Name') for node in word_scans})
+    seq_scans = [node for node in word_scans if 'Index' not in node['Node Type']]
+    print(f'{name:<36} {", ".join(str(index) for index in indexes)}')
+    assert not seq_scans, f'{name}: {[node["Node Type"] for node in seq_scans]}'
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--general-words', type=int, default=200000)
+    parser.add_argument('--user-words', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    prefix = f'bench-{uuid.uuid4().hex[:8]}'
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT count(*) FROM app_word')
+        print(f'app_word: {cursor.fetchone()[0]} words, add {args.general_words} general words')
+    user = User.objects.create(chat_id=prefix, username='bench')
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO app_word (text, translate, phrase, user_id, dictionary_text,
+                                      sound_url, image_url, date_created, date_updated)
+                SELECT %(prefix)s || number, 'бенч', '', CASE WHEN number <= %(user_words)s
+                    THEN %(user_id)s END, '', '', '', now(), now()
+                FROM generate_series(1, %(count)s) AS number
+                ''',
+                {'prefix': prefix, 'user_id': user.id, 'user_words': args.user_words,
+                 'count': args.general_words + args.user_words},
+            )
+            cursor.execute('ANALYZE app_word')
+
+        user_word_ids = list(Word.objects.filter(user=user).values_list('id', flat=True))
+        general_word_id = Word.objects.filter(user=None, text__startswith=prefix).first().id
+        cursors = {
+            'own words': user_word_ids[len(user_word_ids) // 2],
+            'own words are over': user_word_ids[-1],
+            'general words': general_word_id + args.general_words // 2,
+        }
+
+        print('\nplans (indexes on app_word)')
+        for name, from_id in cursors.items():
+            queryset = get_user_words(user.id, from_id, UPCOMING_WORDS + 1)
+            check_plan(f'queue: {name}', *queryset.query.sql_with_params())
+        for name, queryset in (
+            ('legacy: user word', Word.objects.filter(user=user, id__gt=0).order_by('id')[:1]),
+            ('legacy: general word', Word.objects.filter(user=None, id__gt=0).order_by('id')[:1]),
+        ):
+            check_plan(name, *queryset.query.sql_with_params())
+
+        general_words.invalidate()
+        general_words.get_last()  # загрузка каталога с общими словами бенчмарка
+        print(f'\n{"":<24}{"queries":>16}{"ms per update":>20}')
+        print(f'{"":<24}{"legacy":>8}{"new":>8}{"legacy":>10}{"new":>10}')
+        for name, from_id in cursors.items():
+            results = []
+            for is_legacy in (True, False):
+                with CaptureQueriesContext(connection) as context:
+                    learn_interaction(LearningStatus(user=user, learn_word_id=from_id), is_legacy)
+                started = time.perf_counter()
+                for _ in range(args.iterations):
+                    learn_interaction(LearningStatus(user=user, learn_word_id=from_id), is_legacy)
+                results.append((
+                    len(context.captured_queries),
+                    (time.perf_counter() - started) / args.iterations * 1000,
+                ))
+            (legacy_queries, legacy_time), (new_queries, new_time) = results
+            print(f'{name:<24}{legacy_queries:>8}{new_queries:>8}'
+                  f'{legacy_time:>10.2f}{new_time:>10.2f}')
+    finally:
+        with connection.cursor() as cursor:
+            # слова бенчмарка ни на что не ссылаются: без каскадного удаления через ORM
+            cursor.execute('DELETE FROM app_word WHERE text LIKE %s', [f'{prefix}%'])
+        user.delete()
+
+
+if __name__ == '__main__':
+    main()
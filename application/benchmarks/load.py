@@ -0,0 +1,321 @@
+"""
+Нагрузка на машину состояний: полные сессии изучения и повторения слов
+
+--users пользователей (chat_id начинается на bench-) с --words своими словами проходят сессию:
+/learn_words, "Учить" на каждое слово, /repetition и ответы до конца повторения
+(доля --mistakes ответов неверные, после них - верный ответ).
+Обновление обрабатывается как в telegram.handlers: get_user и LearnWordRunner / RepeatWord;
+--threads потоков обрабатывают пользователей параллельно, чат - всегда в одном потоке.
+Сообщения идут через outbox и sender без лимитов telegram в поддельный bot, который их
+только считает. Слова уже обогащены, запросов в skyeng нет.
+
+Выводит обновлений в секунду, задержку обновления p50/p95/p99, запросы и строки
+(возвращенные и измененные) на обновление - всего и по шагам сессии.
+--output сохраняет результат в JSON, --compare сравнивает с сохраненным результатом
+и отмечает ухудшения больше --threshold. В конце созданное удаляется.
+
+    python -m benchmarks.load --users 200 --words 10 --output load.json
+    python -m benchmarks.load --users 200 --words 10 --compare load.json
+"""
+import collections
+import json
+import queue
+import random
+import subprocess
+import threading
+import time
+import uuid
+from argparse import ArgumentParser
+
+from benchmarks import setup_django
+
+setup_django()
+
+import numpy as np  # noqa: E402
+import telebot  # noqa: E402
+from django.db import close_old_connections, connection  # noqa: E402
+
+from app.models import LearningStatus, User, Word  # noqa: E402
+from app.state_cache import state_cache  # noqa: E402
+from app.utils import get_datetime_now  # noqa: E402
+from telegram import constants, outbox  # noqa: E402
+from telegram import sender as sender_module  # noqa: E402
+from telegram.models import OutboxMessage  # noqa: E402
+from telegram.statuses_runners import LearnWordRunner, RepeatWord  # noqa: E402
+from telegram.utils import get_user  # noqa: E402
+
+LEARN_START = 'learn_start'
+LEARN = 'learn'
+REPEAT_START = 'repeat_start'
+REPEAT = 'repeat'
+STEPS = (LEARN_START, LEARN, REPEAT_START, REPEAT)
+
+# больше - лучше, для остальных метрик лучше меньше
+HIGHER_IS_BETTER = {'updates_per_second'}
+
+
+class FakeBot:
+    """ Вместо telebot.TeleBot в telegram.sender: считает сообщения по чатам """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = collections.Counter()
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        with self._lock:
+            self.sent[str(chat_id)] += 1
+
+    @property
+    def sent_count(self) -> int:
+        with self._lock:
+            return sum(self.sent.values())
+
+
+class QueryCounter:
+    """ connection.execute_wrapper: запросы и строки (rowcount: возвращенные или измененные) """
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries += 1
+        self.rows += max(context['cursor'].rowcount, 0)
+        return result
+
+
+class Session:
+    """ Сессия одного пользователя; обновления записываются в records """
+
+    def __init__(self, chat_id: str, words_count: int, mistakes: float, rng: random.Random,
+                 counter: QueryCounter, records: list):
+        self.chat_id = chat_id
+        self.words_count = words_count
+        self.mistakes = mistakes
+        self.rng = rng
+        self.counter = counter
+        self.records = records
+        self.message_id = 0
+
+    def run(self):
+        self.update(LEARN_START, constants.Handlers.learn_words.path)
+        for _ in range(self.words_count):
+            user = self.update(LEARN, constants.Commands.learn)
+        assert user.is_free, f'{self.chat_id}: learning is not finished'
+
+        user = self.update(REPEAT_START, constants.Handlers.repetition.path)
+        for _ in range(self.words_count * 10):
+            if not user.is_repetition:
+                return
+            text = user.learning_status.repetition_word_status.get_translated_word()
+            if self.rng.random() < self.mistakes:
+                text = 'bench-mistake'
+            user = self.update(REPEAT, text)
+        raise AssertionError(f'{self.chat_id}: repetition is not finished')
+
+    def update(self, step: str, text: str) -> User:
+        self.message_id += 1
+        message = telebot.types.Message.de_json({
+            'message_id': self.message_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': self.chat_id, 'type': 'private'},
+            'from': {'id': self.message_id, 'is_bot': False, 'first_name': 'bench',
+                     'username': 'bench'},
+        })
+        queries, rows = self.counter.queries, self.counter.rows
+        started = time.perf_counter()
+        user = handle_update(step, message)
+        self.records.append((
+            step, time.perf_counter() - started,
+            self.counter.queries - queries, self.counter.rows - rows,
+        ))
+        return user
+
+
+def handle_update(step: str, message: telebot.types.Message) -> User:
+    """ Как learn_words_handler, repeat_words_handler и text_handler """
+    user = get_user(message)
+    if step == LEARN_START:
+        LearnWordRunner(message=message, user=user).first_run()
+    elif step == REPEAT_START:
+        RepeatWord(message=message, user=user).first_run()
+    elif user.is_learning:
+        LearnWordRunner(message=message, user=user).run()
+    elif user.is_repetition:
+        RepeatWord(message=message, user=user).run()
+    return user
+
+
+def create_users(prefix: str, users_count: int, words_count: int) -> list:
+    users = User.objects.bulk_create([
+        User(chat_id=f'{prefix}-{number}', username='bench') for number in range(users_count)
+    ])
+    LearningStatus.objects.bulk_create([
+        LearningStatus(user=user, count_words=words_count) for user in users
+    ])
+    now = get_datetime_now()
+    Word.objects.bulk_create([
+        Word(text=f'bench{number}', translate=f'бенч{number}', user=user, date_enriched=now)
+        for user in users for number in range(words_count)
+    ])
+    return [user.chat_id for user in users]
+
+
+def run_sessions(chat_ids: list, args, records: list):
+    chats = queue.Queue()
+    for chat_id in chat_ids:
+        chats.put(chat_id)
+
+    def worker(number: int):
+        counter = QueryCounter()
+        rng = random.Random(args.seed + number)
+        try:
+            with connection.execute_wrapper(counter):
+                while True:
+                    try:
+                        chat_id = chats.get_nowait()
+                    except queue.Empty:
+                        return
+                    Session(chat_id, args.words, args.mistakes, rng, counter, records).run()
+        finally:
+            close_old_connections()
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def wait_sent(prefix: str, fake_bot: FakeBot, timeout=60):
+    """ Ждет, пока sender отправит сообщения outbox-а """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not OutboxMessage.objects.filter(chat_id__startswith=prefix).exists():
+            return
+        time.sleep(0.1)
+    print(f'not sent in {timeout}s: {fake_bot.sent_count} sent')
+
+
+def get_stats(records: list, seconds: float = None) -> dict:
+    latencies = np.array([latency for _, latency, _, _ in records]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    stats = {
+        'updates': len(records),
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(p95, 3),
+        'p99_ms': round(p99, 3),
+        'queries_per_update': round(sum(queries for *_, queries, _ in records) / len(records), 2),
+        'rows_per_update': round(sum(rows for *_, rows in records) / len(records), 2),
+    }
+    if seconds is not None:
+        stats['seconds'] = round(seconds, 3)
+        stats['updates_per_second'] = round(len(records) / seconds, 1)
+    return stats
+
+
+def get_commit() -> str:
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return result.stdout.decode().strip()
+
+
+def print_results(results: dict):
+    columns = ('updates', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_update', 'rows_per_update')
+    print(f'\n{"":<14}' + ''.join(f'{column:>20}' for column in columns))
+    for name, stats in (('total', results['total']), *results['steps'].items()):
+        print(f'{name:<14}' + ''.join(f'{stats[column]:>20}' for column in columns))
+    total = results['total']
+    print(f'\n{total["updates_per_second"]} updates/s, {total["seconds"]}s, '
+          f'{results["messages_per_update"]} messages per update')
+
+
+def compare(previous: dict, results: dict, threshold: float):
+    """ Ухудшения больше threshold отмечены ! """
+    print(f'\ncompare with {previous.get("commit") or "previous"} ({previous["date"]})')
+    print(f'{"":<36}{"previous":>12}{"current":>12}{"change":>10}')
+    sections = [('total', previous['total'], results['total'])] + [
+        (step, previous['steps'].get(step, {}), stats)
+        for step, stats in results['steps'].items()
+    ]
+    for section, old_stats, new_stats in sections:
+        for metric, value in new_stats.items():
+            old_value = old_stats.get(metric)
+            if metric in ('updates', 'seconds') or not old_value:
+                continue
+            change = (value - old_value) / old_value
+            is_worse = -change if metric in HIGHER_IS_BETTER else change
+            mark = ' !' if is_worse > threshold else ''
+            print(f'{section + " " + metric:<36}{old_value:>12}{value:>12}{change:>+10.1%}{mark}')
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--words', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--mistakes', type=float, default=0.1,
+                        help='Доля неверных ответов при повторении')
+    parser.add_argument('--warmup-users', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-state-cache', action='store_true',
+                        help='Без кэша состояния пользователей (USER_STATE_CACHE_SIZE=0)')
+    parser.add_argument('--output', help='Сохранить результат в JSON')
+    parser.add_argument('--compare', help='Сравнить с сохраненным результатом (JSON)')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    fake_bot = FakeBot()
+    sender_module.bot = fake_bot
+    outbox.sender = sender_module.OutboundScheduler(
+        send_func=sender_module.send_to_telegram, global_rate=10 ** 6, chat_rate=10 ** 6,
+        chat_burst=10 ** 6, threads_count=4, max_attempts=1,
+    )
+    if not args.no_state_cache:
+        state_cache.start()
+        while state_cache.max_size > 0 and not state_cache.is_enabled:
+            time.sleep(0.1)
+
+    prefix = f'bench-{uuid.uuid4().hex[:8]}'
+    try:
+        warmup_chat_ids = create_users(f'{prefix}-warmup', args.warmup_users, args.words)
+        chat_ids = create_users(prefix, args.users, args.words)
+        run_sessions(warmup_chat_ids, args, [])
+        wait_sent(prefix, fake_bot)
+        sent_before = fake_bot.sent_count
+
+        records = []
+        started = time.perf_counter()
+        run_sessions(chat_ids, args, records)
+        seconds = time.perf_counter() - started
+        wait_sent(prefix, fake_bot)
+
+        results = {
+            'date': get_datetime_now().isoformat(),
+            'commit': get_commit(),
+            'config': {
+                name: getattr(args, name)
+                for name in ('users', 'words', 'threads', 'mistakes', 'seed', 'no_state_cache')
+            },
+            'total': get_stats(records, seconds),
+            'steps': {
+                step: get_stats([record for record in records if record[0] == step])
+                for step in STEPS
+            },
+            'messages_per_update': round((fake_bot.sent_count - sent_before) / len(records), 2),
+        }
+        print_results(results)
+        if args.compare:
+            with open(args.compare) as file:
+                compare(json.load(file), results, args.threshold)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=2, ensure_ascii=False)
+            print(f'\nsaved to {args.output}')
+    finally:
+        User.objects.filter(chat_id__startswith=prefix).delete()
+        OutboxMessage.objects.filter(chat_id__startswith=prefix).delete()
+
+
+if __name__ == '__main__':
+    main()
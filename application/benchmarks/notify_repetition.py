@@ -0,0 +1,151 @@
+"""
+Выбор пользователей для telegram.tasks.notify_repetition: план и время одного запуска
+
+Прежний запрос соединял пользователей со всеми их WordStatus (DISTINCT + count),
+новый берет по индексу app_learningstatus_due_idx только тех, кому пора повторять,
+и ближайшее время следующего запуска. Сообщения не отправляются.
+Создает пользователей (chat_id начинается на bench-) со словами: у --due-users пора
+повторять, --notified-users уже оповещены, но не повторяли (все их слова пора повторять,
+прежний запрос проходил по ним при каждом запуске); в конце созданное удаляется.
+
+    python -m benchmarks.notify_repetition --users 20000 --words 20 --due-users 100
+"""
+import time
+import uuid
+from argparse import ArgumentParser
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from django.db.models import Min  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from app.models import LearningStatus, User, filter_notifiable  # noqa: E402
+from app.utils import get_datetime_now  # noqa: E402
+from benchmarks.learning_queue import get_plan_nodes  # noqa: E402
+
+CREATE_USERS = '''
+INSERT INTO app_user (chat_id, username, status, timezone, quiet_hours_start, quiet_hours_end,
+                      date_created, date_updated)
+SELECT %(prefix)s || number, 'bench', %(status)s, 'UTC', '00:00', '00:00', now(), now()
+FROM generate_series(1, %(users)s) AS number;
+
+INSERT INTO app_word (text, translate, phrase, user_id, dictionary_text,
+                      sound_url, image_url, date_created, date_updated)
+SELECT %(prefix)s || number, 'бенч', '', u.id, '', '', '', now(), now()
+FROM generate_series(1, %(words)s) AS number, app_user u
+WHERE u.chat_id = %(prefix)s || 1;
+
+-- номер пользователя n: n <= due_users - одно слово пора повторять,
+-- n <= due_users + notified_users - пора повторять все слова, остальным - через день
+INSERT INTO app_wordstatus (user_id, word_id, start_repetition_time, count_repetitions,
+                            number_not_guess, date_created, date_updated)
+SELECT u.id, w.id,
+    CASE WHEN u.n <= %(due_users)s AND w.id = first_word.id
+            OR u.n > %(due_users)s AND u.n <= %(due_users)s + %(notified_users)s
+        THEN now() - interval '1 hour' ELSE now() + interval '1 day' END,
+    0, 0, now(), now()
+FROM (
+    SELECT id, substr(chat_id, length(%(prefix)s) + 1)::int AS n FROM app_user
+    WHERE chat_id LIKE %(prefix)s || '%%'
+) AS u
+CROSS JOIN (SELECT id FROM app_user WHERE chat_id = %(prefix)s || 1) AS first
+JOIN app_word w ON w.user_id = first.id
+CROSS JOIN (SELECT min(id) AS id FROM app_word WHERE text LIKE %(prefix)s || '%%') AS first_word;
+
+INSERT INTO app_learningstatus (user_id, count_words, repeat_word_ids, next_repetition_time,
+                                repetition_notified, date_created, date_updated)
+SELECT u.id, 5, '{}', (SELECT min(start_repetition_time) FROM app_wordstatus WHERE user_id = u.id),
+    CASE WHEN substr(u.chat_id, length(%(prefix)s) + 1)::int > %(due_users)s
+        AND substr(u.chat_id, length(%(prefix)s) + 1)::int <= %(due_users)s + %(notified_users)s
+        THEN now() END,
+    now(), now()
+FROM app_user u WHERE u.chat_id LIKE %(prefix)s || '%%';
+
+ANALYZE app_user;
+ANALYZE app_wordstatus;
+ANALYZE app_learningstatus;
+'''
+
+DELETE_USERS = '''
+DELETE FROM app_learningstatus WHERE user_id IN (
+    SELECT id FROM app_user WHERE chat_id LIKE %(prefix)s || '%%');
+DELETE FROM app_wordstatus WHERE user_id IN (
+    SELECT id FROM app_user WHERE chat_id LIKE %(prefix)s || '%%');
+DELETE FROM app_word WHERE text LIKE %(prefix)s || '%%';
+DELETE FROM app_user WHERE chat_id LIKE %(prefix)s || '%%';
+'''
+
+
+def legacy_select():
+    """ notify_repetition до LearningStatus.next_repetition_time """
+    users = User.objects.filter(
+        status=User.Status.FREE,
+        learned_words__start_repetition_time__lt=get_datetime_now(),
+        learningstatus__repetition_notified__isnull=True,
+    ).select_related('learningstatus').distinct()
+    users.count()
+    return list(users.iterator())
+
+
+def due_learning_statuses(now):
+    """ как в notify_repetition: с тихими часами в часовом поясе пользователя """
+    return filter_notifiable(LearningStatus.objects.filter(
+        repetition_notified__isnull=True,
+        next_repetition_time__lt=now,
+        user__status=User.Status.FREE,
+    ), now, 'user__').select_related('user')
+
+
+def new_select():
+    now = get_datetime_now()
+    learning_statuses = list(due_learning_statuses(now).iterator())
+    LearningStatus.objects.filter(
+        repetition_notified__isnull=True, next_repetition_time__gte=now,
+    ).aggregate(Min('next_repetition_time'))
+    return learning_statuses
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=20)
+    parser.add_argument('--due-users', type=int, default=100)
+    parser.add_argument('--notified-users', type=int, default=5000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    prefix = f'bench-{uuid.uuid4().hex[:8]}-'
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_USERS, {
+                'prefix': prefix, 'status': User.Status.FREE, 'users': args.users,
+                'words': args.words, 'due_users': args.due_users,
+                'notified_users': args.notified_users,
+            })
+
+        nodes = get_plan_nodes(*due_learning_statuses(get_datetime_now()).query.sql_with_params())
+        print(f'plan: {", ".join(node["Node Type"] for node in nodes)}')
+        assert any(node.get('Index Name') == 'app_learningstatus_due_idx' for node in nodes)
+        assert not any(node['Node Type'] == 'Seq Scan' for node in nodes
+                       if node.get('Relation Name') == LearningStatus._meta.db_table)
+
+        print(f'\n{args.users} users x {args.words} words{"queries":>16}{"users":>8}{"ms":>10}')
+        for variant in (legacy_select, new_select):
+            with CaptureQueriesContext(connection) as context:
+                users = variant()
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                variant()
+            spent = (time.perf_counter() - started) / args.iterations * 1000
+            print(f'{variant.__name__:<30}{len(context.captured_queries):>10}'
+                  f'{len(users):>8}{spent:>10.2f}')
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(DELETE_USERS, {'prefix': prefix})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Запросы в БД и время на сессию повторения: начало, ответ, завершение
+
+Начало: слова, которые пора повторять (--due-words), добавляются в сессию одним UPDATE.
+Ответ: следующее слово в сессии из --due-words слов - bisect по LearningStatus.repeat_word_ids
+и загрузка одного слова против прежнего M2M repeat_words (все слова сессии со словами
+загружались на каждое обновление, следующее искалось фильтром и сортировкой в python).
+Завершение: прежнее сохранение каждого WordStatus (save + debug лог со словом)
+против WordStatus.set_next_repetition_times (один UPDATE).
+Изменения откатываются, созданные пользователи (chat_id начинается на bench-) удаляются в конце.
+
+    python -m benchmarks.repetition --words 50 --due-words 10000
+"""
+import time
+import uuid
+from argparse import ArgumentParser
+from datetime import timedelta
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from app.models import LearningStatus, User, WordStatus  # noqa: E402
+from app.utils import get_datetime_now, safe_str  # noqa: E402
+from benchmarks.get_user import create_user_with_words  # noqa: E402
+
+
+def start(learning_status: LearningStatus):
+    """ RepeatWord.first_run """
+    learning_status.add_words_for_repetition()
+    learning_status.get_next_repeat_word_status(start_repetition=True).word  # noqa: B018
+
+
+def legacy_answer(learning_status: LearningStatus):
+    """ get_next_repeat_word_status до repeat_word_ids (с загрузкой repeat_words в resolve_user) """
+    repeat_words = WordStatus.objects.filter(
+        id__in=learning_status.repeat_word_ids,
+    ).select_related('word')
+    next_repeat_words = filter(
+        lambda x: x.id > learning_status.repetition_word_status_id, repeat_words,
+    )
+    sorted(next_repeat_words, key=lambda x: x.id)[0].word  # noqa: B018
+
+
+def answer(learning_status: LearningStatus):
+    learning_status.get_next_repeat_word_status().word  # noqa: B018
+
+
+def legacy_finish(learning_status: LearningStatus):
+    """ update_repetition_time_for_repeated_words до WordStatus.set_next_repetition_times """
+    now = get_datetime_now()
+    repeated_ids = [word_status_id for word_status_id in learning_status.repeat_word_ids
+                    if word_status_id < learning_status.repetition_word_status_id]
+    for word_status in WordStatus.objects.filter(id__in=repeated_ids):
+        # прежний WordStatus.increase_repetitions
+        word_status.count_repetitions += 1
+        next_repetition_time = settings.REPETITION_TIMES.get(word_status.count_repetitions)
+        if next_repetition_time:
+            word_status.start_repetition_time = now + next_repetition_time
+        else:
+            word_status.start_repetition_time = None
+        word_status.save(update_fields=('count_repetitions', 'start_repetition_time'))
+        safe_str(str(word_status.word))  # аргумент logger.debug
+
+
+def finish(learning_status: LearningStatus):
+    learning_status.update_repetition_time_for_repeated_words()
+
+
+def create_user_with_due_words(chat_id, words_count: int) -> User:
+    """ Слова, которые пора повторять; десятая часть уже добавлена в сессию """
+    user = create_user_with_words(chat_id, words_count=words_count)
+    learning_status = user.learning_status
+    WordStatus.objects.filter(user=user).update(
+        start_repetition_time=get_datetime_now() - timedelta(hours=1),
+    )
+    learning_status.repeat_word_ids = learning_status.repeat_word_ids[:words_count // 10]
+    learning_status.save(update_fields=('repeat_word_ids',))
+    return user
+
+
+def run(variant, user: User, cursor_position: int):
+    """ variant над learning_status, курсор - слово сессии в позиции cursor_position """
+    learning_status = LearningStatus.objects.get(user=user)
+    learning_status.repetition_word_status_id = learning_status.repeat_word_ids[cursor_position]
+    with transaction.atomic():
+        variant(learning_status)
+        transaction.set_rollback(True)
+
+
+def measure(name: str, variants, user: User, cursor_position: int, iterations: int):
+    print(f'\n{name:<36}' + ''.join(f'{variant.__name__:>14}' for variant in variants))
+    results = []
+    for variant in variants:
+        with CaptureQueriesContext(connection) as context:
+            run(variant, user, cursor_position)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            run(variant, user, cursor_position)
+        results.append((
+            len(context.captured_queries),
+            (time.perf_counter() - started) / iterations * 1000,
+        ))
+    print(f'{"queries":<36}' + ''.join(f'{queries:>14}' for queries, _ in results))
+    print(f'{"ms":<36}' + ''.join(f'{ms:>14.2f}' for _, ms in results))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--words', type=int, default=50)
+    parser.add_argument('--due-words', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    prefix = f'bench-{uuid.uuid4().hex[:8]}'
+    try:
+        user = create_user_with_due_words(f'{prefix}-due', args.due_words)
+        measure(f'start, {args.due_words} due words', (start,), user, 0, args.iterations)
+        User.objects.get(id=user.id).learning_status.add_words_for_repetition()
+        measure(f'answer, {args.due_words} words in session', (legacy_answer, answer),
+                user, args.due_words // 2, args.iterations)
+
+        # последнее слово - текущее, повторены все слова до него
+        user = create_user_with_words(prefix, words_count=args.words + 1)
+        measure(f'finish, {args.words} repeated words', (legacy_finish, finish),
+                user, -1, args.iterations)
+        assert not WordStatus.objects.filter(user=user, count_repetitions__gt=0).exists()
+    finally:
+        User.objects.filter(chat_id__startswith=prefix).delete()
+
+
+if __name__ == '__main__':
+    main()
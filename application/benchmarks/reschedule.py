@@ -0,0 +1,136 @@
+"""
+Ночной перенос слов по алгоритмам повторения (manage.py reschedule_words)
+
+Прежний способ - по объекту: WordStatus с пользователем, интервал каждого слова
+отдельным вызовом алгоритма, bulk_update (на --legacy-words словах).
+Новый - WordStatus.reschedule: части по --chunk-size слов, интервалы части - массивами numpy
+по алгоритмам, один UPDATE изменившихся слов (next_repetition_time пересчитывает триггер).
+Второй проход нового способа ничего не меняет - только чтение и расчет.
+Создает пользователей (chat_id начинается на bench-) с алгоритмами fixed, sm2, fsrs по кругу
+и --words словами, ожидающими повторения; в конце созданное удаляется.
+
+    python -m benchmarks.reschedule --users 1000 --words 1000
+"""
+import time
+import uuid
+from argparse import ArgumentParser
+from datetime import timedelta
+
+from benchmarks import setup_django
+
+setup_django()
+
+import numpy as np  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+
+from app import scheduling  # noqa: E402
+from app.models import WordStatus  # noqa: E402
+
+CREATE_USERS = '''
+INSERT INTO app_user (chat_id, username, status, timezone, quiet_hours_start, quiet_hours_end,
+                      repetition_algorithm, date_created, date_updated)
+SELECT %(prefix)s || number, 'bench', 'free', 'UTC', '00:00', '00:00',
+    (%(algorithms)s::text[])[number %% 3 + 1], now(), now()
+FROM generate_series(1, %(users)s) AS number;
+
+INSERT INTO app_word (text, translate, phrase, user_id, dictionary_text,
+                      sound_url, image_url, date_created, date_updated)
+SELECT %(prefix)s || number, 'бенч', '', u.id, '', '', '', now(), now()
+FROM generate_series(1, %(words)s) AS number, app_user u
+WHERE u.chat_id = %(prefix)s || 1;
+
+-- состояние после 1..4 повторений, start_repetition_time не совпадает с расчетным
+INSERT INTO app_wordstatus (user_id, word_id, count_repetitions, number_not_guess,
+                            repetition_mistakes, stability, difficulty, ease_factor,
+                            last_repetition_time, start_repetition_time,
+                            date_created, date_updated)
+SELECT u.id, w.id, 1 + floor(random() * 4), 0, 0, 1 + random() * 30, 1 + random() * 9,
+    1.3 + random() * 1.5, now() - random() * interval '30 days', now(), now(), now()
+FROM app_user u
+CROSS JOIN (SELECT id FROM app_user WHERE chat_id = %(prefix)s || 1) AS first
+JOIN app_word w ON w.user_id = first.id
+WHERE u.chat_id LIKE %(prefix)s || '%%';
+
+INSERT INTO app_learningstatus (user_id, count_words, repeat_word_ids, date_created, date_updated)
+SELECT id, 5, '{}', now(), now() FROM app_user WHERE chat_id LIKE %(prefix)s || '%%';
+
+ANALYZE app_user;
+ANALYZE app_wordstatus;
+'''
+
+DELETE_USERS = '''
+DELETE FROM app_learningstatus WHERE user_id IN (
+    SELECT id FROM app_user WHERE chat_id LIKE %(prefix)s || '%%');
+DELETE FROM app_wordstatus WHERE user_id IN (
+    SELECT id FROM app_user WHERE chat_id LIKE %(prefix)s || '%%');
+DELETE FROM app_word WHERE text LIKE %(prefix)s || '%%';
+DELETE FROM app_user WHERE chat_id LIKE %(prefix)s || '%%';
+'''
+
+
+def legacy_reschedule(word_statuses):
+    """ По объекту: интервал каждого слова отдельно, bulk_update """
+    word_statuses = list(word_statuses.select_related('user'))
+    for word_status in word_statuses:
+        scheduler = scheduling.get_scheduler(word_status.user.repetition_algorithm)
+        words = scheduling.Words(
+            np.array([word_status.count_repetitions]), np.array([word_status.stability]),
+            np.array([word_status.difficulty]), np.array([word_status.ease_factor]),
+        )
+        interval = scheduling.get_intervals(scheduler, words)[0]
+        word_status.start_repetition_time = (
+            None if np.isnan(interval)
+            else word_status.last_repetition_time + timedelta(days=interval)
+        )
+    WordStatus.objects.bulk_update(word_statuses, ('start_repetition_time',), batch_size=1000)
+    return len(word_statuses)
+
+
+def reschedule(first_id: int, chunk_size: int):
+    processed = changed = 0
+    for _, count, chunk_changed in WordStatus.reschedule(last_id=first_id - 1,
+                                                         chunk_size=chunk_size):
+        processed += count
+        changed += chunk_changed
+    return processed, changed
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--words', type=int, default=1000)
+    parser.add_argument('--legacy-words', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    prefix = f'bench-{uuid.uuid4().hex[:8]}-'
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_USERS, {
+                'prefix': prefix, 'users': args.users, 'words': args.words,
+                'algorithms': [scheduling.FIXED, scheduling.SM2, scheduling.FSRS],
+            })
+        bench_words = WordStatus.objects.filter(user__chat_id__startswith=prefix).order_by('id')
+        first_id = bench_words.values_list('id', flat=True).first()
+
+        print(f'\n{"":<28}{"words":>10}{"changed":>10}{"s":>8}{"words/s":>12}')
+        with transaction.atomic():
+            started = time.perf_counter()
+            count = legacy_reschedule(bench_words[:args.legacy_words])
+            seconds = time.perf_counter() - started
+            transaction.set_rollback(True)
+        print(f'{"legacy, per object":<28}{count:>10}{count:>10}{seconds:>8.2f}'
+              f'{count / seconds:>12.0f}')
+
+        for name in ('reschedule', 'reschedule, no changes'):
+            started = time.perf_counter()
+            count, changed = reschedule(first_id, args.chunk_size)
+            seconds = time.perf_counter() - started
+            print(f'{name:<28}{count:>10}{changed:>10}{seconds:>8.2f}{count / seconds:>12.0f}')
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(DELETE_USERS, {'prefix': prefix})
+
+
+if __name__ == '__main__':
+    main()
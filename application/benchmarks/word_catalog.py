@@ -0,0 +1,105 @@
+"""
+Каталог общих слов (app.word_catalog): память на N слов и время поиска слов после id
+
+Память считается на сгенерированных словах (БД не нужна) и сравнивается с тем,
+как те же слова лежали бы в памяти списком кортежей (values_list) и списком объектов Word.
+Объекты Word создаются только для части слов (--sample), результат пересчитывается на N.
+С --db время bisect сравнивается с запросом общих слов в БД (по индексу app_word_general_id_idx).
+
+    python -m benchmarks.word_catalog --words 1000000 --db
+"""
+import gc
+import random
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import setup_django
+
+setup_django()
+
+from app.models import Word  # noqa: E402
+from app.word_catalog import WordsCatalog, general_words  # noqa: E402
+
+UPCOMING_WORDS = 7  # LearningQueue.batch_size с настройками по умолчанию
+WORDS = ('apple', 'make up one\'s mind', 'throughout', 'be going to', 'nevertheless', 'get')
+TRANSLATES = ('яблоко', 'решиться', 'повсюду', 'собираться', 'тем не менее', 'получать')
+
+
+def generate_rows(count: int):
+    started = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    for number in range(1, count + 1):
+        yield (
+            number,
+            f'{WORDS[number % len(WORDS)]} {number}',
+            f'{TRANSLATES[number % len(TRANSLATES)]} {number}',
+            '' if number % 3 else f'I {WORDS[number % len(WORDS)]} every day',
+            started + timedelta(seconds=number),
+        )
+
+
+def measure(build) -> (object, int):
+    """ Результат build и сколько памяти он занимает """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def build_words(rows):
+    words = []
+    for word_id, text, translate, phrase, date_created in rows:
+        words.append(Word(id=word_id, text=text, translate=translate, phrase=phrase,
+                          date_created=date_created, user_id=None))
+    return words
+
+
+def print_time(name: str, lookup, iterations: int, max_id: int):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        lookup(random.randint(0, max_id))
+    print(f'{name:<28}{(time.perf_counter() - started) / iterations * 1000:>10.3f} ms')
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--words', type=int, default=1000000)
+    parser.add_argument('--sample', type=int, default=100000)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--db', action='store_true', help='сравнить с запросом общих слов в БД')
+    args = parser.parse_args()
+
+    catalog, catalog_size = measure(lambda: WordsCatalog.build(generate_rows(args.words)))
+    _, tuples_size = measure(lambda: list(generate_rows(args.words)))
+    _, words_size = measure(lambda: build_words(generate_rows(min(args.sample, args.words))))
+    words_size = words_size * args.words // min(args.sample, args.words)
+
+    print(f'{args.words} general words, MB')
+    print(f'{"catalog":<28}{catalog_size / 2 ** 20:>10.1f}'
+          f' (arrays and buffer: {catalog.get_memory_size() / 2 ** 20:.1f})')
+    print(f'{"list of tuples":<28}{tuples_size / 2 ** 20:>10.1f}')
+    print(f'{"list of Word":<28}{words_size / 2 ** 20:>10.1f}')
+
+    print(f'\n{UPCOMING_WORDS} words after random id')
+    print_time('catalog (bisect)', lambda word_id: catalog.get_after(word_id, UPCOMING_WORDS),
+               args.iterations, args.words)
+    if args.db:
+        last_word = general_words.get_last()
+        max_id = last_word.id if last_word else 0
+        print(f'\n{UPCOMING_WORDS} words after random id, {general_words.get_metrics()["words"]}'
+              f' general words in db')
+        print_time('app.word_catalog', lambda word_id: general_words.get_after(
+            word_id, UPCOMING_WORDS,
+        ), args.iterations, max_id)
+        print_time('db query', lambda word_id: list(
+            Word.objects.filter(user=None, id__gt=word_id).order_by('id')[:UPCOMING_WORDS]
+        ), args.iterations, max_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,19 @@
+import asyncio
+import collections
+import concurrent.futures
+import json
 import logging
+import threading
+import time
 from http import HTTPStatus
 from json import JSONDecodeError
-from typing import TYPE_CHECKING, Optional, Tuple, Type, TypeVar, Union
+from typing import (
+    TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple, Type,
+    TypeVar, Union,
+)
 from urllib.parse import urljoin
 
+import aiohttp
 import pydantic
 import requests
 import requests.adapters
@@ -12,13 +22,27 @@ import urllib3
 if TYPE_CHECKING:
     SchemaModel = TypeVar('SchemaModel', bound='pydantic.BaseModel')
 
+logger = logging.getLogger(__name__)
+
 
 class Client:
+    """
+    retries - сколько раз повторить запрос при ошибке соединения и RETRY_STATUSES
+        (можно вместо этого использовать Session.create_with_retry_policy)
+    deadline - сколько секунд максимум занимает запрос вместе со всеми повторами
+    circuit_breaker - пока открыт, запросы сразу падают с CircuitOpenException
+    """
     base_url = ''
     session: requests.Session = None
     timeout: Union[None, int, Tuple[int, int]] = None
+    retries = 0
+    backoff_factor = 0.3
+    deadline: Optional[float] = None
+    circuit_breaker: Optional['CircuitBreaker'] = None
 
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None):
+        # base_url можно заменить, например, на локальный fake сервер
+        self.base_url = base_url or self.base_url
         self.session = self.session or requests.Session()
         self.logger = logging.getLogger(f'client.{self.__class__.__name__}')
 
@@ -27,24 +51,66 @@ class Client:
 
     def make_request(self, method, path, **kwargs) -> requests.Response:
         self.logger.info('Start request to path=%s', path)
+        is_trial = self.circuit_breaker and self.circuit_breaker.before_request()
         try:
-            response = self.session.request(
-                method=method,
-                url=urljoin(self.base_url, path),
-                timeout=self.timeout,
-                **kwargs,
-            )
-        except requests.exceptions.RequestException:
-            self.logger.exception('Fail get response path=%s', path)
-            raise ClientException('Fail request')
+            response = self._make_recorded_request(method, path, **kwargs)
+        finally:
+            if is_trial:
+                self.circuit_breaker.end_trial()
 
         if response.status_code >= HTTPStatus.BAD_REQUEST:
             self.logger.warning('Response with fail status=%s path=%s, content=%s',
                                 response.status_code, path, response.text)
-            raise
+            raise ClientException(f'Fail status {response.status_code}')
         self.logger.info('Got success response path=%s', path)
         return response
 
+    def _make_recorded_request(self, method, path, **kwargs) -> requests.Response:
+        """ Запрос с повторами, результат записывается в circuit_breaker """
+        try:
+            response = self._make_request_with_retries(
+                method, path, Deadline(self.deadline), **kwargs,
+            )
+        except ClientException:
+            if self.circuit_breaker:
+                self.circuit_breaker.record(is_success=False)
+            raise
+
+        if self.circuit_breaker:
+            # 4xx - ошибка запроса, а не сервиса
+            self.circuit_breaker.record(
+                is_success=response.status_code < HTTPStatus.INTERNAL_SERVER_ERROR,
+            )
+        return response
+
+    def _make_request_with_retries(self, method, path, deadline: 'Deadline',
+                                   **kwargs) -> requests.Response:
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff_factor * (2 ** (attempt - 1))
+                if deadline.remaining() <= delay:
+                    break
+                time.sleep(delay)
+
+            try:
+                response = self.session.request(
+                    method=method,
+                    url=urljoin(self.base_url, path),
+                    timeout=deadline.limit_timeout(self.timeout),
+                    **kwargs,
+                )
+            except requests.exceptions.RequestException as e:
+                self.logger.warning('Fail get response path=%s attempt=%d: %r', path, attempt, e)
+                continue
+
+            if response.status_code in RETRY_STATUSES:
+                self.logger.warning('Response with retry status=%s path=%s attempt=%d',
+                                    response.status_code, path, attempt)
+                continue
+            return response
+
+        raise ClientException('Fail request')
+
 
 class JSONClient(Client):
     def parse_json_response(
@@ -65,14 +131,335 @@ class JSONClient(Client):
             raise ClientException(f'{schema.__class__.__name__} can not parse response')
 
 
+class AsyncClient:
+    """
+    asyncio версия Client: пока ждем ответ, event loop обслуживает другие запросы
+
+    повторяет запрос при ошибках соединения и RETRY_STATUSES (как make_retry для Client)
+    """
+    base_url = ''
+    timeout: Optional[float] = None
+    retries = 3
+    backoff_factor = 0.3
+    deadline: Optional[float] = None
+    circuit_breaker: Optional['CircuitBreaker'] = None
+
+    # одна aiohttp сессия (пул соединений) на класс клиента и event loop
+    _sessions: Dict[tuple, aiohttp.ClientSession] = {}
+
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = base_url or self.base_url
+        self.logger = logging.getLogger(f'client.{self.__class__.__name__}')
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        key = (self.__class__, asyncio.get_event_loop())
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            session = self._sessions[key] = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout), trust_env=True,
+            )
+        return session
+
+    @classmethod
+    async def close_sessions(cls):
+        loop = asyncio.get_event_loop()
+        for key in [key for key in cls._sessions if key[1] is loop]:
+            await cls._sessions.pop(key).close()
+
+    async def get(self, path, **kwargs) -> bytes:
+        return await self.make_request('GET', path, **kwargs)
+
+    async def make_request(self, method, path, **kwargs) -> bytes:
+        self.logger.info('Start request to path=%s', path)
+        is_trial = self.circuit_breaker and self.circuit_breaker.before_request()
+        try:
+            status, body = await self._make_recorded_request(method, path, **kwargs)
+        finally:
+            # в том числе CancelledError: иначе half_open навсегда отклоняет запросы
+            if is_trial:
+                self.circuit_breaker.end_trial()
+
+        if status >= HTTPStatus.BAD_REQUEST:
+            self.logger.warning('Response with fail status=%s path=%s, content=%s',
+                                status, path, body)
+            raise ClientException(f'Fail status {status}')
+        self.logger.info('Got success response path=%s', path)
+        return body
+
+    async def _make_recorded_request(self, method, path, **kwargs) -> Tuple[int, bytes]:
+        try:
+            status, body = await self._make_request_with_retries(
+                method, path, Deadline(self.deadline), **kwargs,
+            )
+        except ClientException:
+            if self.circuit_breaker:
+                self.circuit_breaker.record(is_success=False)
+            raise
+
+        if self.circuit_breaker:
+            self.circuit_breaker.record(is_success=status < HTTPStatus.INTERNAL_SERVER_ERROR)
+        return status, body
+
+    async def _make_request_with_retries(self, method, path, deadline: 'Deadline',
+                                         **kwargs) -> Tuple[int, bytes]:
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff_factor * (2 ** (attempt - 1))
+                if deadline.remaining() <= delay:
+                    break
+                await asyncio.sleep(delay)
+
+            try:
+                async with self.session.request(
+                    method, urljoin(self.base_url, path),
+                    timeout=aiohttp.ClientTimeout(total=deadline.limit_timeout(self.timeout)),
+                    **kwargs,
+                ) as response:
+                    body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.logger.warning('Fail get response path=%s attempt=%d', path, attempt)
+                continue
+
+            if response.status in RETRY_STATUSES:
+                self.logger.warning('Response with retry status=%s path=%s attempt=%d',
+                                    response.status, path, attempt)
+                continue
+            return response.status, body
+
+        raise ClientException('Fail request')
+
+
+class AsyncJSONClient(AsyncClient):
+    def parse_json_response(self, body: bytes, schema: Type['SchemaModel']) -> 'SchemaModel':
+        try:
+            response_body = json.loads(body)
+        except JSONDecodeError:
+            self.logger.exception('Parse json error')
+            raise ClientException('Fail in parsing json body')
+
+        try:
+            return schema.parse_obj(response_body)
+        except pydantic.ValidationError:
+            self.logger.exception('Schema can not parse response')
+            raise ClientException(f'{schema.__class__.__name__} can not parse response')
+
+
 class ClientException(Exception):
     pass
 
 
+class CircuitOpenException(ClientException):
+    pass
+
+
+class Deadline:
+    """ Время, за которое должен завершиться запрос вместе с повторами (None - без ограничения) """
+
+    def __init__(self, seconds: Optional[float]):
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def limit_timeout(self, timeout):
+        """ Уменьшает timeout запроса (число или (connect, read)) до оставшегося времени,
+        (connect, read) - пропорционально, чтобы connect + read уложились в него """
+        remaining = self.remaining()
+        if remaining == float('inf'):
+            return timeout
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            # connect и read идут друг за другом: вместе они не должны превысить remaining
+            total = sum(timeout)
+            if total <= remaining:
+                return timeout
+            return tuple(value * remaining / total for value in timeout)
+        return min(timeout, remaining)
+
+
+class CircuitBreaker:
+    """
+    Если сервис часто отвечает ошибками, перестаем ходить в него на open_timeout секунд
+
+    closed - запросы идут, ошибки считаются в окне последних window секунд;
+        при min_requests запросах и доле ошибок >= error_rate переходит в open
+    open - запросы сразу падают с CircuitOpenException, через open_timeout - half_open
+    half_open - пропускает один пробный запрос: успех - closed, ошибка - снова open
+
+    потокобезопасный, используется и из потоков, и из event loop
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, window=60, min_requests=10, error_rate=0.5, open_timeout=30):
+        self.name = name
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_timeout = open_timeout
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._results: Deque[Tuple[float, bool]] = collections.deque()  # (время, успех)
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+        self._counters = dict.fromkeys(('successes', 'failures', 'rejected', 'opened'), 0)
+
+    def before_request(self) -> bool:
+        """ True - это пробный запрос half_open, после него нужно вызвать end_trial """
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_timeout:
+                    self._counters['rejected'] += 1
+                    raise CircuitOpenException(f'Circuit {self.name} is open')
+                self._state = self.HALF_OPEN
+                self._trial_in_progress = False
+
+            if self._state == self.HALF_OPEN:
+                if self._trial_in_progress:
+                    self._counters['rejected'] += 1
+                    raise CircuitOpenException(f'Circuit {self.name} is half open')
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def end_trial(self):
+        """ Пробный запрос завершился, даже без результата (отмена, исключение в коде) """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_progress = False
+
+    def record(self, is_success: bool):
+        with self._lock:
+            now = time.monotonic()
+            self._counters['successes' if is_success else 'failures'] += 1
+
+            if self._state == self.HALF_OPEN:
+                self._trial_in_progress = False
+                if is_success:
+                    self._state = self.CLOSED
+                    self._results.clear()
+                    logger.warning('Circuit %s closed', self.name)
+                else:
+                    self._open(now)
+                return
+            if self._state == self.OPEN:
+                return
+
+            self._results.append((now, is_success))
+            while self._results and self._results[0][0] < now - self.window:
+                self._results.popleft()
+            if len(self._results) < self.min_requests:
+                return
+            failures = sum(1 for _, success in self._results if not success)
+            if failures / len(self._results) >= self.error_rate:
+                self._open(now)
+
+    def _open(self, now: float):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._counters['opened'] += 1
+        logger.warning('Circuit %s opened for %s seconds', self.name, self.open_timeout)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def get_metrics(self) -> dict:
+        state = self.state
+        with self._lock:
+            failures = sum(1 for _, success in self._results if not success)
+            return {
+                'state': state,
+                'window_requests': len(self._results),
+                'window_failures': failures,
+                **self._counters,
+            }
+
+
+class SingleFlight:
+    """
+    Одновременные одинаковые запросы (с одним key) выполняются один раз,
+    остальные вызовы ждут и получают тот же результат или то же исключение
+
+    работает между потоками (do) и между asyncio задачами (do_async), в том числе вперемешку:
+    in-flight запрос хранится как concurrent.futures.Future
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, concurrent.futures.Future] = {}
+        self._counters = dict.fromkeys(('calls', 'coalesced'), 0)
+
+    def _join(self, key: Hashable) -> Tuple[concurrent.futures.Future, bool]:
+        """ (future, True - вызывающий должен выполнить запрос сам) """
+        with self._lock:
+            self._counters['calls'] += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._counters['coalesced'] += 1
+                return future, False
+            future = self._in_flight[key] = concurrent.futures.Future()
+            return future, True
+
+    def _finish(self, key: Hashable):
+        with self._lock:
+            del self._in_flight[key]
+
+    def do(self, key: Hashable, func: Callable[[], Any]):
+        future, is_owner = self._join(key)
+        if not is_owner:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key)
+
+    async def do_async(self, key: Hashable, coroutine_func: Callable[[], Awaitable]):
+        future, is_owner = self._join(key)
+        if not is_owner:
+            # shield: отмена ожидающей задачи не должна отменять общий запрос
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        try:
+            result = await coroutine_func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key)
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            return {'in_flight': len(self._in_flight), **self._counters}
+
+
 class Session(requests.Session):
     def __init__(self, retry_policy: Optional[urllib3.Retry] = None):
         super().__init__()
-        adapter = requests.adapters.HTTPAdapter(max_retries=retry_policy)
+        # max_retries=None в HTTPAdapter - это 3 повтора по умолчанию urllib3, а не 0
+        adapter = requests.adapters.HTTPAdapter(
+            max_retries=retry_policy if retry_policy is not None else 0,
+        )
         self.mount('http://', adapter)
         self.mount('https://', adapter)
 
@@ -81,13 +468,19 @@ class Session(requests.Session):
         return cls(retry_policy=make_retry(**retry_policy_kwargs))
 
 
+RETRY_STATUSES = frozenset([
+    HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.GATEWAY_TIMEOUT,
+])
+
+
 def make_retry(
     total=10,
     connect=5,
     read=5,
     backoff_factor=0.3,
     status=5,
-    status_forcelist=frozenset([HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY]),
+    status_forcelist=RETRY_STATUSES,
     **kwargs,
 ):
     """
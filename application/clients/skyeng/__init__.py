@@ -1 +1 @@
-from .client import SkyengClient
+from .client import AsyncSkyengClient, SkyengClient
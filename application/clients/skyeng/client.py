@@ -2,14 +2,54 @@ from clients import base
 from clients.skyeng import schemas
 
 
+def normalize_word(word: str) -> str:
+    return ' '.join(word.lower().split())
+
+
 class SkyengClient(base.JSONClient):
-    session = base.Session.create_with_retry_policy()
+    session = base.Session()
     base_url = 'https://dictionary.skyeng.ru'
-    timeout = (5, 5)
+    timeout = (3, 3)
+    retries = 3
+    # пользователь ждет ответа бота: не ждем словарь дольше deadline вместе с повторами
+    deadline = 5
+    circuit_breaker = base.CircuitBreaker('skyeng')
+    # популярное слово могут одновременно искать многие пользователи
+    single_flight = base.SingleFlight('skyeng')
 
     def search_word_meanings(self, word: str, max_words=5) -> schemas.WordList:
+        word = normalize_word(word)
+        return self.single_flight.do(
+            (self.base_url, word, max_words),
+            lambda: self._search_word_meanings(word, max_words),
+        )
+
+    def _search_word_meanings(self, word: str, max_words: int) -> schemas.WordList:
         response = self.get(
             'api/public/v1/words/search',
             params={'search': word, 'pageSize': max_words}
         )
         return self.parse_json_response(response, schemas.WordList)
+
+
+class AsyncSkyengClient(base.AsyncJSONClient):
+    base_url = SkyengClient.base_url
+    timeout = 3
+    deadline = SkyengClient.deadline
+    # один сервис - одно состояние, из какого бы runtime-а ни шли запросы
+    circuit_breaker = SkyengClient.circuit_breaker
+    single_flight = SkyengClient.single_flight
+
+    async def search_word_meanings(self, word: str, max_words=5) -> schemas.WordList:
+        word = normalize_word(word)
+        return await self.single_flight.do_async(
+            (self.base_url, word, max_words),
+            lambda: self._search_word_meanings(word, max_words),
+        )
+
+    async def _search_word_meanings(self, word: str, max_words: int) -> schemas.WordList:
+        body = await self.get(
+            'api/public/v1/words/search',
+            params={'search': word, 'pageSize': max_words}
+        )
+        return self.parse_json_response(body, schemas.WordList)
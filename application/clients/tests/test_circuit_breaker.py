@@ -0,0 +1,163 @@
+import asyncio
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from clients import base
+from clients.skyeng import AsyncSkyengClient, SkyengClient
+from project.testing import FakeServer
+
+
+class BreakerClient(SkyengClient):
+    session = base.Session()
+    retries = 0
+    circuit_breaker = None  # у каждого теста свой, см. setUp
+    single_flight = base.SingleFlight('test')
+
+
+class AsyncBreakerClient(AsyncSkyengClient):
+    retries = 0
+    circuit_breaker = BreakerClient.circuit_breaker
+    single_flight = BreakerClient.single_flight
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """ Состояния circuit breaker-а на запросах к fake серверу словаря (utils/fake_skyeng_api) """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.skyeng_api = FakeServer('fake_skyeng_api', 'FakeSkyengApi')
+        cls.skyeng_api.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.skyeng_api.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.breaker = BreakerClient.circuit_breaker = AsyncBreakerClient.circuit_breaker = (
+            base.CircuitBreaker('test', min_requests=2, error_rate=0.5, open_timeout=0.2)
+        )
+        self.skyeng_api.api.fail_rate = 0
+        self.skyeng_api.api.latency = 0
+
+    def search(self, word='apple'):
+        return BreakerClient(self.skyeng_api.url).search_word_meanings(word)
+
+    def get_requests(self) -> int:
+        return self.skyeng_api.api.stats['requests']
+
+    def open_circuit(self):
+        self.skyeng_api.api.fail_rate = 1
+        for _ in range(2):
+            with self.assertRaises(base.ClientException):
+                self.search()
+        self.assertEqual(self.breaker.state, base.CircuitBreaker.OPEN)
+
+    def test_closed_open_half_open_closed(self):
+        self.search()
+        self.assertEqual(self.breaker.state, base.CircuitBreaker.CLOSED)
+        self.open_circuit()
+
+        # открыт: запросы не доходят до сервера
+        requests = self.get_requests()
+        with self.assertRaises(base.CircuitOpenException):
+            self.search()
+        self.assertEqual(self.get_requests(), requests)
+
+        time.sleep(0.2)
+        self.assertEqual(self.breaker.state, base.CircuitBreaker.HALF_OPEN)
+        self.skyeng_api.api.fail_rate = 0
+        self.search()
+        self.assertEqual(self.breaker.state, base.CircuitBreaker.CLOSED)
+        self.assertEqual(self.get_requests(), requests + 1)
+
+    def test_failed_trial_opens_again(self):
+        self.open_circuit()
+        time.sleep(0.2)
+
+        with self.assertRaises(base.ClientException):
+            self.search()
+        self.assertEqual(self.breaker.state, base.CircuitBreaker.OPEN)
+        with self.assertRaises(base.CircuitOpenException):
+            self.search()
+
+    def test_one_trial_in_half_open(self):
+        self.open_circuit()
+        time.sleep(0.2)
+
+        self.assertTrue(self.breaker.before_request())
+        with self.assertRaises(base.CircuitOpenException):
+            self.search()
+        self.breaker.end_trial()
+        self.skyeng_api.api.fail_rate = 0
+        self.search()
+        self.assertEqual(self.breaker.state, base.CircuitBreaker.CLOSED)
+
+    def test_trial_ends_on_unexpected_exception(self):
+        self.open_circuit()
+        time.sleep(0.2)
+
+        client = BreakerClient(self.skyeng_api.url)
+        with mock.patch.object(client.session, 'request', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            client.search_word_meanings('apple')
+        # без результата пробного запроса следующий тоже пробный, а не отклоненный навсегда
+        self.skyeng_api.api.fail_rate = 0
+        self.search()
+        self.assertEqual(self.breaker.state, base.CircuitBreaker.CLOSED)
+
+    def test_cancelled_async_trial_ends(self):
+        self.open_circuit()
+        time.sleep(0.2)
+        self.skyeng_api.api.fail_rate = 0
+        self.skyeng_api.api.latency = 0.5
+
+        async def cancel_trial():
+            client = AsyncBreakerClient(self.skyeng_api.url)
+            task = asyncio.ensure_future(client.search_word_meanings('apple'))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await AsyncBreakerClient.close_sessions()
+
+        asyncio.run(cancel_trial())
+        self.assertEqual(self.breaker.state, base.CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.before_request())
+
+
+class DeadlineTests(SimpleTestCase):
+    def test_limit_timeout(self):
+        deadline = base.Deadline(2)
+        self.assertAlmostEqual(deadline.limit_timeout(5), 2, places=1)
+        self.assertEqual(deadline.limit_timeout(1), 1)
+        self.assertEqual(deadline.limit_timeout((0.5, 1)), (0.5, 1))
+        # connect + read не больше оставшегося времени, пропорционально
+        connect, read = deadline.limit_timeout((3, 3))
+        self.assertAlmostEqual(connect, 1, places=1)
+        self.assertAlmostEqual(read, 1, places=1)
+        self.assertLessEqual(connect + read, 2)
+
+    def test_without_deadline(self):
+        self.assertEqual(base.Deadline(None).limit_timeout((3, 3)), (3, 3))
+        self.assertIsNone(base.Deadline(None).limit_timeout(None))
+
+    def test_request_stops_at_deadline(self):
+        skyeng_api = FakeServer('fake_skyeng_api', 'FakeSkyengApi', latency=2)
+        skyeng_api.start()
+        self.addCleanup(skyeng_api.stop)
+
+        class DeadlineClient(BreakerClient):
+            # (connect, read) = 6 секунд, а deadline вместе с повторами - 0.5
+            timeout = (3, 3)
+            retries = 3
+            deadline = 0.5
+            circuit_breaker = None
+
+        started = time.monotonic()
+        with self.assertRaises(base.ClientException):
+            DeadlineClient(skyeng_api.url).search_word_meanings('apple')
+        self.assertLess(time.monotonic() - started, 1)
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+from django.test import SimpleTestCase
+
+from clients import base
+from clients.skyeng import AsyncSkyengClient, SkyengClient
+from project.testing import FakeServer
+
+CALLS = 8
+
+
+class SingleFlightClient(SkyengClient):
+    session = base.Session()
+    circuit_breaker = None
+    single_flight = base.SingleFlight('test')
+
+
+class AsyncSingleFlightClient(AsyncSkyengClient):
+    circuit_breaker = None
+    single_flight = SingleFlightClient.single_flight
+
+
+class SingleFlightTests(SimpleTestCase):
+    """ Одновременные одинаковые запросы к fake серверу словаря доходят до него один раз """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.skyeng_api = FakeServer('fake_skyeng_api', 'FakeSkyengApi', latency=0.3)
+        cls.skyeng_api.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.skyeng_api.stop()
+        super().tearDownClass()
+
+    def get_requests(self) -> int:
+        return self.skyeng_api.api.stats['requests']
+
+    def test_concurrent_threads(self):
+        requests = self.get_requests()
+        barrier = threading.Barrier(CALLS)
+        results = []
+
+        def search(word):
+            barrier.wait()
+            results.append(SingleFlightClient(self.skyeng_api.url).search_word_meanings(word))
+
+        threads = [threading.Thread(target=search, args=(word,))
+                   for word in ['apple'] * (CALLS - 1) + [' Apple ']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.get_requests(), requests + 1)
+        self.assertEqual(len(results), CALLS)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(SingleFlightClient.single_flight.get_metrics()['in_flight'], 0)
+
+    def test_concurrent_tasks(self):
+        requests = self.get_requests()
+
+        async def search_all():
+            client = AsyncSingleFlightClient(self.skyeng_api.url)
+            try:
+                return await asyncio.gather(*[
+                    client.search_word_meanings(word) for word in ['pear'] * CALLS + ['plum']
+                ])
+            finally:
+                await AsyncSingleFlightClient.close_sessions()
+
+        results = asyncio.run(search_all())
+        # pear - один запрос на всех, plum - свой
+        self.assertEqual(self.get_requests(), requests + 2)
+        self.assertTrue(all(result is results[0] for result in results[:CALLS]))
+        self.assertEqual(results[-1].get_first_word_with_sound().text, 'plum')
+
+    def test_exception_is_shared(self):
+        self.skyeng_api.api.fail_rate = 1
+        self.addCleanup(setattr, self.skyeng_api.api, 'fail_rate', 0)
+        errors = []
+
+        def search():
+            try:
+                SingleFlightClient(self.skyeng_api.url).search_word_meanings('grape')
+            except base.ClientException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=search) for _ in range(CALLS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(len(errors), CALLS)
@@ -190,6 +190,9 @@ REPETITION_TIMES = {
     3: timedelta(days=1),
     4: timedelta(days=3),
 }
+# app.scheduling: FSRS повторяет слово, когда вероятность его вспомнить падает до этой
+REPETITION_DESIRED_RETENTION = 0.9
+REPETITION_MAX_INTERVAL = timedelta(days=365)
 
 # retry connect to db
 COUNT_TRIES_CONNECT = 100
@@ -199,6 +202,57 @@ SLEEP_TIME = 1
 TELEGRAM_BOT_KEY = os.environ.get('TELEGRAM_BOT_KEY', '')
 TELEGRAM_BOT_NAME = os.environ.get('TELEGRAM_BOT_NAME', '')
 TELEGRAM_DEBUG = os.environ.get('TELEGRAM_DEBUG', 'false').lower() == 'true'
+# можно указать локальный (fake) Bot API сервер, например utils/fake_bot_api.py
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', '')
+
+# webhook mode: telegram присылает обновления на TELEGRAM_WEBHOOK_URL,
+# web-сервер сохраняет их в очередь в БД, обрабатывают процессы `manage.py telegram --worker`
+TELEGRAM_WEBHOOK_URL = os.environ.get('TELEGRAM_WEBHOOK_URL', '')
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET', '')
+
+# обновления разных чатов обрабатываются параллельно, одного чата - по порядку
+TELEGRAM_WORKERS = int(os.environ.get('TELEGRAM_WORKERS', 4))
+TELEGRAM_QUEUE_SIZE = int(os.environ.get('TELEGRAM_QUEUE_SIZE', 1000))
+# очередь обновлений в БД для polling-а (webhook всегда сохраняет обновления в нее):
+# polling только сохраняет обновления, обрабатывают их процессы `manage.py telegram --worker`
+TELEGRAM_DURABLE_QUEUE = os.environ.get('TELEGRAM_DURABLE_QUEUE', 'false').lower() == 'true'
+TELEGRAM_QUEUE_LEASE = timedelta(minutes=5)
+TELEGRAM_QUEUE_MAX_ATTEMPTS = 3
+TELEGRAM_QUEUE_RETRY_DELAY = timedelta(seconds=5)
+TELEGRAM_QUEUE_KEEP_DONE = timedelta(days=1)
+# лимиты отправки сообщений
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+TELEGRAM_SEND_GLOBAL_RATE = 30  # сообщений в секунду
+TELEGRAM_SEND_CHAT_RATE = 1  # сообщений в секунду в один чат
+TELEGRAM_SEND_CHAT_BURST = 3
+# лимиты считает каждый процесс (telegram.sender): общий лимит делится на число процессов,
+# которые отправляют сообщения (бот, воркеры очереди, telegram_tasks)
+TELEGRAM_SENDER_PROCESSES = int(os.environ.get('TELEGRAM_SENDER_PROCESSES', 1))
+# safe_send_message ждет отправки не дольше (рассылки ждут своей очереди за ответами)
+TELEGRAM_SEND_WAIT_TIMEOUT = timedelta(minutes=2)
+TELEGRAM_SENDER_THREADS = int(os.environ.get('TELEGRAM_SENDER_THREADS', 8))
+TELEGRAM_SEND_ATTEMPTS = 5
+# аренда сообщений outbox процессом: не продленные (процесс упал) отправит OutboxRelay другого
+TELEGRAM_OUTBOX_RELAY_DELAY = timedelta(minutes=5)
+# не отправленное сообщение relay повторит через TELEGRAM_OUTBOX_RETRY_DELAY * 2 ** (попытка - 1)
+TELEGRAM_OUTBOX_MAX_ATTEMPTS = 3
+TELEGRAM_OUTBOX_RETRY_DELAY = timedelta(minutes=1)
+# asyncio runtime (manage.py telegram --runtime asyncio): потоки только для ORM (и хэндлеров)
+TELEGRAM_ASYNC_DB_THREADS = int(os.environ.get('TELEGRAM_ASYNC_DB_THREADS', 10))
+# рассылки (telegram.broadcast): сообщений в отправке одновременно, пользователей на страницу
+TELEGRAM_BROADCAST_CONCURRENCY = 100
+TELEGRAM_BROADCAST_PAGE_SIZE = 1000
+# telegram_tasks: notify_repetition запускается, когда пора повторять, но не реже этого
+TELEGRAM_REPETITION_NOTIFY_INTERVAL = timedelta(minutes=5)
+TELEGRAM_LEARNING_BROADCAST_INTERVAL = timedelta(hours=5)
+# процессы telegram_tasks делят пользователей на части по аренде (telegram.sharding)
+TELEGRAM_TASKS_SHARDS = 16
+TELEGRAM_TASKS_LEASE_TTL = timedelta(seconds=30)
+# состояние пользователей в памяти процесса бота (app.state_cache), 0 - не кэшировать
+USER_STATE_CACHE_SIZE = int(os.environ.get('USER_STATE_CACHE_SIZE', 10000))
+# каталог общих слов в памяти процесса (app.word_catalog): догрузка новых слов и полная загрузка
+GENERAL_WORDS_REFRESH_INTERVAL = timedelta(minutes=1)
+GENERAL_WORDS_RELOAD_INTERVAL = timedelta(hours=1)
 
 BOT_SITE_URL = os.environ.get('BOT_SITE_URL', 'http://localhost:8000')
 
@@ -206,3 +260,20 @@ BOT_SITE_URL = os.environ.get('BOT_SITE_URL', 'http://localhost:8000')
 LANG_DICT = {
     'en': enchant.Dict("en_US"),
 }
+
+# -------- skyeng dictionary ----------
+# можно указать локальный (fake) сервер словаря, например utils/fake_skyeng_api.py
+SKYENG_API_URL = os.environ.get('SKYENG_API_URL', '')
+# кэш ответов словаря (app.dictionary): в памяти процесса и в таблице DictionaryEntry
+SKYENG_CACHE_TTL = timedelta(days=30)
+# слово не нашлось или у него нет произношения
+SKYENG_CACHE_NEGATIVE_TTL = timedelta(days=1)
+SKYENG_CACHE_MEMORY_SIZE = int(os.environ.get('SKYENG_CACHE_MEMORY_SIZE', 10000))
+# локальный файл словаря: manage.py dictionary_bundle build
+SKYENG_BUNDLE_PATH = os.environ.get(
+    'SKYENG_BUNDLE_PATH', os.path.join(BASE_DIR, 'data', 'dictionary.bundle'),
+)
+# пока пользователь учит слово, данные для следующих слов загружаются в фоне (app.prefetch)
+SKYENG_PREFETCH_WORDS = 5
+SKYENG_PREFETCH_THREADS = int(os.environ.get('SKYENG_PREFETCH_THREADS', 4))
+SKYENG_PREFETCH_MAX_PENDING = 1000
@@ -0,0 +1,57 @@
+"""
+Общее для тестов (python manage.py test): локальные fake сервера из utils/ в потоке теста,
+планы запросов
+"""
+import importlib.util
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+from django.conf import settings
+from django.db import connection
+
+UTILS_DIR = os.path.join(settings.BASE_DIR, os.pardir, 'utils')
+
+
+def load_utils_module(name: str):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(UTILS_DIR, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeServer:
+    """
+    Сервер utils/<module_name>.py на свободном порту: api - объект api_class модуля,
+    через него тест управляет сервером и смотрит, какие запросы он получил
+    """
+
+    def __init__(self, module_name: str, api_class: str, **api_kwargs):
+        module = load_utils_module(module_name)
+        self.api = getattr(module, api_class)(**api_kwargs)
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), module.make_handler(self.api))
+        self.url = f'http://127.0.0.1:{self._server.server_port}'
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def get_plan_nodes(sql: str, params) -> list:
+    """ Узлы плана запроса (EXPLAIN), все уровни """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    nodes, stack = [], [plan[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.get('Plans', []))
+    return nodes
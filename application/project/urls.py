@@ -18,5 +18,6 @@ from django.urls import include, path
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('telegram/', include('telegram.urls')),
     path('', include('app.urls'))
 ]
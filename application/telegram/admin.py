@@ -0,0 +1,54 @@
+from django.contrib import admin
+from django.db.models import Count
+
+from . import update_queue
+from .models import Broadcast, IncomingUpdate, OutboxMessage, TaskLease
+
+
+@admin.register(IncomingUpdate)
+class IncomingUpdateAdmin(admin.ModelAdmin):
+    date_hierarchy = 'date_created'
+    search_fields = ('update_id', 'chat_id')
+    list_filter = ('status',)
+    list_display = ('__str__', 'status', 'attempts', 'date_created', 'date_processed')
+    actions = ('requeue',)
+
+    def requeue(self, request, queryset):
+        count = update_queue.requeue(queryset)
+        self.message_user(request, f'Возвращено в очередь: {count}')
+    requeue.short_description = 'Вернуть в очередь'
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    date_hierarchy = 'date_created'
+    search_fields = ('chat_id', 'text')
+    list_filter = ('status',)
+    list_display = ('__str__', 'status', 'text', 'attempts', 'locked_by', 'locked_until',
+                    'date_created')
+    raw_id_fields = ('word',)
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    date_hierarchy = 'date_created'
+    list_filter = ('name', 'status')
+    list_display = ('__str__', 'status', 'sent', 'failed', 'deferred_count', 'throughput',
+                    'last_user_id', 'date_created', 'date_finished')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(deferred_count=Count('deferred'))
+
+    def deferred_count(self, obj: Broadcast):
+        return obj.deferred_count
+    deferred_count.short_description = 'Ждут конца тихих часов'
+
+    def throughput(self, obj: Broadcast):
+        return f'{obj.throughput:.1f} msg/s'
+    throughput.short_description = 'Скорость'
+
+
+@admin.register(TaskLease)
+class TaskLeaseAdmin(admin.ModelAdmin):
+    search_fields = ('name', 'owner')
+    list_display = ('name', 'owner', 'expires_at', 'date_updated')
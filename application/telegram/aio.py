@@ -0,0 +1,245 @@
+"""
+asyncio runtime бота
+
+Сетевые запросы (getUpdates, sendMessage, answerInlineQuery, запросы в skyeng) выполняются
+корутинами в одном event loop, поэтому тысячи чатов, ждущих ответа сети, не занимают по потоку.
+Ограниченный пул потоков выполняет только синхронный код с ORM: хэндлеры (telegram.handlers)
+лишь меняют состояние в БД и сохраняют ответы в outbox, а после commit-а telegram.outbox
+ищет слова в словаре, telegram.sender отправляет сообщения и app.prefetch загружает
+следующие слова уже корутинами (ORM из них - через run_orm).
+Обновления одного чата обрабатываются по очереди, разных чатов - параллельно.
+"""
+import asyncio
+import collections
+import functools
+import json
+import logging
+import time
+import typing
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import aiohttp
+import telebot
+from django.conf import settings
+from django.db import close_old_connections
+from telebot import apihelper
+
+from app import metrics
+from app.prefetch import prefetcher
+from clients import base as clients_base
+
+from .dispatcher import get_update_chat_id, process_update
+
+logger = logging.getLogger(__name__)
+
+_running_runtime: typing.Optional['AsyncRuntime'] = None
+
+# ответ в ApiException: как requests.Response в исключениях telebot
+ApiResponse = collections.namedtuple('ApiResponse', ('status_code', 'text'))
+
+
+class AsyncBotApi:
+    def __init__(self, token: str, session: aiohttp.ClientSession):
+        self.token = token
+        self.session = session
+        self.api_url = (settings.TELEGRAM_API_URL or 'https://api.telegram.org').rstrip('/')
+
+    async def request(self, method_name: str, params: dict, timeout=30):
+        url = f'{self.api_url}/bot{self.token}/{method_name}'
+        async with self.session.post(
+            url, data=params, timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            body = await response.text()
+
+        try:
+            result = json.loads(body)
+        except ValueError:
+            result = {}
+        if response.status != 200 or not result.get('ok'):
+            # такое же исключение бросает telebot, его обрабатывает safe_send_message
+            raise apihelper.ApiException(
+                f'The server returned HTTP {response.status}. Response body:\n[{body}]',
+                method_name, ApiResponse(response.status, body),
+            )
+        return result['result']
+
+    async def get_updates(self, offset: int, timeout=20) -> typing.List[telebot.types.Update]:
+        result = await self.request(
+            'getUpdates', {'offset': str(offset), 'timeout': str(timeout)}, timeout=timeout + 10,
+        )
+        return [telebot.types.Update.de_json(update) for update in result]
+
+    async def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        params = {'chat_id': str(chat_id), 'text': text}
+        if reply_markup:
+            params['reply_markup'] = apihelper._convert_markup(reply_markup)
+        if parse_mode:
+            params['parse_mode'] = parse_mode
+        return await self.request('sendMessage', params)
+
+    async def answer_inline_query(self, inline_query_id, results):
+        params = {
+            'inline_query_id': inline_query_id,
+            'results': apihelper._convert_list_json_serializable(results),
+        }
+        return await self.request('answerInlineQuery', params)
+
+
+class AsyncRuntime:
+    def __init__(self, token: str, db_threads: int, max_pending: int):
+        self.token = token
+        self.db_threads = db_threads
+        self.max_pending = max_pending
+
+        self.loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self.api: typing.Optional[AsyncBotApi] = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=db_threads, thread_name_prefix='aio-handler',
+        )
+        self._mailboxes: typing.Dict[typing.Any, collections.deque] = {}
+        self._slots: typing.Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._chat_tasks: typing.Dict[typing.Any, asyncio.Task] = {}
+        self._counters = metrics.Counters('submitted', 'processed')
+
+    def run(self):
+        asyncio.run(self.main())
+
+    async def main(self):
+        global _running_runtime
+
+        self.loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        async with aiohttp.ClientSession(trust_env=True) as session:
+            self.api = AsyncBotApi(self.token, session)
+            _running_runtime = self
+            prefetcher.set_event_loop(self.loop, self.run_orm)
+            try:
+                await self.poll_updates()
+            finally:
+                _running_runtime = None
+                prefetcher.set_event_loop(None)
+                # не ждем потоки: хэндлер может долго ждать блокировку в БД
+                self.executor.shutdown(wait=False)
+                await clients_base.AsyncClient.close_sessions()
+
+    async def poll_updates(self):
+        metrics_logger = metrics.PeriodicLogger()
+        offset = 0
+        while True:
+            try:
+                updates = await self.api.get_updates(offset)
+            except (aiohttp.ClientError, asyncio.TimeoutError, apihelper.ApiException):
+                logger.exception('Fail get updates')
+                await asyncio.sleep(5)
+                continue
+
+            for update in updates:
+                await self.submit(update)
+                offset = update.update_id + 1
+            metrics_logger.maybe_log()
+
+    async def submit(self, update: telebot.types.Update):
+        # ограничиваем число необработанных обновлений: не забираем новые, пока не разгребем эти
+        await self._slots.acquire()
+        self._pending += 1
+        self._counters.incr('submitted')
+
+        chat_id = get_update_chat_id(update)
+        mailbox = self._mailboxes.get(chat_id)
+        if mailbox is None:
+            mailbox = self._mailboxes[chat_id] = collections.deque()
+            self.loop.create_task(self._process_chat(chat_id, mailbox))
+        mailbox.append(update)
+
+    async def _process_chat(self, chat_id, mailbox: collections.deque):
+        while mailbox:
+            update = mailbox.popleft()
+            try:
+                await self.loop.run_in_executor(self.executor, process_update, update)
+            finally:
+                self._pending -= 1
+                self._slots.release()
+                self._counters.incr('processed')
+        del self._mailboxes[chat_id]
+
+    async def run_orm(self, func: typing.Callable, *args):
+        """ Синхронный код с ORM из корутины: выполняется в пуле потоков """
+        return await self.loop.run_in_executor(self.executor, self._call_orm, func, args)
+
+    @staticmethod
+    def _call_orm(func: typing.Callable, args: tuple):
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    def spawn(self, coroutine: typing.Awaitable) -> Future:
+        """ Запускает корутину в event loop, можно вызывать из любого потока """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        future.add_done_callback(_log_exception)
+        return future
+
+    def call_in_chat_order(self, chat_id, coroutine_func: typing.Callable[[], typing.Awaitable]):
+        """
+        Запускает корутину после завершения предыдущей корутины этого чата
+        (например, сообщения outbox передаются в sender в порядке создания).
+        Можно вызывать из любого потока
+        """
+        self.loop.call_soon_threadsafe(self._chain, chat_id, coroutine_func)
+
+    def _chain(self, chat_id, coroutine_func: typing.Callable[[], typing.Awaitable]):
+        previous = self._chat_tasks.get(chat_id)
+        task = self.loop.create_task(self._run_after(previous, coroutine_func))
+        self._chat_tasks[chat_id] = task
+        task.add_done_callback(functools.partial(self._forget_chat_task, chat_id))
+
+    @staticmethod
+    async def _run_after(previous: typing.Optional[asyncio.Task],
+                         coroutine_func: typing.Callable[[], typing.Awaitable]):
+        if previous:
+            await asyncio.wait([previous])
+        try:
+            await coroutine_func()
+        except Exception:
+            logger.exception('Chat task: exception')
+
+    def _forget_chat_task(self, chat_id, task: asyncio.Task):
+        if self._chat_tasks.get(chat_id) is task:
+            del self._chat_tasks[chat_id]
+
+    def get_metrics(self) -> dict:
+        return {
+            'db_threads': self.db_threads,
+            'pending_updates': self._pending,
+            'pending_chats': len(self._mailboxes),
+            'chat_tasks': len(self._chat_tasks),
+            **self._counters.as_dict(),
+        }
+
+
+def get_running_runtime() -> typing.Optional[AsyncRuntime]:
+    return _running_runtime
+
+
+def _log_exception(future: Future):
+    if not future.cancelled() and future.exception():
+        logger.error('Coroutine: exception', exc_info=future.exception())
+
+
+def start():
+    logger.info('Start telegram bot (asyncio runtime)')
+
+    while True:
+        runtime = AsyncRuntime(
+            token=settings.TELEGRAM_BOT_KEY,
+            db_threads=settings.TELEGRAM_ASYNC_DB_THREADS,
+            max_pending=settings.TELEGRAM_QUEUE_SIZE,
+        )
+        metrics.register('aio_runtime', runtime.get_metrics)
+        try:
+            runtime.run()
+        except Exception as e:
+            logger.exception(e)
+        time.sleep(5)
+        logger.info('RESTART')
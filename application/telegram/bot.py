@@ -1,4 +1,15 @@
+import functools
+
 import telebot
 from django.conf import settings
+from telebot import apihelper
+
+if settings.TELEGRAM_API_URL:
+    # base_url в apihelper._make_request задается значением по умолчанию,
+    # поэтому подменяем саму функцию (все методы apihelper вызывают ее по имени модуля)
+    apihelper._make_request = functools.partial(
+        apihelper._make_request,
+        base_url=settings.TELEGRAM_API_URL.rstrip('/') + '/bot{0}/{1}',
+    )
 
 bot = telebot.TeleBot(settings.TELEGRAM_BOT_KEY, threaded=False)
@@ -0,0 +1,242 @@
+"""
+Рассылка сообщения всем пользователям (notify_learning)
+
+- пользователи читаются страницами по id (keyset, без OFFSET)
+- сообщения отправляет sender (лимиты telegram, повторы), параллельно:
+  одновременно в отправке не больше TELEGRAM_BROADCAST_CONCURRENCY сообщений,
+  поэтому повторы одного сообщения не задерживают всю рассылку
+- после каждой страницы прогресс сохраняется в Broadcast: id пользователя, до которого
+  все сообщения отправлены (или не удалось отправить), и счетчики.
+  Упавшая рассылка продолжается с этого места, сообщения после него могут уйти повторно
+- рассылка разделена на части (user_id % shards_count, см. telegram.sharding):
+  лидер создает Broadcast на каждую часть, отправляет процесс, который владеет частью.
+  Если часть перешла другому процессу, отправка останавливается после страницы,
+  дожидается уже переданных в sender сообщений и сохраняет прогресс; аренду части
+  процесс держит до этого (TaskCoordinator.hold), новый владелец продолжает с сохраненного места.
+  Прогресс только растет (last_user_id), завершает рассылку части только ее владелец
+- пользователи, у которых сейчас тихие часы (app.models.filter_notifiable), откладываются
+  (BroadcastDeferredUser, сохраняются вместе с прогрессом): владелец части отправляет им,
+  когда тихие часы кончатся, в том числе после завершения прохода по id.
+  У пользователя одно отложенное сообщение рассылки: следующая рассылка того же имени
+  заменяет его своим
+"""
+import collections
+import logging
+import threading
+import time
+import typing
+from concurrent.futures import Future
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from app.models import User, filter_notifiable
+from app.utils import get_datetime_now
+
+from .models import Broadcast, BroadcastDeferredUser
+from .sender import Priority, sender
+from .sharding import filter_shards
+
+logger = logging.getLogger(__name__)
+
+
+def is_started_since(name: str, since: datetime) -> bool:
+    return Broadcast.objects.filter(name=name, date_created__gte=since).exists()
+
+
+def start(name: str, shards_count: int):
+    """ Рассылка на все части; незавершенные части предыдущей рассылки продолжатся """
+    Broadcast.objects.bulk_create(
+        [Broadcast(name=name, shard=shard, shards_count=shards_count)
+         for shard in range(shards_count)],
+        ignore_conflicts=True,  # broadcast_running: часть уже отправляется
+    )
+
+
+def get_running(name: str, shards: typing.Collection[int], shards_count: int):
+    """ Незавершенные рассылки частей и завершенные, у которых остались отложенные """
+    return Broadcast.objects.filter(
+        Q(status=Broadcast.Status.RUNNING) | Q(deferred__isnull=False),
+        name=name, shard__in=list(shards), shards_count=shards_count,
+    ).distinct().order_by('id')
+
+
+def _iter_user_pages(broadcast: Broadcast, page_size: int):
+    """ Страницы (id, chat_id, можно ли оповещать сейчас) пользователей после last_user_id """
+    users = filter_shards(
+        User.objects.order_by('id'), 'id', [broadcast.shard], broadcast.shards_count,
+    )
+    last_user_id = broadcast.last_user_id
+    while True:
+        page = list(users.filter(id__gt=last_user_id).values_list('id', 'chat_id')[:page_size])
+        if not page:
+            return
+        # прогресс идет по всем пользователям: у кого тихие часы, тех откладываем
+        notifiable = set(filter_notifiable(
+            User.objects.filter(id__in=[user_id for user_id, _ in page]), get_datetime_now(),
+        ).values_list('id', flat=True))
+        yield [(user_id, chat_id, user_id in notifiable) for user_id, chat_id in page]
+        last_user_id = page[-1][0]
+
+
+def _iter_deferred_pages(broadcast: Broadcast, page_size: int):
+    """ Страницы (id, chat_id) отложенных пользователей, у которых кончились тихие часы """
+    users = User.objects.filter(
+        id__in=BroadcastDeferredUser.objects.filter(broadcast=broadcast).values('user_id'),
+    ).order_by('id')
+    last_user_id = 0
+    while True:
+        page = list(
+            filter_notifiable(users.filter(id__gt=last_user_id), get_datetime_now())
+            .values_list('id', 'chat_id')[:page_size]
+        )
+        if not page:
+            return
+        yield page
+        last_user_id = page[-1][0]
+
+
+class BroadcastRun:
+    """ Одна рассылка в текущем процессе: отправка, прогресс, счетчики """
+
+    def __init__(self, broadcast: Broadcast, text: str, markup=None,
+                 is_owned: typing.Callable[[], bool] = None,
+                 concurrency: int = None, page_size: int = None):
+        self.broadcast = broadcast
+        self.text = text
+        self.markup = markup
+        self.is_owned = is_owned or (lambda: True)
+        self.concurrency = concurrency or settings.TELEGRAM_BROADCAST_CONCURRENCY
+        self.page_size = page_size or settings.TELEGRAM_BROADCAST_PAGE_SIZE
+
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        # (user_id, future) по возрастанию user_id: прогресс - до первого не завершенного;
+        # future None - пользователь отложен до конца тихих часов
+        self._pending: typing.Deque[typing.Tuple[int, typing.Optional[Future]]] = \
+            collections.deque()
+        # счетчики этого запуска, всей рассылки - в broadcast
+        self.sent = 0
+        self.failed = 0
+
+    def run(self) -> bool:
+        """ False, если часть перешла другому процессу и рассылка не закончена """
+        started = time.monotonic()
+        if self.broadcast.status == Broadcast.Status.RUNNING and not self._send_pages(started):
+            return False
+        return self._send_deferred(started)
+
+    def _send_pages(self, started: float) -> bool:
+        """ Проход по id всех пользователей части """
+        for number, page in enumerate(_iter_user_pages(self.broadcast, self.page_size)):
+            if not number and self.broadcast.last_user_id:
+                logger.info('Resume %s from user_id=%d',
+                            self.broadcast, self.broadcast.last_user_id)
+            if not self.is_owned():
+                self._save_progress(wait=True)
+                self._log_progress('stopped, shard is not owned', started)
+                return False
+            for user_id, chat_id, is_notifiable in page:
+                self._pending.append((user_id, self._send(chat_id) if is_notifiable else None))
+            self._save_progress(wait=False)
+            self._log_progress('progress', started)
+
+        self._save_progress(wait=True)
+        if not self.is_owned():
+            self._log_progress('stopped, shard is not owned', started)
+            return False
+        self.broadcast.status = Broadcast.Status.DONE
+        self.broadcast.date_finished = get_datetime_now()
+        Broadcast.objects.filter(
+            id=self.broadcast.id, status=Broadcast.Status.RUNNING,
+        ).update(
+            status=self.broadcast.status, date_finished=self.broadcast.date_finished,
+            date_updated=self.broadcast.date_finished,
+        )
+        self._log_progress('done', started)
+        return True
+
+    def _send(self, chat_id: str) -> Future:
+        self._slots.acquire()
+        future = sender.send(chat_id, self.text, markup=self.markup, priority=Priority.BROADCAST)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _send_deferred(self, started: float) -> bool:
+        """ Отправляет отложенным пользователям, у которых кончились тихие часы """
+        for page in _iter_deferred_pages(self.broadcast, self.page_size):
+            if not self.is_owned():
+                self._log_progress('stopped, shard is not owned', started)
+                return False
+            futures = [(user_id, self._send(chat_id)) for user_id, chat_id in page]
+            sent = sum(1 for _, future in futures if future.result())
+            failed = len(futures) - sent
+            self.sent += sent
+            self.failed += failed
+            self.broadcast.sent += sent
+            self.broadcast.failed += failed
+            with transaction.atomic():
+                BroadcastDeferredUser.objects.filter(
+                    broadcast=self.broadcast, user_id__in=[user_id for user_id, _ in futures],
+                ).delete()
+                Broadcast.objects.filter(id=self.broadcast.id).update(
+                    sent=F('sent') + sent, failed=F('failed') + failed,
+                    date_updated=get_datetime_now(),
+                )
+            self._log_progress('deferred users', started)
+        return True
+
+    def _save_progress(self, wait: bool):
+        last_user_id, sent, failed, processed, deferred = None, 0, 0, [], []
+        while self._pending:
+            future = self._pending[0][1]
+            if not wait and future is not None and not future.done():
+                break
+            last_user_id, _ = self._pending.popleft()
+            processed.append(last_user_id)
+            if future is None:
+                deferred.append(last_user_id)
+            elif future.result():
+                sent += 1
+            else:
+                failed += 1
+        if last_user_id is None:
+            return
+
+        # пользователю, которого прошла эта рассылка, отложенное прошлой уже не отправляем;
+        # повторно пройденные после падения пользователи уже могут быть отложены
+        BroadcastDeferredUser.objects.filter(
+            broadcast__name=self.broadcast.name, user_id__in=processed,
+        ).exclude(broadcast_id=self.broadcast.id).delete()
+        BroadcastDeferredUser.objects.bulk_create([
+            BroadcastDeferredUser(broadcast_id=self.broadcast.id, user_id=user_id)
+            for user_id in deferred
+        ], ignore_conflicts=True)
+
+        self.sent += sent
+        self.failed += failed
+        self.broadcast.last_user_id = last_user_id
+        self.broadcast.sent += sent
+        self.broadcast.failed += failed
+        # прогресс не откатывается назад, если часть уже отправил дальше другой процесс
+        is_updated = Broadcast.objects.filter(
+            id=self.broadcast.id, last_user_id__lt=last_user_id,
+        ).update(
+            last_user_id=last_user_id, sent=F('sent') + sent, failed=F('failed') + failed,
+            date_updated=get_datetime_now(),
+        )
+        if not is_updated:
+            logger.warning('%s: progress user_id=%d is behind saved, not saved',
+                           self.broadcast, last_user_id)
+
+    def _log_progress(self, stage: str, started: float):
+        seconds = time.monotonic() - started
+        logger.info(
+            'Broadcast %s %d/%d %s: user_id=%d sent=%d failed=%d (this run %d/%d) '
+            'not saved=%d, %.1f msg/s',
+            self.broadcast.name, self.broadcast.shard, self.broadcast.shards_count, stage,
+            self.broadcast.last_user_id, self.broadcast.sent, self.broadcast.failed,
+            self.sent, self.failed, len(self._pending),
+            (self.sent + self.failed) / seconds if seconds else 0,
+        )
@@ -8,6 +8,9 @@ class Handlers:
     stop_learning_word = Handler('stop_learning_word', '/stop_learning_word')
     stop = Handler('stop', '/stop')
     help = Handler('help', '/help')
+    timezone = Handler('timezone', '/timezone')
+    quiet_hours = Handler('quiet_hours', '/quiet_hours')
+    algorithm = Handler('algorithm', '/algorithm')
 
 
 class Commands:
@@ -0,0 +1,146 @@
+import collections
+import logging
+import queue
+import threading
+import typing
+
+import telebot
+from django.conf import settings
+from django.db import close_old_connections
+
+from app import metrics
+
+from .bot import bot
+
+logger = logging.getLogger(__name__)
+
+
+def get_update_chat_id(update: telebot.types.Update) -> typing.Optional[int]:
+    if update.message:
+        return update.message.chat.id
+    if update.edited_message:
+        return update.edited_message.chat.id
+    if update.inline_query:
+        return update.inline_query.from_user.id
+    return None
+
+
+def process_update(update: telebot.types.Update):
+    # воркер живет дольше одного запроса => сами следим за соединениями с БД
+    close_old_connections()
+    try:
+        bot.process_new_updates([update])
+    except Exception:
+        logger.exception('Fail process update_id=%s', update.update_id)
+    finally:
+        close_old_connections()
+
+
+class ChatDispatcher:
+    """
+    Обрабатывает обновления разных чатов параллельно на пуле воркеров,
+    а обновления одного чата - строго по очереди в порядке получения
+    (от этого порядка зависит состояние LearningStatus пользователя).
+
+    У каждого чата своя очередь (mailbox). Чат с необработанными обновлениями
+    стоит в общей очереди ready; воркер берет чат, обрабатывает одно его обновление
+    и, если у чата есть еще обновления, ставит чат в конец ready.
+    Так один чат никогда не обрабатывается двумя воркерами одновременно,
+    а медленный чат не задерживает остальные.
+    """
+
+    def __init__(self, workers_count: int, max_pending: int,
+                 process: typing.Callable[[telebot.types.Update], None] = process_update):
+        self.workers_count = workers_count
+        self.max_pending = max_pending
+        self.process = process
+
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._mailboxes: typing.Dict[typing.Any, collections.deque] = {}
+        self._ready = queue.Queue()
+        self._pending = 0
+        self._max_pending_seen = 0
+        self._busy_workers = 0
+        self._workers = []
+        self._counters = metrics.Counters('submitted', 'processed', 'rejected')
+
+    def submit(self, update: telebot.types.Update, block=True) -> bool:
+        """
+        :param block: если очередь переполнена - ждем, пока воркеры ее разгребут,
+            иначе сразу возвращаем False
+        """
+        self.start()
+
+        chat_id = get_update_chat_id(update)
+        with self._not_full:
+            while self._pending >= self.max_pending:
+                if not block:
+                    self._counters.incr('rejected')
+                    logger.warning('Dispatcher queue is full, update_id=%s was rejected',
+                                   update.update_id)
+                    return False
+                self._not_full.wait()
+
+            self._pending += 1
+            mailbox = self._mailboxes.get(chat_id)
+            if mailbox is None:
+                mailbox = self._mailboxes[chat_id] = collections.deque()
+                # чата не было в ready => ставим его в очередь
+                self._ready.put(chat_id)
+            mailbox.append(update)
+
+            self._max_pending_seen = max(self._max_pending_seen, self._pending)
+            self._counters.incr('submitted')
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._workers:
+                return
+
+            logger.info('Start %d dispatcher workers', self.workers_count)
+            for number in range(self.workers_count):
+                worker = threading.Thread(
+                    target=self._work, name=f'dispatcher-worker-{number}', daemon=True,
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            chat_id = self._ready.get()
+            with self._lock:
+                update = self._mailboxes[chat_id].popleft()
+                self._busy_workers += 1
+
+            try:
+                self.process(update)
+            finally:
+                with self._not_full:
+                    self._busy_workers -= 1
+                    self._pending -= 1
+                    if self._mailboxes[chat_id]:
+                        self._ready.put(chat_id)
+                    else:
+                        del self._mailboxes[chat_id]
+                    self._not_full.notify()
+                self._counters.incr('processed')
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers_count,
+                'busy_workers': self._busy_workers,
+                'pending_updates': self._pending,
+                'pending_chats': len(self._mailboxes),
+                'max_pending_updates': self._max_pending_seen,
+                **self._counters.as_dict(),
+            }
+
+
+dispatcher = ChatDispatcher(
+    workers_count=settings.TELEGRAM_WORKERS,
+    max_pending=settings.TELEGRAM_QUEUE_SIZE,
+)
+metrics.register('dispatcher', dispatcher.get_metrics)
@@ -1,15 +1,22 @@
+import datetime
 import logging
 import time
 
 import telebot
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db.transaction import atomic
+from telebot import apihelper
 
-from app.models import User, Word
-from telegram.utils import send_message, request_logger
+from app import metrics, scheduling
+from app.models import User
+from app.utils import validate_timezone
+from app.word_catalog import general_words
+from telegram.utils import answer_inline_query, send_message, request_logger
 
-from . import constants
+from . import constants, update_queue
 from .bot import bot
+from .dispatcher import dispatcher
 from .statuses_runners import LearnWordRunner, RepeatWord, get_learn_repeat_markup
 from .utils import get_user
 
@@ -21,13 +28,36 @@ def start():
 
     while True:
         try:
-            bot.polling(none_stop=True)
+            poll_updates()
         except Exception as e:
             logger.exception(e)
         time.sleep(5)
         logger.info('RESTART')
 
 
+def poll_updates():
+    """
+    Long polling: получаем обновления и передаем их в dispatcher,
+    который обрабатывает чаты параллельно (bot.polling обрабатывает все обновления по одному),
+    или сохраняем в очередь в БД (TELEGRAM_DURABLE_QUEUE)
+    """
+    metrics_logger = metrics.PeriodicLogger()
+    while True:
+        raw_updates = apihelper.get_updates(
+            bot.token, offset=bot.last_update_id + 1, timeout=20,
+        )
+        if settings.TELEGRAM_DURABLE_QUEUE:
+            # подтверждаем получение (offset) только после сохранения в БД
+            update_queue.enqueue_updates(raw_updates)
+        else:
+            for raw_update in raw_updates:
+                dispatcher.submit(telebot.types.Update.de_json(raw_update))
+
+        for raw_update in raw_updates:
+            bot.last_update_id = max(bot.last_update_id, raw_update['update_id'])
+        metrics_logger.maybe_log()
+
+
 @bot.message_handler(commands=['start', constants.Handlers.help.handler, 'go'])
 @request_logger
 def start_handler(message: telebot.types.Message):
@@ -43,6 +73,9 @@ def start_handler(message: telebot.types.Message):
 
     message_resp += ('\n Вы можете добавить слова которые хотите изучать '
                      f'на сайте {settings.BOT_SITE_URL}')
+    message_resp += (f'\n Часовой пояс и время без оповещений: {constants.Handlers.timezone.path}, '
+                     f'{constants.Handlers.quiet_hours.path}')
+    message_resp += f'\n Алгоритм повторения слов: {constants.Handlers.algorithm.path}'
     send_message(user, message_resp, markup=get_learn_repeat_markup())
 
 
@@ -91,6 +124,86 @@ def stop_handler(message: telebot.types.Message):
     )
 
 
+def _get_command_argument(message: telebot.types.Message) -> str:
+    """ '/timezone Europe/Berlin' -> 'Europe/Berlin' """
+    parts = message.text.split(maxsplit=1)
+    return parts[1].strip() if len(parts) > 1 else ''
+
+
+def _parse_time(text: str) -> datetime.time:
+    """ '23', '23:30' """
+    hours, _, minutes = text.strip().partition(':')
+    return datetime.time(int(hours), int(minutes or 0))
+
+
+def _get_notification_settings_text(user: User) -> str:
+    if user.quiet_hours_start == user.quiet_hours_end:
+        quiet_hours = 'не заданы'
+    else:
+        quiet_hours = (f'с {user.quiet_hours_start:%H:%M} '
+                       f'до {user.quiet_hours_end:%H:%M}')
+    return f'Часовой пояс: {user.timezone}, тихие часы (без оповещений): {quiet_hours}'
+
+
+@bot.message_handler(commands=[constants.Handlers.timezone.handler])
+@request_logger
+@atomic
+def timezone_handler(message: telebot.types.Message):
+    user = get_user(message)
+    timezone = _get_command_argument(message)
+    if timezone:
+        try:
+            validate_timezone(timezone)
+        except ValidationError:
+            send_message(user, f'Не знаю часовой пояс "{timezone}" :( Например: '
+                               f'{constants.Handlers.timezone.path} Europe/Berlin')
+            return
+        user.update_notification_settings(timezone=timezone)
+    send_message(user, _get_notification_settings_text(user))
+
+
+@bot.message_handler(commands=[constants.Handlers.quiet_hours.handler])
+@request_logger
+@atomic
+def quiet_hours_handler(message: telebot.types.Message):
+    user = get_user(message)
+    quiet_hours = _get_command_argument(message)
+    if quiet_hours == 'off':
+        user.update_notification_settings(
+            quiet_hours_start=datetime.time(0), quiet_hours_end=datetime.time(0),
+        )
+    elif quiet_hours:
+        try:
+            start, end = map(_parse_time, quiet_hours.split('-'))
+        except ValueError:
+            send_message(user, 'Не понятно :( Например: '
+                               f'{constants.Handlers.quiet_hours.path} 23-10, '
+                               f'{constants.Handlers.quiet_hours.path} off - без тихих часов')
+            return
+        user.update_notification_settings(quiet_hours_start=start, quiet_hours_end=end)
+    send_message(user, _get_notification_settings_text(user))
+
+
+@bot.message_handler(commands=[constants.Handlers.algorithm.handler])
+@request_logger
+@atomic
+def algorithm_handler(message: telebot.types.Message):
+    user = get_user(message)
+    algorithm = _get_command_argument(message)
+    if algorithm and algorithm != user.repetition_algorithm:
+        if algorithm not in scheduling.SCHEDULERS:
+            send_message(user, f'Не знаю алгоритм "{algorithm}" :(')
+        else:
+            user.set_repetition_algorithm(algorithm)
+
+    algorithms = '\n'.join(
+        f' {constants.Handlers.algorithm.path} {name} - {title}'
+        for name, title in scheduling.CHOICES
+    )
+    send_message(user, f'Алгоритм повторения слов: '
+                       f'{user.get_repetition_algorithm_display()}\n{algorithms}')
+
+
 @bot.message_handler(content_types=["text"])
 @request_logger
 def text_handler(message: telebot.types.Message):
@@ -110,7 +223,7 @@ def query_text(query):
     """
     query_text handler will invoke when users insert @telegram_bot to another chat
     """
-    last_word = Word.objects.filter(user_id=None).last()
+    last_word = general_words.get_last()
 
     text = ''
     if last_word:
@@ -127,4 +240,4 @@ def query_text(query):
             message_text=start_text + text,
         ),
     )
-    bot.answer_inline_query(query.id, results=[single_msg])
+    answer_inline_query(query.id, [single_msg])
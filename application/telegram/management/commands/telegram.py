@@ -1,7 +1,47 @@
+from django.conf import settings
+
+from app.state_cache import state_cache
 from app.utils import BaseCommandWithAutoreload
-from telegram import handlers
+from telegram import aio, handlers, outbox, update_queue, webhook
 
 
 class Command(BaseCommandWithAutoreload):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runtime', choices=('threads', 'asyncio'), default='threads',
+            help='threads - пул потоков TELEGRAM_WORKERS; '
+                 'asyncio - сетевые запросы выполняет event loop',
+        )
+        parser.add_argument(
+            '--worker', action='store_true',
+            help='Обрабатывать обновления из очереди в БД (TELEGRAM_DURABLE_QUEUE)',
+        )
+        parser.add_argument(
+            '--set-webhook', action='store_true',
+            help='Зарегистрировать TELEGRAM_WEBHOOK_URL; обновления будет принимать web-сервер, '
+                 'а обрабатывать - процессы с --worker',
+        )
+        parser.add_argument(
+            '--delete-webhook', action='store_true',
+            help='Удалить webhook, чтобы снова получать обновления через polling',
+        )
+
+    def handle(self, *args, **options):
+        if options['set_webhook']:
+            webhook.set_webhook()
+            self.stdout.write('Webhook was set, handle updates with `manage.py telegram --worker`')
+        elif options['delete_webhook']:
+            webhook.delete_webhook()
+            self.stdout.write('Webhook was deleted')
+        else:
+            super().handle(*args, **options)
+
     def main(self, *args, **options):
-        handlers.start()
+        outbox.relay.start()
+        state_cache.start()
+        if options['worker']:
+            update_queue.QueueWorker(threads_count=settings.TELEGRAM_WORKERS).run()
+        elif options['runtime'] == 'asyncio':
+            aio.start()
+        else:
+            handlers.start()
@@ -2,21 +2,57 @@ import logging
 from time import sleep
 
 import schedule
+from django.conf import settings
 
-from app.utils import BaseCommandWithAutoreload
+from app import metrics
+from app.utils import BaseCommandWithAutoreload, get_datetime_now
 from telegram import tasks
+from telegram.sharding import coordinator
 
 logger = logging.getLogger(__name__)
 
 
+def run_as_leader(job, *args):
+    """ Задачи в одном экземпляре выполняет только процесс, который держит аренду leader """
+    if coordinator.is_leader:
+        job(*args)
+
+
 class Command(BaseCommandWithAutoreload):
-    def main(self):
-        schedule.every(5).minutes.do(tasks.notify_repetition)
-        schedule.every(5).hours.do(tasks.notify_learning)
-
-        while True:
-            try:
-                schedule.run_pending()
-            except Exception:
-                logger.exception('Scheduler tasks run: exception')
-            sleep(1)
+    """
+    Можно запускать несколько процессов: они делят пользователей между собой
+    и подхватывают работу упавшего (см. telegram.sharding)
+    """
+
+    def main(self, *args, **options):
+        coordinator.start()
+        schedule.every(1).minutes.do(run_as_leader, tasks.notify_learning,
+                                     coordinator.shards_count)
+        metrics_logger = metrics.PeriodicLogger()
+
+        # notify_repetition сам говорит, когда его запускать: когда станет пора повторять,
+        # и сразу, если у процесса поменялись части пользователей
+        next_repetition_run = get_datetime_now()
+        repetition_shards = frozenset()
+        try:
+            while True:
+                try:
+                    schedule.run_pending()
+                    shards = coordinator.get_shards()
+                    if get_datetime_now() >= next_repetition_run or shards != repetition_shards:
+                        repetition_shards = shards
+                        # при ошибке - повтор через интервал, а не каждую секунду
+                        next_repetition_run = (
+                            get_datetime_now() + settings.TELEGRAM_REPETITION_NOTIFY_INTERVAL
+                        )
+                        if shards:
+                            next_repetition_run = tasks.notify_repetition(
+                                shards, coordinator.shards_count,
+                            )
+                    tasks.send_broadcasts(coordinator)
+                except Exception:
+                    logger.exception('Scheduler tasks run: exception')
+                metrics_logger.maybe_log()
+                sleep(1)
+        finally:
+            coordinator.stop()
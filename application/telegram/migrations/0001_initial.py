@@ -0,0 +1,40 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncomingUpdate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('update_id', models.BigIntegerField(unique=True, verbose_name='update_id в telegram')),
+                ('chat_id', models.BigIntegerField(blank=True, null=True)),
+                ('data', models.TextField(verbose_name='Обновление (json)')),
+                ('status', models.CharField(choices=[('new', 'ждет обработки'), ('processing', 'обрабатывается'), ('done', 'обработано'), ('dead', 'не удалось обработать')], default='new', max_length=20)),
+                ('attempts', models.IntegerField(default=0, verbose_name='Количество попыток обработки')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Не обрабатывать раньше этого времени')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Воркер взял обновление в работу до этого времени')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='Воркер')),
+                ('last_error', models.TextField(blank=True)),
+                ('date_processed', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Обновление от telegram',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='incomingupdate',
+            index=models.Index(condition=models.Q(status__in=('new', 'processing')), fields=['chat_id', 'update_id'], name='incoming_update_unfinished'),
+        ),
+    ]
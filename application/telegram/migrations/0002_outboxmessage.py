@@ -0,0 +1,38 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_auto_20190822_1126'),
+        ('telegram', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('chat_id', models.CharField(max_length=100, verbose_name='ID чата в телеграме')),
+                ('text', models.TextField(blank=True)),
+                ('markup', models.TextField(blank=True, verbose_name='reply_markup (json)')),
+                ('parse_mode', models.CharField(blank=True, max_length=20)),
+                ('status', models.CharField(choices=[('new', 'ждет отправки'), ('sending', 'отправляется'), ('failed', 'не удалось отправить')], default='new', max_length=20)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('word', models.ForeignKey(blank=True, help_text='Данные слова ищем в словаре уже после commit-а транзакции', null=True, on_delete=django.db.models.deletion.CASCADE, to='app.Word', verbose_name='Отправить произношение и картинку слова')),
+            ],
+            options={
+                'verbose_name': 'Сообщение для отправки',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(condition=models.Q(status__in=('new', 'sending')), fields=['date_created'], name='outbox_message_unsent'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.10 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram', '0002_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=100, verbose_name='Рассылка')),
+                ('shard', models.IntegerField(default=0)),
+                ('shards_count', models.IntegerField(default=1)),
+                ('status', models.CharField(choices=[('running', 'отправляется'), ('done', 'завершена')], default='running', max_length=20)),
+                ('last_user_id', models.IntegerField(default=0, verbose_name='Пользователи до этого id (включительно) обработаны')),
+                ('sent', models.IntegerField(default=0, verbose_name='Отправлено')),
+                ('failed', models.IntegerField(default=0, verbose_name='Не удалось отправить')),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Рассылка',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='broadcast',
+            constraint=models.UniqueConstraint(condition=models.Q(status='running'), fields=('name', 'shard', 'shards_count'), name='broadcast_running'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.10 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram', '0003_broadcast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Что арендовано')),
+                ('owner', models.CharField(max_length=100, verbose_name='Процесс')),
+                ('expires_at', models.DateTimeField(verbose_name='Действует до')),
+            ],
+            options={
+                'verbose_name': 'Аренда задач telegram_tasks',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.10 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram', '0004_tasklease'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outboxmessage',
+            name='outbox_message_unsent',
+        ),
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Процесс'),
+        ),
+        # сообщения new ждали отправки без аренды: отдаем их relay-ю
+        migrations.RunSQL(
+            sql="UPDATE telegram_outboxmessage SET status = 'sending', locked_until = now() "
+                "WHERE status = 'new';",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='status',
+            field=models.CharField(choices=[('sending', 'отправляется'), ('failed', 'не удалось отправить')], default='sending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(condition=models.Q(status='sending'), fields=['locked_until'], name='outbox_message_sending'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram', '0005_outboxmessage_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='attempts',
+            field=models.IntegerField(default=0, verbose_name='Не удалось отправить раз'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_next_repetition_time_trigger'),
+        ('telegram', '0006_outboxmessage_attempts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastDeferredUser',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('broadcast', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deferred', to='telegram.Broadcast')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.User')),
+            ],
+            options={
+                'verbose_name': 'Отложенный получатель рассылки',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='broadcastdeferreduser',
+            constraint=models.UniqueConstraint(fields=('broadcast', 'user'), name='broadcast_deferred_user'),
+        ),
+    ]
@@ -0,0 +1,181 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from app.models import CreatedUpdateBaseModel
+
+
+class IncomingUpdate(CreatedUpdateBaseModel):
+    """
+    Обновление от telegram в очереди на обработку (см. telegram.update_queue)
+    """
+    class Status:
+        NEW = 'new'
+        PROCESSING = 'processing'
+        DONE = 'done'
+        DEAD = 'dead'
+
+        # обновления чата обрабатываются по порядку: следующее ждет, пока предыдущие не завершатся
+        UNFINISHED = (NEW, PROCESSING)
+
+        CHOICES = (
+            (NEW, 'ждет обработки'),
+            (PROCESSING, 'обрабатывается'),
+            (DONE, 'обработано'),
+            (DEAD, 'не удалось обработать'),
+        )
+
+    update_id = models.BigIntegerField(unique=True, verbose_name='update_id в telegram')
+    chat_id = models.BigIntegerField(null=True, blank=True)
+    data = models.TextField(verbose_name='Обновление (json)')
+    status = models.CharField(max_length=20, choices=Status.CHOICES, default=Status.NEW)
+    attempts = models.IntegerField(default=0, verbose_name='Количество попыток обработки')
+    available_at = models.DateTimeField(
+        default=timezone.now, verbose_name='Не обрабатывать раньше этого времени',
+    )
+    locked_until = models.DateTimeField(
+        null=True, blank=True, verbose_name='Воркер взял обновление в работу до этого времени',
+    )
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='Воркер')
+    last_error = models.TextField(blank=True)
+    date_processed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Обновление от telegram'
+        indexes = [
+            models.Index(
+                fields=['chat_id', 'update_id'], name='incoming_update_unfinished',
+                condition=Q(status__in=('new', 'processing')),
+            ),
+        ]
+
+    def __str__(self):
+        return f'IncomingUpdate {self.update_id} chat_id={self.chat_id} {self.status}'
+
+
+class OutboxMessage(CreatedUpdateBaseModel):
+    """
+    Сообщение пользователю, которое отправится после commit-а транзакции (см. telegram.outbox)
+
+    Отправляет процесс, арендовавший сообщение (locked_by), пока продлевает аренду (locked_until).
+    Не отправленное повторяется с задержкой, после TELEGRAM_OUTBOX_MAX_ATTEMPTS попыток - failed
+    """
+    class Status:
+        SENDING = 'sending'
+        FAILED = 'failed'
+
+        CHOICES = (
+            (SENDING, 'отправляется'),
+            (FAILED, 'не удалось отправить'),
+        )
+
+    chat_id = models.CharField(max_length=100, verbose_name='ID чата в телеграме')
+    text = models.TextField(blank=True)
+    markup = models.TextField(blank=True, verbose_name='reply_markup (json)')
+    parse_mode = models.CharField(max_length=20, blank=True)
+    word = models.ForeignKey(
+        'app.Word', on_delete=models.CASCADE, null=True, blank=True,
+        verbose_name='Отправить произношение и картинку слова',
+        help_text='Данные слова ищем в словаре уже после commit-а транзакции',
+    )
+    status = models.CharField(max_length=20, choices=Status.CHOICES, default=Status.SENDING)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='Процесс')
+    attempts = models.IntegerField(default=0, verbose_name='Не удалось отправить раз')
+
+    class Meta:
+        verbose_name = 'Сообщение для отправки'
+        ordering = ('id',)
+        indexes = [
+            models.Index(
+                fields=['locked_until'], name='outbox_message_sending',
+                condition=Q(status='sending'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'OutboxMessage {self.id} chat_id={self.chat_id} {self.status}'
+
+
+class Broadcast(CreatedUpdateBaseModel):
+    """
+    Рассылка всем пользователям и ее прогресс (см. telegram.broadcast)
+
+    Рассылку можно разделить между процессами: каждый отправляет своей части
+    пользователей (user_id % shards_count == shard) и хранит свой прогресс.
+    """
+    class Status:
+        RUNNING = 'running'
+        DONE = 'done'
+
+        CHOICES = (
+            (RUNNING, 'отправляется'),
+            (DONE, 'завершена'),
+        )
+
+    name = models.CharField(max_length=100, verbose_name='Рассылка')
+    shard = models.IntegerField(default=0)
+    shards_count = models.IntegerField(default=1)
+    status = models.CharField(max_length=20, choices=Status.CHOICES, default=Status.RUNNING)
+    last_user_id = models.IntegerField(
+        default=0, verbose_name='Пользователи до этого id (включительно) обработаны',
+    )
+    sent = models.IntegerField(default=0, verbose_name='Отправлено')
+    failed = models.IntegerField(default=0, verbose_name='Не удалось отправить')
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Рассылка'
+        constraints = [
+            # незавершенная рассылка части пользователей одна: ее продолжают после падения
+            models.UniqueConstraint(
+                fields=['name', 'shard', 'shards_count'], name='broadcast_running',
+                condition=Q(status='running'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'Broadcast {self.name} {self.shard}/{self.shards_count} {self.status}'
+
+    @property
+    def throughput(self) -> float:
+        """ Сообщений в секунду от начала рассылки """
+        finished = self.date_finished or timezone.now()
+        seconds = (finished - self.date_created).total_seconds()
+        return (self.sent + self.failed) / seconds if seconds > 0 else 0
+
+
+class BroadcastDeferredUser(models.Model):
+    """
+    Пользователь, которого рассылка прошла в тихие часы: сообщение ему отправится,
+    когда они закончатся, даже если рассылка уже завершена (см. telegram.broadcast)
+    """
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, related_name='deferred')
+    user = models.ForeignKey('app.User', on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        verbose_name = 'Отложенный получатель рассылки'
+        constraints = [
+            # после падения рассылка снова проходит пользователей после сохраненного прогресса
+            models.UniqueConstraint(fields=['broadcast', 'user'], name='broadcast_deferred_user'),
+        ]
+
+    def __str__(self):
+        return f'BroadcastDeferredUser {self.broadcast_id} user_id={self.user_id}'
+
+
+class TaskLease(CreatedUpdateBaseModel):
+    """
+    Аренда работы процессом telegram_tasks (см. telegram.sharding): лидер, часть
+    пользователей или отметка о живом процессе. Не продленная до expires_at аренда
+    свободна, ее забирает другой процесс.
+    """
+    name = models.CharField(max_length=100, unique=True, verbose_name='Что арендовано')
+    owner = models.CharField(max_length=100, verbose_name='Процесс')
+    expires_at = models.DateTimeField(verbose_name='Действует до')
+
+    class Meta:
+        verbose_name = 'Аренда задач telegram_tasks'
+
+    def __str__(self):
+        return f'TaskLease {self.name} {self.owner}'
@@ -0,0 +1,238 @@
+"""
+Transactional outbox для сообщений пользователям
+
+Хэндлеры выполняются в транзакции (@atomic). Чтобы не держать транзакцию и блокировки строк,
+пока идут запросы в telegram и skyeng, send_message только сохраняет OutboxMessage
+в текущей транзакции, а отправка происходит после commit-а (transaction.on_commit):
+сообщения передаются в telegram.sender в порядке создания.
+Если транзакция откатилась - сообщения не отправятся.
+
+Сообщение сразу создается в аренде процесса (locked_by, locked_until): отправляет его только
+этот процесс, сколько бы оно ни ждало в очереди sender-а (рассылка, пауза после 429),
+OutboxRelay процесса продлевает аренду. Если процесс упал, аренда истекает и сообщение
+отправит OutboxRelay другого процесса.
+
+Если отправить не удалось (sender уже повторил временные ошибки), аренда снимается до
+TELEGRAM_OUTBOX_RETRY_DELAY * 2 ** (попытка - 1): потом сообщение отправит OutboxRelay любого
+процесса. После TELEGRAM_OUTBOX_MAX_ATTEMPTS попыток сообщение остается failed (см. админку).
+"""
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+import typing
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from app.dictionary import RunOrm, enrich_word, enrich_word_async
+from app.models import Word
+from clients.base import ClientException
+
+from . import aio, constants
+from .models import OutboxMessage
+from .sender import sender
+
+logger = logging.getLogger(__name__)
+
+OWNER = f'{socket.gethostname()}:{os.getpid()}'
+
+
+def get_lease_end():
+    return timezone.now() + settings.TELEGRAM_OUTBOX_RELAY_DELAY
+
+
+def add_message(chat_id, text='', markup=None, parse_mode=None,
+                word: typing.Optional[Word] = None) -> OutboxMessage:
+    message = OutboxMessage.objects.create(
+        chat_id=chat_id,
+        text=text,
+        markup=markup.to_json() if markup else '',
+        parse_mode=parse_mode or '',
+        word=word,
+        status=OutboxMessage.Status.SENDING,
+        locked_by=OWNER,
+        locked_until=get_lease_end(),
+    )
+    # аренду сообщения продлевает relay этого процесса
+    relay.start()
+    # вне транзакции (autocommit) on_commit выполняется сразу
+    transaction.on_commit(functools.partial(deliver, message))
+    return message
+
+
+def load_word(message: OutboxMessage) -> Word:
+    word = message.word
+    deferred_fields = word.get_deferred_fields()
+    if deferred_fields:
+        # общее слово из app.word_catalog: данные словаря загружаем одним запросом
+        word.refresh_from_db(fields=deferred_fields)
+    return word
+
+
+def get_word_sound_messages(word: Word) -> typing.List[typing.Tuple[str, str]]:
+    """ (текст, parse_mode) сообщений с произношением и картинкой слова """
+    if word.date_enriched is None:
+        # слово еще не обогащали (см. manage.py enrich_words): ищем в словаре сейчас
+        try:
+            enrich_word(word)
+        except ClientException:
+            return []
+    return format_word_sound_messages(word)
+
+
+async def get_word_sound_messages_async(word: Word,
+                                        run_orm: RunOrm) -> typing.List[typing.Tuple[str, str]]:
+    if word.date_enriched is None:
+        try:
+            await enrich_word_async(word, run_orm)
+        except ClientException:
+            return []
+    return format_word_sound_messages(word)
+
+
+def format_word_sound_messages(word: Word) -> typing.List[typing.Tuple[str, str]]:
+    if not word.sound_url:
+        return []
+
+    messages = [(
+        f'<a href="{word.sound_url}"><i>'
+        f'{constants.Emogies.headphones}: {word.dictionary_text}'
+        f'</i></a>',
+        'html',
+    )]
+    if word.image_url:
+        image_message = f'<a href="{word.image_url}"><i>{constants.Emogies.picture}</i></a>'
+        messages.append((image_message, 'html'))
+    return messages
+
+
+def deliver(message: OutboxMessage):
+    runtime = aio.get_running_runtime()
+    if runtime:
+        # asyncio runtime: поиск слова в словаре не занимает поток,
+        # сообщения чата передаются в sender в порядке создания
+        runtime.call_in_chat_order(
+            message.chat_id, functools.partial(deliver_async, message, runtime.run_orm),
+        )
+        return
+
+    if message.word_id:
+        texts = get_word_sound_messages(load_word(message))
+    else:
+        texts = [(message.text, message.parse_mode)]
+    if not send_texts(message, texts):
+        delete_message(message.id)
+
+
+async def deliver_async(message: OutboxMessage, run_orm: RunOrm):
+    if message.word_id:
+        word = await run_orm(load_word, message)
+        texts = await get_word_sound_messages_async(word, run_orm)
+    else:
+        texts = [(message.text, message.parse_mode)]
+    if not send_texts(message, texts):
+        await run_orm(delete_message, message.id)
+
+
+def send_texts(message: OutboxMessage, texts: typing.List[typing.Tuple[str, str]]) -> bool:
+    """ Передает сообщения в sender, False - отправлять нечего """
+    futures = [
+        sender.send(message.chat_id, text, markup=message.markup or None,
+                    parse_mode=parse_mode or None)
+        for text, parse_mode in texts
+    ]
+    for future in futures:
+        future.add_done_callback(functools.partial(_on_sent, message, futures))
+    return bool(futures)
+
+
+def delete_message(message_id: int):
+    OutboxMessage.objects.filter(id=message_id).delete()
+
+
+def _on_sent(message: OutboxMessage, futures: typing.List[Future], _: Future):
+    if not all(future.done() for future in futures):
+        return
+
+    try:
+        if all(future.result() for future in futures):
+            delete_message(message.id)
+        else:
+            mark_failed(message)
+    except Exception:
+        logger.exception('Fail update outbox message id=%s', message.id)
+
+
+def mark_failed(message: OutboxMessage):
+    attempts = message.attempts + 1
+    if attempts >= settings.TELEGRAM_OUTBOX_MAX_ATTEMPTS:
+        logger.error('Outbox message id=%s chat_id=%s failed after %d attempts',
+                     message.id, message.chat_id, attempts)
+        fields = dict(status=OutboxMessage.Status.FAILED)
+    else:
+        # без аренды: после задержки сообщение заберет relay любого процесса
+        retry_delay = settings.TELEGRAM_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+        fields = dict(locked_by='', locked_until=timezone.now() + retry_delay)
+
+    OutboxMessage.objects.filter(id=message.id).update(
+        attempts=attempts, date_updated=timezone.now(), **fields,
+    )
+
+
+class OutboxRelay:
+    def __init__(self, interval=30, batch_size=100):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name='outbox-relay', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.renew_leases()
+                while self.relay_stale_messages() == self.batch_size:
+                    pass
+            except Exception:
+                logger.exception('Outbox relay: exception')
+            finally:
+                close_old_connections()
+            time.sleep(self.interval)
+
+    def renew_leases(self) -> int:
+        """ Продлевает аренду сообщений, которые ждут отправки в этом процессе """
+        return OutboxMessage.objects.filter(
+            status=OutboxMessage.Status.SENDING, locked_by=OWNER,
+        ).update(locked_until=get_lease_end())
+
+    def relay_stale_messages(self) -> int:
+        """ Забирает сообщения упавших процессов (аренду не продлили) и повторы отправки """
+        with transaction.atomic():
+            messages = list(
+                OutboxMessage.objects
+                .filter(status=OutboxMessage.Status.SENDING, locked_until__lt=timezone.now())
+                .select_for_update(skip_locked=True)[:self.batch_size]
+            )
+            OutboxMessage.objects.filter(id__in=[message.id for message in messages]).update(
+                locked_by=OWNER, locked_until=get_lease_end(),
+            )
+
+        if messages:
+            logger.warning('Outbox relay: send %d stale or retried messages', len(messages))
+        for message in messages:
+            deliver(message)
+        return len(messages)
+
+
+relay = OutboxRelay()
@@ -0,0 +1,363 @@
+"""
+Планировщик отправки сообщений в telegram
+
+Telegram ограничивает отправку: около 30 сообщений в секунду всего и около 1 сообщения
+в секунду в один чат, при превышении отвечает 429 с retry_after.
+
+- лимиты соблюдаем token bucket-ами: общий и на каждый чат (с небольшим burst-ом,
+  т.к. ответ пользователю часто состоит из нескольких сообщений подряд).
+  Bucket-ы в памяти процесса: общий лимит делим на TELEGRAM_SENDER_PROCESSES
+  (процессы бота, воркеры, telegram_tasks), лимит чата - на процесс (сообщения чата
+  обычно отправляет один процесс), редкие превышения обрабатывает 429
+- сообщения одного чата отправляются по порядку, разных чатов - параллельно
+- ответы пользователям (INTERACTIVE) отправляются раньше рассылок (BROADCAST)
+- на 429 ждем retry_after, временные ошибки повторяем с backoff-ом,
+  остальные ошибки (например, пользователь заблокировал бота) не повторяем
+"""
+import asyncio
+import collections
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+import typing
+from concurrent.futures import Future, ThreadPoolExecutor
+from http import HTTPStatus
+
+import aiohttp
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from telebot import apihelper
+
+from app import metrics
+from app.utils import safe_str
+
+from . import aio
+from .bot import bot
+
+logger = logging.getLogger(__name__)
+
+
+class Priority:
+    INTERACTIVE = 0
+    BROADCAST = 1
+
+    ALL = (INTERACTIVE, BROADCAST)
+
+
+class TokenBucket:
+    """ Не потокобезопасный, используется под lock-ом OutboundScheduler """
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def get_delay(self, now: float) -> float:
+        """ Через сколько секунд можно будет взять токен """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float):
+        """ Следующий токен появится не раньше чем через seconds """
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class SendJob:
+    __slots__ = ('chat_id', 'text', 'markup', 'parse_mode', 'priority', 'attempts', 'future')
+
+    def __init__(self, chat_id, text, markup, parse_mode, priority):
+        self.chat_id = chat_id
+        self.text = text
+        self.markup = markup
+        self.parse_mode = parse_mode
+        self.priority = priority
+        self.attempts = 0
+        self.future = Future()
+
+
+def send_to_telegram(chat_id, text, markup=None, parse_mode=None):
+    if settings.TELEGRAM_DEBUG:
+        logger.info('Chat=%s SEND MESSAGE=%s', chat_id, safe_str(text))
+        return
+
+    bot.send_message(chat_id, text, reply_markup=markup, parse_mode=parse_mode)
+
+
+async def send_to_telegram_async(chat_id, text, markup=None, parse_mode=None):
+    """ Отправка из event loop-а asyncio runtime-а (telegram.aio) """
+    if settings.TELEGRAM_DEBUG:
+        logger.info('Chat=%s SEND MESSAGE=%s', chat_id, safe_str(text))
+        return
+
+    await aio.get_running_runtime().api.send_message(
+        chat_id, text, reply_markup=markup, parse_mode=parse_mode,
+    )
+
+
+def get_retry_after(exc: Exception) -> typing.Optional[float]:
+    if not isinstance(exc, apihelper.ApiException):
+        return None
+    if exc.result.status_code != HTTPStatus.TOO_MANY_REQUESTS:
+        return None
+    try:
+        return float(json.loads(exc.result.text)['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return 1.0
+
+
+def is_temporary_error(exc: Exception) -> bool:
+    if isinstance(exc, apihelper.ApiException):
+        return exc.result.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+    return isinstance(exc, (requests.exceptions.RequestException, aiohttp.ClientError,
+                            asyncio.TimeoutError))
+
+
+class OutboundScheduler:
+    """
+    Сообщения ставятся в очередь своего чата. Чат, у которого есть сообщения и нет отправки
+    в процессе, стоит в очереди ready своего приоритета (или в delayed, если лимит чата
+    исчерпан). Поток планировщика берет чат из ready с наивысшим приоритетом, когда есть
+    общий токен, и отдает отправку пулу потоков, а в asyncio runtime-е - корутиной
+    async_send_func в event loop.
+    """
+
+    def __init__(self, send_func: typing.Callable, global_rate: float, chat_rate: float,
+                 chat_burst: float, threads_count: int, max_attempts: int, retry_delay=0.5,
+                 async_send_func: typing.Optional[typing.Callable] = None,
+                 clock: typing.Callable[[], float] = time.monotonic):
+        """ clock - часы лимитов и пауз, в тестах - ненастоящие """
+        self.send_func = send_func
+        self.async_send_func = async_send_func
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.threads_count = threads_count
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._chat_jobs: typing.Dict[typing.Any, collections.deque] = {}
+        self._ready = {priority: collections.deque() for priority in Priority.ALL}
+        self._delayed = []  # heap: (время, когда чату можно отправить, seq, chat_id)
+        self._scheduled = set()  # чаты в ready или delayed
+        self._in_flight = set()
+        self._chat_buckets: typing.Dict[typing.Any, TokenBucket] = {}
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate, now=clock())
+        self._paused_until = 0
+        self._seq = itertools.count()
+        self._thread = None
+        self._pool = None
+        self._counters = metrics.Counters('sent', 'failed', 'retried', 'rate_limited')
+
+    def send(self, chat_id, text, markup=None, parse_mode=None,
+             priority=Priority.INTERACTIVE) -> Future:
+        """ Future вернет True, если сообщение отправлено """
+        self.start()
+
+        # chat_id приходит и числом (из telegram), и строкой (User.chat_id из БД):
+        # очередь чата должна быть одна, иначе сообщения чата уйдут параллельно
+        chat_id = str(chat_id)
+        job = SendJob(chat_id, text, markup, parse_mode, priority)
+        with self._wakeup:
+            self._chat_jobs.setdefault(chat_id, collections.deque()).append(job)
+            self._schedule_chat(chat_id, self.clock())
+            self._wakeup.notify()
+        return job.future
+
+    def start(self):
+        with self._lock:
+            if self._thread:
+                return
+            self._pool = ThreadPoolExecutor(self.threads_count, thread_name_prefix='sender')
+            self._thread = threading.Thread(target=self._run, name='sender-scheduler', daemon=True)
+            self._thread.start()
+
+    def _get_chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(
+                self.chat_rate, self.chat_burst, now=self.clock(),
+            )
+        return bucket
+
+    def _schedule_chat(self, chat_id, now: float):
+        if chat_id in self._in_flight or chat_id in self._scheduled:
+            return
+        jobs = self._chat_jobs.get(chat_id)
+        if not jobs:
+            return
+
+        self._scheduled.add(chat_id)
+        delay = self._get_chat_bucket(chat_id).get_delay(now)
+        if delay:
+            heapq.heappush(self._delayed, (now + delay, next(self._seq), chat_id))
+        else:
+            self._ready[jobs[0].priority].append(chat_id)
+
+    def _promote_delayed(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, chat_id = heapq.heappop(self._delayed)
+            self._ready[self._chat_jobs[chat_id][0].priority].append(chat_id)
+
+    def _get_wait_time(self, now: float) -> typing.Optional[float]:
+        """ 0 - можно отправлять; None - ждать, пока не появятся сообщения """
+        if not any(self._ready.values()):
+            return self._delayed[0][0] - now if self._delayed else None
+        return max(0, self._paused_until - now, self._global_bucket.get_delay(now))
+
+    def _take_job(self, now: float) -> SendJob:
+        chat_id = next(chats for chats in self._ready.values() if chats).popleft()
+        self._scheduled.discard(chat_id)
+        self._in_flight.add(chat_id)
+        self._global_bucket.consume(now)
+        self._get_chat_bucket(chat_id).consume(now)
+        return self._chat_jobs[chat_id].popleft()
+
+    def _run(self):
+        while True:
+            try:
+                self._dispatch_next()
+            except Exception:
+                logger.exception('Sender scheduler: exception')
+                time.sleep(1)
+
+    def _dispatch_next(self):
+        with self._wakeup:
+            now = self.clock()
+            self._promote_delayed(now)
+            wait_time = self._get_wait_time(now)
+            if wait_time != 0:
+                self._wakeup.wait(wait_time)
+                return
+            job = self._take_job(now)
+
+        try:
+            self._submit(job)
+        except Exception as e:
+            # иначе чат навсегда останется в _in_flight, а future - без результата
+            self._complete(job, e)
+            raise
+
+    def _submit(self, job: SendJob):
+        runtime = aio.get_running_runtime()
+        if runtime and self.async_send_func:
+            try:
+                runtime.spawn(self._send_async(job, runtime))
+                return
+            except RuntimeError:
+                # event loop уже остановлен
+                pass
+        self._pool.submit(self._send, job)
+
+    def _send(self, job: SendJob):
+        job.attempts += 1
+        try:
+            self.send_func(job.chat_id, job.text, job.markup, job.parse_mode)
+        except Exception as e:
+            self._complete(job, e)
+        else:
+            self._complete(job, None)
+
+    async def _send_async(self, job: SendJob, runtime: 'aio.AsyncRuntime'):
+        job.attempts += 1
+        try:
+            await self.async_send_func(job.chat_id, job.text, job.markup, job.parse_mode)
+        except Exception as e:
+            exc = e
+        else:
+            exc = None
+        # callback-и future (telegram.outbox) ходят в БД: не из event loop-а
+        await runtime.run_orm(self._complete, job, exc)
+
+    def _complete(self, job: SendJob, exc: typing.Optional[Exception]):
+        """ Результат попытки отправки: повтор или результат в future """
+        is_sent = exc is None
+        retry_delay = None if is_sent else self._get_retry_delay(job, exc)
+
+        with self._wakeup:
+            now = self.clock()
+            self._in_flight.discard(job.chat_id)
+            if retry_delay is not None:
+                self._chat_jobs[job.chat_id].appendleft(job)
+                self._get_chat_bucket(job.chat_id).block(now, retry_delay)
+            elif not self._chat_jobs[job.chat_id]:
+                del self._chat_jobs[job.chat_id]
+                if self._get_chat_bucket(job.chat_id).is_full(now):
+                    del self._chat_buckets[job.chat_id]
+            self._schedule_chat(job.chat_id, now)
+            self._wakeup.notify()
+
+        if retry_delay is None:
+            self._counters.incr('sent' if is_sent else 'failed')
+            try:
+                job.future.set_result(is_sent)
+            finally:
+                # callback-и future (telegram.outbox) ходят в БД из потока пула
+                close_old_connections()
+
+    def _get_retry_delay(self, job: SendJob, exc: Exception) -> typing.Optional[float]:
+        retry_after = get_retry_after(exc)
+        if retry_after is not None and job.attempts < self.max_attempts * 2:
+            logger.warning('Chat=%s too many requests, retry after %s', job.chat_id, retry_after)
+            self._counters.incr('rate_limited')
+            with self._lock:
+                # флуд-контроль telegram действует на все отправки бота
+                self._paused_until = max(self._paused_until, self.clock() + retry_after)
+            return retry_after
+
+        if job.attempts < self.max_attempts and is_temporary_error(exc):
+            logger.info('Chat=%s retry send, attempt=%d exception=%s',
+                        job.chat_id, job.attempts, exc)
+            self._counters.incr('retried')
+            return self.retry_delay * 2 ** (job.attempts - 1)
+
+        logger.info('Chat=%s cant send message: exception=%s, msg=%s', job.chat_id, exc, job.text)
+        return None
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            pending = collections.Counter()
+            for jobs in self._chat_jobs.values():
+                for job in jobs:
+                    pending[job.priority] += 1
+            return {
+                'pending_interactive': pending[Priority.INTERACTIVE],
+                'pending_broadcast': pending[Priority.BROADCAST],
+                'pending_chats': len(self._chat_jobs),
+                'in_flight': len(self._in_flight),
+                'paused_for': max(0, round(self._paused_until - self.clock(), 1)),
+                **self._counters.as_dict(),
+            }
+
+
+sender = OutboundScheduler(
+    send_func=send_to_telegram,
+    async_send_func=send_to_telegram_async,
+    global_rate=settings.TELEGRAM_SEND_GLOBAL_RATE / settings.TELEGRAM_SENDER_PROCESSES,
+    chat_rate=settings.TELEGRAM_SEND_CHAT_RATE,
+    chat_burst=settings.TELEGRAM_SEND_CHAT_BURST,
+    threads_count=settings.TELEGRAM_SENDER_THREADS,
+    max_attempts=settings.TELEGRAM_SEND_ATTEMPTS,
+)
+metrics.register('sender', sender.get_metrics)
@@ -0,0 +1,296 @@
+"""
+Разделение работы между процессами telegram_tasks
+
+Пользователи разделены на TELEGRAM_TASKS_SHARDS частей (user_id % shards_count).
+Процессы договариваются через аренды в Postgres (TaskLease), без отдельного координатора:
+- каждый процесс держит аренду member:<процесс> - так все знают, сколько процессов живо
+- аренду leader держит один процесс: он запускает задачи, которые нужны в одном экземпляре
+- аренды shard:<n> делятся поровну: процесс берет свободные части, пока у него меньше
+  shards_count / живых процессов, и отдает лишние, когда процессов стало больше.
+  Лишняя часть сразу перестает быть своей, но аренда ее продлевается, пока с частью
+  работают (hold, например отправка рассылки дожидается отправленных сообщений
+  и сохраняет прогресс): новый владелец начинает после этого
+
+Аренды продлевает поток coordinator каждые TELEGRAM_TASKS_LEASE_TTL / 3.
+Аренда упавшего процесса истекает через TTL, ее части забирают остальные.
+Процесс, который не смог продлить аренду (например, нет связи с БД), перестает считать
+части своими до истечения TTL, поэтому одну часть не обрабатывают два процесса.
+"""
+import collections
+import contextlib
+import logging
+import math
+import os
+import socket
+import threading
+import time
+import typing
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F, IntegerField, QuerySet, Value
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from app import metrics
+
+from .models import TaskLease
+
+logger = logging.getLogger(__name__)
+
+LEADER = 'leader'
+MEMBER_PREFIX = 'member:'
+SHARD_PREFIX = 'shard:'
+
+# берет свободную или истекшую аренду, продлевает свою;
+# возвращает прежнего владельца и сколько секунд назад истекла его аренда
+ACQUIRE_QUERY = '''
+WITH previous AS (
+    SELECT owner, expires_at FROM {lease} WHERE name = %(name)s
+)
+INSERT INTO {lease} (name, owner, expires_at, date_created, date_updated)
+VALUES (%(name)s, %(owner)s, now() + make_interval(secs => %(ttl)s), now(), now())
+ON CONFLICT (name) DO UPDATE
+SET owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at, date_updated = now()
+WHERE {lease}.owner = EXCLUDED.owner OR {lease}.expires_at < now()
+RETURNING
+    (SELECT owner FROM previous),
+    (SELECT extract(epoch FROM now() - expires_at) FROM previous)
+'''
+
+RENEW_QUERY = '''
+UPDATE {lease} SET expires_at = now() + make_interval(secs => %(ttl)s), date_updated = now()
+WHERE owner = %(owner)s AND name = ANY(%(names)s) AND expires_at > now()
+RETURNING name
+'''
+
+STATE_QUERY = '''
+SELECT
+    (SELECT count(*) FROM {lease} WHERE name LIKE %(member_prefix)s AND expires_at > now()),
+    ARRAY(SELECT name FROM {lease} WHERE name LIKE %(shard_prefix)s AND expires_at > now())
+'''
+
+
+def filter_shards(queryset: QuerySet, user_id_field: str, shards: typing.Collection[int],
+                  shards_count: int) -> QuerySet:
+    """ Пользователи частей shards (user_id % shards_count) """
+    if shards_count <= 1:
+        return queryset if shards else queryset.none()
+    return queryset.annotate(
+        user_shard=Mod(F(user_id_field), Value(shards_count, output_field=IntegerField())),
+    ).filter(user_shard__in=list(shards))
+
+
+def get_shard_name(shard: int) -> str:
+    return f'{SHARD_PREFIX}{shard}'
+
+
+class TaskCoordinator:
+    def __init__(self, shards_count: int, ttl: float, owner: str = None):
+        self.shards_count = shards_count
+        self.ttl = ttl
+        self.ttl_delta = timedelta(seconds=ttl)
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._shards: typing.FrozenSet[int] = frozenset()
+        # отданные части, аренду которых держим, пока с ними работают (hold)
+        self._draining: typing.FrozenSet[int] = frozenset()
+        self._held: typing.Counter[int] = collections.Counter()
+        self._is_leader = False
+        self._members = 0
+        # до этого времени (monotonic) аренды точно действуют: продлили их раньше, чем ttl назад
+        self._valid_until = 0
+        self._counters = metrics.Counters(
+            'renewals', 'renew_failures', 'acquired', 'taken_over', 'released', 'lost',
+            'drained',
+        )
+
+    def start(self):
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name='coordinator', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """ Отдает аренды сразу, не дожидаясь истечения TTL """
+        self._stopped.set()
+        with self._lock:
+            names = [get_shard_name(shard) for shard in self._shards | self._draining] + [
+                LEADER, MEMBER_PREFIX + self.owner,
+            ]
+            self._shards, self._is_leader, self._valid_until = frozenset(), False, 0
+            self._draining = frozenset()
+        TaskLease.objects.filter(owner=self.owner, name__in=names).delete()
+
+    @property
+    def is_leader(self) -> bool:
+        with self._lock:
+            return self._is_leader and time.monotonic() < self._valid_until
+
+    def get_shards(self) -> typing.FrozenSet[int]:
+        with self._lock:
+            return self._shards if time.monotonic() < self._valid_until else frozenset()
+
+    def owns(self, shard: int) -> bool:
+        return shard in self.get_shards()
+
+    @contextlib.contextmanager
+    def hold(self, shard: int):
+        """ Пока работа с частью не закончена, ее аренда не отдается другому процессу """
+        with self._lock:
+            self._held[shard] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._held[shard] -= 1
+                if not self._held[shard]:
+                    del self._held[shard]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            close_old_connections()
+            try:
+                self.heartbeat()
+            except Exception:
+                self._counters.incr('renew_failures')
+                logger.exception('Coordinator %s: heartbeat exception', self.owner)
+            self._stopped.wait(self.ttl / 3)
+
+    def heartbeat(self):
+        """ Продлевает аренды и выравнивает число частей между живыми процессами """
+        started = time.monotonic()
+        self._acquire(MEMBER_PREFIX + self.owner)
+        is_leader = self._acquire(LEADER)
+        shards = self._renew_shards()
+        self._drain_shards()
+        members, taken_shards = self._get_state()
+
+        if is_leader:
+            # у перезапущенного процесса новое имя: аренды member: упавших никто не продлит
+            TaskLease.objects.filter(
+                name__startswith=MEMBER_PREFIX, expires_at__lt=timezone.now() - self.ttl_delta,
+            ).delete()
+
+        target = math.ceil(self.shards_count / max(members, 1))
+        if len(shards) > target:
+            shards = self._release_shards(shards, len(shards) - target)
+        elif len(shards) < target:
+            shards |= self._acquire_shards(taken_shards, target - len(shards))
+
+        with self._lock:
+            if is_leader and not self._is_leader:
+                logger.info('Coordinator %s: became leader', self.owner)
+            if shards != self._shards:
+                logger.info('Coordinator %s: shards %s, members %d',
+                            self.owner, sorted(shards), members)
+            self._is_leader = is_leader
+            self._shards = frozenset(shards)
+            self._members = members
+            self._valid_until = started + self.ttl
+        self._counters.incr('renewals')
+
+    def _execute(self, query: str, params: dict):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                query.format(lease=connection.ops.quote_name(TaskLease._meta.db_table)), params,
+            )
+            return cursor.fetchall()
+
+    def _acquire(self, name: str) -> bool:
+        rows = self._execute(ACQUIRE_QUERY, {'name': name, 'owner': self.owner, 'ttl': self.ttl})
+        if not rows:
+            return False
+        previous_owner, expired_ago = rows[0]
+        if previous_owner != self.owner:
+            self._counters.incr('acquired')
+            if previous_owner is not None:
+                self._counters.incr('taken_over')
+                logger.warning('Coordinator %s: took %s over from %s, expired %.1fs ago',
+                               self.owner, name, previous_owner, expired_ago)
+        return True
+
+    def _renew_shards(self) -> typing.Set[int]:
+        """ Продлевает аренды своих и отданных, но еще занятых частей; возвращает свои """
+        with self._lock:
+            owned, draining = self._shards, self._draining
+        if not owned and not draining:
+            return set()
+        rows = self._execute(RENEW_QUERY, {
+            'owner': self.owner, 'ttl': self.ttl,
+            'names': [get_shard_name(shard) for shard in owned | draining],
+        })
+        renewed = {int(name[len(SHARD_PREFIX):]) for name, in rows}
+        lost = (owned | draining) - renewed
+        if lost:
+            self._counters.incr('lost', len(lost))
+            logger.warning('Coordinator %s: lost shards %s', self.owner, sorted(lost))
+        with self._lock:
+            self._draining = self._draining - lost
+        return owned & renewed
+
+    def _drain_shards(self):
+        """ Отдает аренды отданных частей, с которыми больше не работают """
+        with self._lock:
+            drained = frozenset(shard for shard in self._draining if shard not in self._held)
+            self._draining = self._draining - drained
+        if not drained:
+            return
+        TaskLease.objects.filter(
+            owner=self.owner, name__in=[get_shard_name(shard) for shard in drained],
+        ).delete()
+        self._counters.incr('drained', len(drained))
+        logger.info('Coordinator %s: drained shards %s', self.owner, sorted(drained))
+
+    def _get_state(self) -> typing.Tuple[int, typing.Set[int]]:
+        """ (живых процессов, занятые части) """
+        (members, names), = self._execute(STATE_QUERY, {
+            'member_prefix': MEMBER_PREFIX + '%', 'shard_prefix': SHARD_PREFIX + '%',
+        })
+        return members, {int(name[len(SHARD_PREFIX):]) for name in names}
+
+    def _acquire_shards(self, taken_shards: typing.Set[int], count: int) -> typing.Set[int]:
+        free_shards = [shard for shard in range(self.shards_count) if shard not in taken_shards]
+        acquired = set()
+        for shard in free_shards:
+            if len(acquired) == count:
+                break
+            if self._acquire(get_shard_name(shard)):
+                acquired.add(shard)
+        return acquired
+
+    def _release_shards(self, shards: typing.Set[int], count: int) -> typing.Set[int]:
+        released = set(sorted(shards)[-count:])
+        # сначала перестаем считать части своими, аренды отдаем, когда с частями закончат
+        with self._lock:
+            self._shards = self._shards - released
+            self._draining = self._draining | released
+        self._counters.incr('released', len(released))
+        self._drain_shards()
+        return shards - released
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            valid_for = self._valid_until - time.monotonic()
+            return {
+                'owner': self.owner,
+                'is_leader': self._is_leader and valid_for > 0,
+                'shards': len(self._shards) if valid_for > 0 else 0,
+                'draining': len(self._draining),
+                'members': self._members,
+                'valid_for': max(0, round(valid_for, 1)),
+                **self._counters.as_dict(),
+            }
+
+
+coordinator = TaskCoordinator(
+    shards_count=settings.TELEGRAM_TASKS_SHARDS,
+    ttl=settings.TELEGRAM_TASKS_LEASE_TTL.total_seconds(),
+)
+metrics.register('task_coordinator', coordinator.get_metrics)
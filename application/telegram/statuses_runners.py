@@ -1,14 +1,19 @@
+import functools
 import logging
 from abc import ABC, abstractmethod
 
 import telebot
 from django.conf import settings
+from django.db import transaction
 from django.db.transaction import atomic
 
 from app.models import User, WordStatus
+from app.prefetch import prefetcher
 from app.utils import get_datetime_now
 from telegram import constants
-from telegram.utils import generate_markup, get_learn_repeat_markup, get_success_text, send_message
+from telegram.utils import (
+    generate_markup, get_learn_repeat_markup, get_success_text, send_message, send_word_sound_data,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -45,7 +50,7 @@ class LearnWordRunner(BaseRunner):
         learning_status = self.user.learning_status
 
         # набрали слов. Пора заканчивать
-        if learning_status.count_words <= len(learning_status.repeat_words.all()):
+        if learning_status.count_words <= len(learning_status.repeat_word_ids):
             self.user.update_status(User.Status.FREE)
             message = '%s Отлично! Самое время повторить слова! %s' % (
                 constants.Emogies.rocket, constants.Emogies.rocket,
@@ -84,31 +89,18 @@ class LearnWordRunner(BaseRunner):
             parse_mode='markdown',
         )
         self.send_word_sound_data(word, commands)
+        self.prefetch_next_words()
 
-    def send_word_sound_data(self, word, commands):
-        word_data = word.find_word_in_skyeng_dict()
-        if not word_data:
-            return
+    def prefetch_next_words(self):
+        # первое слово - текущее, его данные загрузит outbox
+        words = self.user.learning_status.get_upcoming_learn_words(
+            settings.SKYENG_PREFETCH_WORDS + 1,
+        )[1:]
+        transaction.on_commit(functools.partial(prefetcher.prefetch, self.user.id, words))
 
-        audio_message = (
-            f'<a href="{word_data.get_sound_url()}"><i>'
-            f'{constants.Emogies.headphones}: {word_data.text}'
-            f'</i></a>'
-        )
-        send_message(
-            self.user, audio_message,
-            markup=generate_markup(*commands),
-            parse_mode='html',
-        )
-
-        image_url = word_data.get_image_url()
-        if image_url:
-            send_message(
-                self.user,
-                f'<a href="{image_url}"><i>{constants.Emogies.picture}</i></a>',
-                markup=generate_markup(*commands),
-                parse_mode='html',
-            )
+    def send_word_sound_data(self, word, commands):
+        # запрос в словарь выполнится после commit-а, вне транзакции
+        send_word_sound_data(self.user, word, markup=generate_markup(*commands))
 
     def set_learn_word(self, message_text: str) -> bool:
         word = self.user.learning_status.next_learn_word
@@ -120,7 +112,7 @@ class LearnWordRunner(BaseRunner):
             ws = WordStatus.objects.create(
                 user_id=self.user.id, word=word, start_repetition_time=get_datetime_now(),
             )
-            self.user.learning_status.repeat_words.add(ws)
+            self.user.learning_status.add_repeat_word(ws)
             self.user.learning_status.set_next_learn_word()
             return True
         elif message_text == constants.Commands.miss:
@@ -181,7 +173,7 @@ class RepeatWord(BaseRunner):
             send_message(self.user, 'Повторять слова это здоворо! *Приступим*! Введите перевод:',
                          parse_mode='markdown')
 
-        learning_status.set_repetition_word_status_id(next_word_status.id)
+        learning_status.set_repetition_word_status(next_word_status)
         word_for_translating = next_word_status.get_word_for_translating()
         send_message(
             self.user,
@@ -1,64 +1,101 @@
+import functools
 import logging
+import typing
+from datetime import datetime
 
-from app.models import User
+from django.conf import settings
+from django.db.models import Min
+
+from app.models import LearningStatus, User, filter_notifiable
 from app.utils import get_datetime_now
-from telegram import constants
+from telegram import broadcast, constants
+from telegram.sender import Priority
+from telegram.sharding import TaskCoordinator, filter_shards
 from telegram.utils import generate_markup, get_learn_repeat_markup, safe_send_message
 
 logger = logging.getLogger('telegram_tasks')
 
+LEARNING_BROADCAST = 'notify_learning'
 
-def notify_repetition():
-    logger.info('Start notify_repetition')
 
-    if not can_run_task():
-        logger.info('End (time) notify_repetition')
-        return
+def notify_repetition(shards: typing.Collection[int], shards_count: int) -> datetime:
+    """
+    Оповещает пользователей, которым пора повторять слова
 
-    now = get_datetime_now()
-    users = User.objects.filter(
-        status=User.Status.FREE,
-        learned_words__start_repetition_time__lt=now,
-        learningstatus__repetition_notified__isnull=True,
-    ).select_related('learningstatus').distinct()
+    Пользователи выбираются по LearningStatus.next_repetition_time (индекс
+    app_learningstatus_due_idx), возвращается время следующего запуска:
+    когда станет пора повторять следующему пользователю,
+    но не позже TELEGRAM_REPETITION_NOTIFY_INTERVAL: пользователи, у которых тихие часы,
+    получат оповещение в первый запуск после них.
+    shards - части пользователей этого процесса (user_id % shards_count)
 
-    logger.info('get users %d', users.count())
+    Часть могут отдать другому процессу, пока идет запуск, и он выберет тех же пользователей:
+    пользователь отмечается оповещенным до отправки, условно (mark_notified),
+    и сообщение отправляет только тот процесс, который отметил его первым.
+    """
+    logger.info('Start notify_repetition')
 
-    for user in users.iterator():
+    now = get_datetime_now()
+    next_run = now + settings.TELEGRAM_REPETITION_NOTIFY_INTERVAL
+
+    not_notified = filter_shards(
+        LearningStatus.objects.filter(repetition_notified__isnull=True),
+        'user_id', shards, shards_count,
+    )
+    learning_statuses = filter_notifiable(
+        not_notified.filter(next_repetition_time__lt=now, user__status=User.Status.FREE),
+        now, 'user__',
+    ).select_related('user')
+
+    count = 0
+    for learning_status in learning_statuses.iterator():
+        if not learning_status.mark_notified(get_datetime_now()):
+            continue
         safe_send_message(
-            user,
+            learning_status.user,
             'Hello, my friend! Do you want to repeat new words?',
             markup=generate_markup(constants.Handlers.repetition.path),
+            priority=Priority.BROADCAST,
         )
-        user.learningstatus.update_notification_time(get_datetime_now())
+        count += 1
 
-    logger.info('End notify_repetition')
+    next_due = not_notified.filter(next_repetition_time__gte=now).aggregate(
+        next_due=Min('next_repetition_time'),
+    )['next_due']
+    if next_due is not None and next_due < next_run:
+        next_run = next_due
 
+    logger.info('End notify_repetition: users %d, next run %s', count, next_run)
+    return next_run
 
-def notify_learning():
-    logger.info('Start notify_learning')
 
-    if not can_run_task():
-        logger.info('End (time) notify_learning')
+def notify_learning(shards_count: int):
+    """
+    Лидер раз в TELEGRAM_LEARNING_BROADCAST_INTERVAL начинает рассылку всем частям
+    пользователей, отправляют ее владельцы частей (send_broadcasts)
+    """
+    since = get_datetime_now() - settings.TELEGRAM_LEARNING_BROADCAST_INTERVAL
+    if broadcast.is_started_since(LEARNING_BROADCAST, since):
         return
 
-    for user in User.objects.iterator():
-        safe_send_message(
-            user,
-            'Hi! I want to suggest learning new words) Давай, изучи пару слов!',
-            markup=get_learn_repeat_markup(),
-        )
-    logger.info('End notify_learning')
-
-
-def can_run_task():
-    now = get_datetime_now()
-
-    logger.info('Current time %s', now)
-
-    hours_from, hours_to = 10, 22
-    if hours_from <= now.hour <= hours_to:
-        return True
-
-    logger.info('My time is not got! %s', now)
-    return False
+    broadcast.start(LEARNING_BROADCAST, shards_count)
+    logger.info('Start notify_learning for %d shards', shards_count)
+
+
+def send_broadcasts(coordinator: TaskCoordinator):
+    """
+    Отправляет незавершенные рассылки частей, которыми владеет процесс, и отложенные
+    на тихие часы сообщения рассылок этих частей
+    """
+    running = broadcast.get_running(
+        LEARNING_BROADCAST, coordinator.get_shards(), coordinator.shards_count,
+    )
+    for shard_broadcast in running:
+        # часть могли отдать: аренду держим, пока отправленное не сохранено
+        with coordinator.hold(shard_broadcast.shard):
+            broadcast.BroadcastRun(
+                shard_broadcast,
+                'Hi! I want to suggest learning new words) Давай, изучи пару слов!',
+                markup=get_learn_repeat_markup(),
+                is_owned=functools.partial(coordinator.owns, shard_broadcast.shard),
+            ).run()
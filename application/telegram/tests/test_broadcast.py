@@ -0,0 +1,82 @@
+import datetime
+from concurrent.futures import Future
+from unittest import mock
+
+from django.test import TestCase
+
+from app.models import User
+from telegram import broadcast
+from telegram.models import Broadcast, BroadcastDeferredUser
+
+NAME = 'test_broadcast'
+
+
+class FakeSender:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, chat_id, text, **kwargs) -> Future:
+        self.sent.append(chat_id)
+        future = Future()
+        future.set_result(True)
+        return future
+
+
+def at(hour: int, minute: int = 0) -> datetime.datetime:
+    return datetime.datetime(2026, 1, 10, hour, minute, tzinfo=datetime.timezone.utc)
+
+
+class BroadcastQuietHoursTests(TestCase):
+    """ Пользователи в тихие часы не пропускаются, а получают рассылку, когда те кончатся """
+
+    def setUp(self):
+        self.sleeping = User.objects.create(
+            chat_id='sleeping', username='sleeping', timezone='UTC',
+            quiet_hours_start=datetime.time(22), quiet_hours_end=datetime.time(7),
+        )
+        self.awake = User.objects.create(
+            chat_id='awake', username='awake', timezone='UTC',
+            quiet_hours_start=datetime.time(0), quiet_hours_end=datetime.time(0),
+        )
+        self.sender = FakeSender()
+        patcher = mock.patch.object(broadcast, 'sender', self.sender)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_broadcasts(self, now: datetime.datetime):
+        with mock.patch.object(broadcast, 'get_datetime_now', return_value=now):
+            for shard_broadcast in broadcast.get_running(NAME, [0], 1):
+                self.assertTrue(broadcast.BroadcastRun(shard_broadcast, 'text').run())
+
+    def test_deferred_until_quiet_hours_end(self):
+        broadcast.start(NAME, 1)
+        self.run_broadcasts(at(23))
+        self.assertEqual(self.sender.sent, ['awake'])
+        shard_broadcast = Broadcast.objects.get(name=NAME)
+        self.assertEqual(shard_broadcast.status, Broadcast.Status.DONE)
+        self.assertEqual(shard_broadcast.last_user_id, max(self.sleeping.id, self.awake.id))
+        self.assertEqual(list(shard_broadcast.deferred.values_list('user_id', flat=True)),
+                         [self.sleeping.id])
+
+        # тихие часы через полночь: в 06:59 еще рано
+        self.run_broadcasts(at(6, 59))
+        self.assertEqual(self.sender.sent, ['awake'])
+
+        self.run_broadcasts(at(7))
+        self.assertEqual(self.sender.sent, ['awake', 'sleeping'])
+        self.assertFalse(BroadcastDeferredUser.objects.exists())
+        self.assertEqual(Broadcast.objects.get(name=NAME).sent, 2)
+        self.assertFalse(broadcast.get_running(NAME, [0], 1).exists())
+
+    def test_next_broadcast_replaces_deferred(self):
+        broadcast.start(NAME, 1)
+        self.run_broadcasts(at(23))
+        # следующая рассылка снова застала пользователя в тихие часы
+        broadcast.start(NAME, 1)
+        self.run_broadcasts(at(3))
+        self.assertEqual(self.sender.sent, ['awake', 'awake'])
+        self.assertEqual(BroadcastDeferredUser.objects.count(), 1)
+
+        self.run_broadcasts(at(8))
+        self.assertEqual(self.sender.sent, ['awake', 'awake', 'sleeping'])
+        self.assertFalse(BroadcastDeferredUser.objects.exists())
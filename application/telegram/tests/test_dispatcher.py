@@ -0,0 +1,80 @@
+import threading
+import time
+
+import telebot
+from django.test import SimpleTestCase
+
+from telegram.dispatcher import ChatDispatcher
+
+
+def make_update(update_id: int, chat_id: int) -> telebot.types.Update:
+    return telebot.types.Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': str(update_id),
+        'chat': {'id': chat_id, 'type': 'private'},
+    }})
+
+
+class ChatDispatcherTests(SimpleTestCase):
+    """ Обновления одного чата - по очереди, разных чатов - параллельно """
+
+    def setUp(self):
+        self.blocked_chat = 1
+        self.unblock = threading.Event()
+        self.lock = threading.Lock()
+        self.processed = []  # (chat_id, update_id) в порядке обработки
+        self.running = {}  # chat_id -> сколько обновлений чата обрабатывается сейчас
+        self.max_running = {}
+
+    def process(self, update: telebot.types.Update):
+        chat_id = update.message.chat.id
+        with self.lock:
+            self.running[chat_id] = self.running.get(chat_id, 0) + 1
+            self.max_running[chat_id] = max(self.max_running.get(chat_id, 0),
+                                            self.running[chat_id])
+        if chat_id == self.blocked_chat:
+            self.unblock.wait(5)
+        time.sleep(0.001)
+        with self.lock:
+            self.running[chat_id] -= 1
+            self.processed.append((chat_id, update.update_id))
+
+    def get_processed(self, chat_id: int) -> list:
+        with self.lock:
+            return [update_id for chat, update_id in self.processed if chat == chat_id]
+
+    def wait(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_chats_in_parallel_updates_of_chat_in_order(self):
+        dispatcher = ChatDispatcher(workers_count=4, max_pending=1000, process=self.process)
+        chats = [1, 2, 3]
+        expected = {chat_id: [] for chat_id in chats}
+        for update_id in range(1, 61):
+            chat_id = chats[update_id % len(chats)]
+            expected[chat_id].append(update_id)
+            dispatcher.submit(make_update(update_id, chat_id))
+
+        # первый чат стоит на первом обновлении, остальные чаты обрабатываются
+        for chat_id in (2, 3):
+            self.assertTrue(self.wait(lambda: len(self.get_processed(chat_id)) == 20), chat_id)
+        self.assertEqual(self.get_processed(self.blocked_chat), [])
+
+        self.unblock.set()
+        self.assertTrue(self.wait(lambda: len(self.get_processed(self.blocked_chat)) == 20))
+        for chat_id in chats:
+            self.assertEqual(self.get_processed(chat_id), expected[chat_id])
+            self.assertEqual(self.max_running[chat_id], 1)
+        self.assertEqual(dispatcher.get_metrics()['pending_updates'], 0)
+
+    def test_full_queue_rejects_without_block(self):
+        dispatcher = ChatDispatcher(workers_count=1, max_pending=2, process=self.process)
+        self.assertTrue(dispatcher.submit(make_update(1, self.blocked_chat), block=False))
+        self.assertTrue(dispatcher.submit(make_update(2, self.blocked_chat), block=False))
+        self.assertFalse(dispatcher.submit(make_update(3, 2), block=False))
+
+        self.unblock.set()
+        self.assertTrue(self.wait(lambda: len(self.processed) == 2))
+        self.assertEqual(dispatcher.get_metrics()['rejected'], 1)
@@ -0,0 +1,132 @@
+import functools
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
+
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from telebot import apihelper
+
+from project.testing import FakeServer
+from telegram import outbox
+from telegram.models import OutboxMessage
+
+
+def make_future(result: bool) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+@override_settings(TELEGRAM_DEBUG=False, TELEGRAM_OUTBOX_MAX_ATTEMPTS=3,
+                   TELEGRAM_OUTBOX_RETRY_DELAY=timedelta(minutes=1))
+class OutboxTests(TransactionTestCase):
+    """ Отправка после commit-а, аренда сообщений процессом, relay и повторы """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.bot_api = FakeServer('fake_bot_api', 'FakeBotApi')
+        cls.bot_api.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bot_api.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        make_request = functools.partial(
+            apihelper._make_request, base_url=self.bot_api.url + '/bot{0}/{1}',
+        )
+        for patcher in (mock.patch.object(apihelper, '_make_request', make_request),
+                        # поток relay-я тест заменяет явными вызовами
+                        mock.patch.object(outbox.relay, 'start')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.bot_api.api.sent.clear()
+
+    def wait_sent(self, chat_id: str, timeout=5) -> list:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            sent = [message['text'] for message in self.bot_api.api.sent
+                    if str(message['chat_id']) == chat_id]
+            if sent and not OutboxMessage.objects.filter(chat_id=chat_id).exists():
+                return sent
+            time.sleep(0.05)
+        return []
+
+    def test_sent_after_commit(self):
+        with transaction.atomic():
+            message = outbox.add_message('201', 'after commit')
+            self.assertEqual(message.locked_by, outbox.OWNER)
+            time.sleep(0.2)
+            self.assertEqual(self.bot_api.api.sent, [])
+
+        self.assertEqual(self.wait_sent('201'), ['after commit'])
+
+    def test_rollback_drops_message(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            outbox.add_message('202', 'rolled back')
+            raise ValueError
+
+        time.sleep(0.2)
+        self.assertFalse(OutboxMessage.objects.filter(chat_id='202').exists())
+        self.assertEqual(self.bot_api.api.sent, [])
+
+    def test_renew_own_leases(self):
+        soon = timezone.now() + timedelta(seconds=1)
+        own = OutboxMessage.objects.create(chat_id='203', locked_by=outbox.OWNER,
+                                           locked_until=soon)
+        other = OutboxMessage.objects.create(chat_id='203', locked_by='other', locked_until=soon)
+
+        self.assertEqual(outbox.relay.renew_leases(), 1)
+        own.refresh_from_db()
+        other.refresh_from_db()
+        self.assertGreater(own.locked_until, timezone.now() + timedelta(minutes=1))
+        self.assertEqual(other.locked_until, soon)
+
+    def test_relay_takes_stale_lease(self):
+        OutboxMessage.objects.create(chat_id='204', text='stale', locked_by='crashed',
+                                     locked_until=timezone.now() - timedelta(seconds=1))
+        OutboxMessage.objects.create(chat_id='205', text='leased', locked_by='alive',
+                                     locked_until=timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual(outbox.relay.relay_stale_messages(), 1)
+        self.assertEqual(self.wait_sent('204'), ['stale'])
+        self.assertEqual(OutboxMessage.objects.get(chat_id='205').locked_by, 'alive')
+
+    def test_failed_message_is_retried_then_failed(self):
+        message = OutboxMessage.objects.create(chat_id='206', text='retry',
+                                               locked_by=outbox.OWNER,
+                                               locked_until=outbox.get_lease_end())
+        futures = [make_future(True), make_future(False)]
+
+        outbox._on_sent(message, futures, futures[0])
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.Status.SENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.locked_by, '')
+        self.assertAlmostEqual(message.locked_until - timezone.now(), timedelta(minutes=1),
+                               delta=timedelta(seconds=5))
+        # пока не прошла задержка, relay сообщение не берет
+        self.assertEqual(outbox.relay.relay_stale_messages(), 0)
+
+        outbox._on_sent(message, futures, futures[0])
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 2)
+        self.assertAlmostEqual(message.locked_until - timezone.now(), timedelta(minutes=2),
+                               delta=timedelta(seconds=5))
+
+        outbox._on_sent(message, futures, futures[0])
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.Status.FAILED)
+        self.assertEqual(message.attempts, 3)
+
+    def test_retry_is_sent_by_relay(self):
+        OutboxMessage.objects.create(chat_id='207', text='retry', attempts=1,
+                                     locked_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(outbox.relay.relay_stale_messages(), 1)
+        self.assertEqual(self.wait_sent('207'), ['retry'])
@@ -0,0 +1,140 @@
+import functools
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from telebot import apihelper
+
+from project.testing import FakeServer
+from telegram.sender import OutboundScheduler, Priority, send_to_telegram
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class ManualScheduler(OutboundScheduler):
+    """ Без потоков: тест сам отправляет то, что можно отправить по ненастоящим часам """
+
+    def start(self):
+        pass
+
+    def dispatch_ready(self) -> int:
+        count = 0
+        while True:
+            with self._wakeup:
+                now = self.clock()
+                self._promote_delayed(now)
+                if self._get_wait_time(now) != 0:
+                    return count
+                job = self._take_job(now)
+            self._send(job)
+            count += 1
+
+
+@override_settings(TELEGRAM_DEBUG=False)
+class OutboundSchedulerTests(SimpleTestCase):
+    """ Лимиты, приоритеты и пауза после 429 на ненастоящих часах, отправка - в fake Bot API """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.bot_api = FakeServer('fake_bot_api', 'FakeBotApi')
+        cls.bot_api.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bot_api.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        make_request = functools.partial(
+            apihelper._make_request, base_url=self.bot_api.url + '/bot{0}/{1}',
+        )
+        patcher = mock.patch.object(apihelper, '_make_request', make_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.bot_api.api.sent.clear()
+        self.bot_api.api.set_too_many_requests(0)
+        self.clock = FakeClock()
+
+    def make_scheduler(self, global_rate=100, chat_rate=100, chat_burst=100) -> ManualScheduler:
+        return ManualScheduler(
+            send_func=send_to_telegram, global_rate=global_rate, chat_rate=chat_rate,
+            chat_burst=chat_burst, threads_count=1, max_attempts=3, clock=self.clock,
+        )
+
+    def get_sent(self) -> list:
+        return [(int(message['chat_id']), message['text']) for message in self.bot_api.api.sent]
+
+    def test_global_bucket(self):
+        scheduler = self.make_scheduler(global_rate=2)
+        for chat_id in range(1, 6):
+            scheduler.send(chat_id, 'text')
+
+        self.assertEqual(scheduler.dispatch_ready(), 2)
+        self.clock.advance(0.4)
+        self.assertEqual(scheduler.dispatch_ready(), 0)
+        self.clock.advance(0.2)
+        self.assertEqual(scheduler.dispatch_ready(), 1)
+        self.clock.advance(1)
+        self.assertEqual(scheduler.dispatch_ready(), 2)
+        self.assertEqual([chat_id for chat_id, _ in self.get_sent()], [1, 2, 3, 4, 5])
+
+    def test_chat_bucket_keeps_order(self):
+        scheduler = self.make_scheduler(chat_rate=1, chat_burst=2)
+        futures = [scheduler.send(1, f'text {number}') for number in range(4)]
+        other = scheduler.send('2', 'other')
+
+        # burst чата - два сообщения, другой чат лимит первого не ждет
+        self.assertEqual(scheduler.dispatch_ready(), 3)
+        self.clock.advance(0.9)
+        self.assertEqual(scheduler.dispatch_ready(), 0)
+        self.clock.advance(0.2)
+        self.assertEqual(scheduler.dispatch_ready(), 1)
+        self.clock.advance(1)
+        self.assertEqual(scheduler.dispatch_ready(), 1)
+
+        self.assertEqual([text for chat_id, text in self.get_sent() if chat_id == 1],
+                         [f'text {number}' for number in range(4)])
+        self.assertTrue(all(future.result(0) for future in futures + [other]))
+
+    def test_interactive_before_broadcast(self):
+        scheduler = self.make_scheduler(global_rate=1)
+        scheduler.send(1, 'broadcast', priority=Priority.BROADCAST)
+        scheduler.send(2, 'broadcast', priority=Priority.BROADCAST)
+        scheduler.send(3, 'reply')
+
+        self.assertEqual(scheduler.dispatch_ready(), 1)
+        self.clock.advance(1)
+        self.assertEqual(scheduler.dispatch_ready(), 1)
+        self.clock.advance(1)
+        self.assertEqual(scheduler.dispatch_ready(), 1)
+        self.assertEqual([chat_id for chat_id, _ in self.get_sent()], [3, 1, 2])
+
+    def test_too_many_requests_pauses_all_chats(self):
+        scheduler = self.make_scheduler()
+        self.bot_api.api.set_too_many_requests(1, retry_after=5)
+        first = scheduler.send(1, 'first')
+        second = scheduler.send(2, 'second')
+
+        # 429 на первом: отправка всех чатов ждет retry_after
+        self.assertEqual(scheduler.dispatch_ready(), 1)
+        self.assertEqual(self.get_sent(), [])
+        self.assertFalse(first.done())
+        self.assertEqual(scheduler.get_metrics()['rate_limited'], 1)
+        self.clock.advance(4.9)
+        self.assertEqual(scheduler.dispatch_ready(), 0)
+
+        self.clock.advance(0.2)
+        self.assertEqual(scheduler.dispatch_ready(), 2)
+        self.assertEqual(sorted(self.get_sent()), [(1, 'first'), (2, 'second')])
+        self.assertTrue(first.result(0))
+        self.assertTrue(second.result(0))
@@ -0,0 +1,115 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from telegram.management.commands import telegram_tasks
+from telegram.models import TaskLease
+from telegram.sharding import LEADER, TaskCoordinator, get_shard_name
+
+
+class TaskCoordinatorTests(TransactionTestCase):
+    """ Два процесса telegram_tasks: продление, захват истекших аренд, передача частей, лидер """
+
+    shards_count = 4
+
+    def make_coordinator(self, owner: str) -> TaskCoordinator:
+        coordinator = TaskCoordinator(self.shards_count, ttl=30, owner=owner)
+        self.addCleanup(coordinator.stop)
+        return coordinator
+
+    def get_owner(self, name: str) -> str:
+        return TaskLease.objects.get(name=name).owner
+
+    def test_renewal(self):
+        first = self.make_coordinator('first')
+        first.heartbeat()
+        expires_at = dict(TaskLease.objects.values_list('name', 'expires_at'))
+
+        first.heartbeat()
+        renewed = dict(TaskLease.objects.values_list('name', 'expires_at'))
+        self.assertEqual(renewed.keys(), expires_at.keys())
+        self.assertTrue(all(renewed[name] > expires_at[name] for name in expires_at))
+        self.assertEqual(set(TaskLease.objects.values_list('owner', flat=True)), {'first'})
+        self.assertEqual(first.get_shards(), frozenset(range(self.shards_count)))
+        self.assertEqual(first.get_metrics()['renewals'], 2)
+
+    def test_shards_are_split(self):
+        first = self.make_coordinator('first')
+        second = self.make_coordinator('second')
+        first.heartbeat()
+        # все части заняты первым: второй ждет, пока тот отдаст лишние
+        second.heartbeat()
+        self.assertEqual(second.get_shards(), frozenset())
+
+        first.heartbeat()
+        second.heartbeat()
+        self.assertEqual(len(first.get_shards()), 2)
+        self.assertEqual(len(second.get_shards()), 2)
+        self.assertEqual(first.get_shards() | second.get_shards(),
+                         frozenset(range(self.shards_count)))
+
+    def test_takeover_after_expiry(self):
+        first = self.make_coordinator('first')
+        second = self.make_coordinator('second')
+        first.heartbeat()
+        self.assertTrue(first.is_leader)
+
+        # первый упал: его аренды не продлеваются и истекают
+        TaskLease.objects.filter(owner='first').update(
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        second.heartbeat()
+        self.assertTrue(second.is_leader)
+        self.assertEqual(second.get_shards(), frozenset(range(self.shards_count)))
+        self.assertEqual(second.get_metrics()['taken_over'], self.shards_count + 1)
+
+        # ожил: истекшие аренды не продлеваются, части уже у второго
+        first.heartbeat()
+        self.assertFalse(first.is_leader)
+        self.assertEqual(first.get_shards(), frozenset())
+        self.assertEqual(first.get_metrics()['lost'], self.shards_count)
+        self.assertEqual(self.get_owner(LEADER), 'second')
+
+    def test_held_shard_is_not_handed_over(self):
+        first = self.make_coordinator('first')
+        second = self.make_coordinator('second')
+        first.heartbeat()
+        released = get_shard_name(self.shards_count - 1)
+
+        with first.hold(self.shards_count - 1):
+            second.heartbeat()
+            first.heartbeat()
+            second.heartbeat()
+            # отданы две части: свободную аренду отдали сразу, занятую держим, пока с ней работают
+            self.assertNotIn(self.shards_count - 1, first.get_shards())
+            self.assertEqual(first.get_metrics()['draining'], 1)
+            self.assertEqual(self.get_owner(released), 'first')
+            self.assertNotIn(self.shards_count - 1, second.get_shards())
+
+        first.heartbeat()
+        second.heartbeat()
+        self.assertEqual(first.get_metrics()['draining'], 0)
+        self.assertEqual(self.get_owner(released), 'second')
+        self.assertIn(self.shards_count - 1, second.get_shards())
+
+    def test_leader_job_runs_on_one_process(self):
+        first = self.make_coordinator('first')
+        second = self.make_coordinator('second')
+        first.heartbeat()
+        second.heartbeat()
+
+        job = mock.Mock()
+        for coordinator in (first, second):
+            with mock.patch.object(telegram_tasks, 'coordinator', coordinator):
+                telegram_tasks.run_as_leader(job, 'shards')
+        job.assert_called_once_with('shards')
+        self.assertNotEqual(first.is_leader, second.is_leader)
+
+        # лидер остановился: задачу выполняет второй
+        first.stop()
+        second.heartbeat()
+        with mock.patch.object(telegram_tasks, 'coordinator', second):
+            telegram_tasks.run_as_leader(job, 'shards')
+        self.assertEqual(job.call_count, 2)
@@ -0,0 +1,62 @@
+import datetime
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+
+from app.models import LearningStatus, User
+from app.utils import get_datetime_now
+from telegram import tasks
+
+
+class NotifyRepetitionTests(TestCase):
+    """ Оповещение о повторении уходит пользователю один раз, даже если его выбрали два процесса """
+
+    def setUp(self):
+        self.statuses = []
+        for number in range(2):
+            # тихих часов нет: оповещать можно в любое время
+            user = User.objects.create(chat_id=f'notify-{number}', username='notify',
+                                       quiet_hours_start=datetime.time(0),
+                                       quiet_hours_end=datetime.time(0))
+            self.statuses.append(LearningStatus.objects.create(
+                user=user, next_repetition_time=get_datetime_now() - timedelta(minutes=1),
+            ))
+        patcher = mock.patch.object(tasks, 'safe_send_message', return_value=True)
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_notified_chats(self) -> list:
+        return sorted(call[0][0].chat_id for call in self.send.call_args_list)
+
+    def test_notified_once(self):
+        tasks.notify_repetition({0, 1}, 2)
+        self.assertEqual(self.get_notified_chats(), ['notify-0', 'notify-1'])
+        for status in self.statuses:
+            status.refresh_from_db()
+            self.assertIsNotNone(status.repetition_notified)
+
+        tasks.notify_repetition({0, 1}, 2)
+        self.assertEqual(self.send.call_count, 2)
+
+    def test_user_marked_by_other_process(self):
+        def send_and_notify_others(user, *args, **kwargs):
+            # пока этот процесс отправляет, другой (новый владелец части) отметил остальных
+            LearningStatus.objects.exclude(user=user).filter(
+                repetition_notified__isnull=True,
+            ).update(repetition_notified=get_datetime_now())
+            return True
+
+        self.send.side_effect = send_and_notify_others
+        tasks.notify_repetition({0, 1}, 2)
+        self.assertEqual(self.send.call_count, 1)
+
+    def test_mark_notified(self):
+        status = self.statuses[0]
+        stale = LearningStatus.objects.get(pk=status.pk)
+        now = get_datetime_now()
+
+        self.assertTrue(status.mark_notified(now))
+        self.assertEqual(status.repetition_notified, now)
+        self.assertFalse(stale.mark_notified(now))
+        self.assertIsNone(stale.repetition_notified)
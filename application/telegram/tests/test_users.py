@@ -0,0 +1,82 @@
+import threading
+import time
+
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from app.models import LearningStatus, User
+from telegram.users import resolve_user
+
+
+class ResolveUserTests(TransactionTestCase):
+    """ Пользователь и его LearningStatus одним запросом: создание, поиск, гонка создания """
+
+    def test_new_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            user, is_created = resolve_user(301, 'new_user')
+
+        self.assertTrue(is_created)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(User.objects.get(chat_id='301').id, user.id)
+        self.assertEqual(user.username, 'new_user')
+        # learning_status загружен тем же запросом
+        with self.assertNumQueries(0):
+            self.assertEqual(user.learning_status.user_id, user.id)
+        self.assertTrue(LearningStatus.objects.filter(user_id=user.id).exists())
+
+    def test_existing_user(self):
+        created, _ = resolve_user(302, 'old_name')
+
+        with self.assertNumQueries(1):
+            user, is_created = resolve_user('302', 'old_name')
+        self.assertFalse(is_created)
+        self.assertEqual(user.id, created.id)
+
+        # username обновляется тем же запросом
+        with self.assertNumQueries(1):
+            user, is_created = resolve_user(302, 'new_name')
+        self.assertFalse(is_created)
+        self.assertEqual(User.objects.get(id=created.id).username, 'new_name')
+        self.assertEqual(User.objects.filter(chat_id='302').count(), 1)
+        self.assertEqual(LearningStatus.objects.filter(user_id=created.id).count(), 1)
+
+    def test_concurrent_insert(self):
+        """ Пользователя создал другой процесс, пока запрос ждал его commit-а: повтор запроса """
+        inserted, release = threading.Event(), threading.Event()
+        result = {}
+
+        def other_process():
+            try:
+                with transaction.atomic():
+                    result['other'] = User.objects.create(chat_id='303', username='other')
+                    inserted.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def resolve():
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    result['resolved'] = resolve_user(303, 'other')
+                result['queries'] = len(queries)
+            finally:
+                connection.close()
+
+        other = threading.Thread(target=other_process)
+        other.start()
+        self.assertTrue(inserted.wait(5))
+        resolving = threading.Thread(target=resolve)
+        resolving.start()
+        # INSERT ... ON CONFLICT ждет commit-а другой транзакции
+        time.sleep(0.3)
+        self.assertTrue(resolving.is_alive())
+        release.set()
+        other.join(5)
+        resolving.join(5)
+
+        user, is_created = result['resolved']
+        self.assertFalse(is_created)
+        self.assertEqual(user.id, result['other'].id)
+        self.assertEqual(result['queries'], 2)
+        self.assertEqual(User.objects.filter(chat_id='303').count(), 1)
@@ -0,0 +1,114 @@
+import functools
+import json
+import time
+from unittest import mock
+
+from django.test import LiveServerTestCase, override_settings
+from django.urls import reverse
+from telebot import apihelper
+
+from project.testing import FakeServer
+from telegram import handlers  # noqa: F401 регистрирует @bot.message_handler-ы
+from telegram import update_queue, webhook
+from telegram.models import IncomingUpdate
+
+SECRET = 'test-secret'
+
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET=SECRET, TELEGRAM_DEBUG=False)
+class WebhookTests(LiveServerTestCase):
+    """
+    Fake Bot API присылает обновления на webhook, они сохраняются в очередь в БД,
+    воркер обрабатывает их хэндлерами, ответы уходят в fake Bot API
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.bot_api = FakeServer('fake_bot_api', 'FakeBotApi')
+        cls.bot_api.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bot_api.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        # запросы бота идут в fake Bot API (как TELEGRAM_API_URL в telegram.bot)
+        make_request = functools.partial(
+            apihelper._make_request, base_url=self.bot_api.url + '/bot{0}/{1}',
+        )
+        patcher = mock.patch.object(apihelper, '_make_request', make_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.bot_api.api.sent.clear()
+        webhook.set_webhook(self.live_server_url + reverse('telegram_webhook'), SECRET)
+
+    def wait_sent(self, count: int, timeout=5) -> list:
+        deadline = time.monotonic() + timeout
+        while len(self.bot_api.api.sent) < count and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.bot_api.api.sent
+
+    def test_update_is_queued_and_handled(self):
+        self.bot_api.api.add_update(chat_id=101, text='/start')
+
+        item = IncomingUpdate.objects.get(chat_id=101)
+        self.assertEqual(item.status, IncomingUpdate.Status.NEW)
+
+        self.assertTrue(update_queue.process_item(update_queue.claim_update('test-worker')))
+        item.refresh_from_db()
+        self.assertEqual(item.status, IncomingUpdate.Status.DONE)
+
+        sent = self.wait_sent(1)
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(str(sent[0]['chat_id']), '101')
+        self.assertIn('Добро пожаловать', sent[0]['text'])
+
+    def test_updates_of_chat_are_handled_in_order(self):
+        # обновления одного чата могли принять разные процессы web-сервера
+        first = self.bot_api.api.add_update(chat_id=102, text='/start')
+        self.bot_api.api.add_update(chat_id=102, text='/help')
+        other = self.bot_api.api.add_update(chat_id=103, text='/start')
+
+        first_item = update_queue.claim_update('test-worker-1')
+        self.assertEqual(first_item.update_id, first['update_id'])
+        # пока первое обновление чата не обработано, второе не выдается
+        other_item = update_queue.claim_update('test-worker-2')
+        self.assertEqual(other_item.update_id, other['update_id'])
+        self.assertIsNone(update_queue.claim_update('test-worker-3'))
+
+        update_queue.process_item(first_item)
+        self.assertEqual(update_queue.claim_update('test-worker-3').chat_id, 102)
+
+    def test_repeated_update_is_stored_once(self):
+        update = self.bot_api.api.add_update(chat_id=104, text='/start')
+        response = self.client.post(
+            reverse('telegram_webhook'), update, content_type='application/json',
+            HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN=SECRET,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(IncomingUpdate.objects.filter(chat_id=104).count(), 1)
+
+    def test_not_object_update(self):
+        message = {'message_id': 1, 'date': 0, 'text': '/start', 'entities': 1,
+                   'chat': {'id': 106, 'type': 'private'}}
+        for body in ('[]', '"x"', '1', json.dumps({'update_id': 1, 'message': message})):
+            response = self.client.post(
+                reverse('telegram_webhook'), body, content_type='application/json',
+                HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN=SECRET,
+            )
+            self.assertEqual(response.status_code, 400, body)
+        self.assertFalse(IncomingUpdate.objects.exists())
+
+    def test_wrong_secret_token(self):
+        update = {'update_id': 1, 'message': {
+            'message_id': 1, 'date': 0, 'text': '/start', 'chat': {'id': 105, 'type': 'private'},
+        }}
+        response = self.client.post(
+            reverse('telegram_webhook'), update, content_type='application/json',
+            HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='wrong',
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(IncomingUpdate.objects.exists())
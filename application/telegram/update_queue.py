@@ -0,0 +1,196 @@
+"""
+Очередь входящих обновлений в Postgres
+
+Обновления из polling-а или webhook-а сохраняются в IncomingUpdate (повторное обновление
+с тем же update_id игнорируется), а любое количество процессов `manage.py telegram --worker`
+забирает их через SELECT ... FOR UPDATE SKIP LOCKED.
+
+- воркер берет обновление чата, только если у чата нет более ранних необработанных обновлений,
+  поэтому обновления одного чата обрабатываются по порядку
+- воркер берет обновление в аренду (locked_until); если процесс упал, после окончания аренды
+  обновление заберет другой воркер
+- обработка и отметка об обработке выполняются в одной транзакции: упавший хэндлер
+  не оставляет изменений в БД, обновление обрабатывается заново
+- после TELEGRAM_QUEUE_MAX_ATTEMPTS неудачных попыток обновление получает статус dead
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import typing
+
+import telebot
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from app import metrics
+
+from .bot import bot
+from .dispatcher import get_update_chat_id
+from .models import IncomingUpdate
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLostException(Exception):
+    pass
+
+
+def enqueue_updates(raw_updates: typing.List[dict]):
+    items = []
+    for raw_update in raw_updates:
+        update = telebot.types.Update.de_json(raw_update)
+        items.append(IncomingUpdate(
+            update_id=update.update_id,
+            chat_id=get_update_chat_id(update),
+            data=json.dumps(raw_update),
+        ))
+    # ON CONFLICT DO NOTHING: telegram может прислать одно обновление несколько раз
+    IncomingUpdate.objects.bulk_create(items, ignore_conflicts=True)
+
+
+def claim_update(worker_id: str) -> typing.Optional[IncomingUpdate]:
+    now = timezone.now()
+    earlier_unfinished = IncomingUpdate.objects.filter(
+        chat_id=OuterRef('chat_id'),
+        update_id__lt=OuterRef('update_id'),
+        status__in=IncomingUpdate.Status.UNFINISHED,
+    )
+    is_new = Q(status=IncomingUpdate.Status.NEW, available_at__lte=now)
+    # обновление взял упавший воркер: аренда закончилась
+    is_lease_expired = Q(status=IncomingUpdate.Status.PROCESSING, locked_until__lt=now)
+    claimable = (
+        IncomingUpdate.objects
+        .annotate(has_earlier_unfinished=Exists(earlier_unfinished))
+        .filter(is_new | is_lease_expired, has_earlier_unfinished=False)
+        .order_by('update_id')
+    )
+
+    with atomic():
+        item = claimable.select_for_update(skip_locked=True, of=('self',)).first()
+        if not item:
+            return None
+
+        item.status = IncomingUpdate.Status.PROCESSING
+        item.locked_until = now + settings.TELEGRAM_QUEUE_LEASE
+        item.locked_by = worker_id
+        item.attempts += 1
+        item.save(update_fields=('status', 'locked_until', 'locked_by', 'attempts'))
+    return item
+
+
+def _own_item_queryset(item: IncomingUpdate):
+    # обновление все еще наше: аренду не забрал другой воркер
+    return IncomingUpdate.objects.filter(
+        id=item.id, status=IncomingUpdate.Status.PROCESSING,
+        locked_by=item.locked_by, attempts=item.attempts,
+    )
+
+
+def process_item(item: IncomingUpdate) -> bool:
+    try:
+        with atomic():
+            bot.process_new_updates([telebot.types.Update.de_json(item.data)])
+            is_marked = _own_item_queryset(item).update(
+                status=IncomingUpdate.Status.DONE, locked_until=None,
+                date_processed=timezone.now(), date_updated=timezone.now(),
+            )
+            if not is_marked:
+                raise LeaseLostException(f'Lease for update_id={item.update_id} was lost')
+        return True
+    except Exception as e:
+        logger.exception('Fail process update_id=%s attempt=%d', item.update_id, item.attempts)
+        mark_failed(item, repr(e))
+        return False
+
+
+def mark_failed(item: IncomingUpdate, error: str):
+    if item.attempts >= settings.TELEGRAM_QUEUE_MAX_ATTEMPTS:
+        logger.error('Update update_id=%s moved to dead letters', item.update_id)
+        fields = dict(status=IncomingUpdate.Status.DEAD)
+    else:
+        retry_delay = settings.TELEGRAM_QUEUE_RETRY_DELAY * 2 ** (item.attempts - 1)
+        fields = dict(status=IncomingUpdate.Status.NEW, available_at=timezone.now() + retry_delay)
+
+    _own_item_queryset(item).update(
+        locked_until=None, last_error=error, date_updated=timezone.now(), **fields,
+    )
+
+
+def requeue(queryset):
+    """ Вернуть обновления (например, из dead letters) в очередь """
+    return queryset.update(
+        status=IncomingUpdate.Status.NEW, attempts=0, available_at=timezone.now(),
+        locked_until=None, date_updated=timezone.now(),
+    )
+
+
+def purge_processed_updates():
+    # обработанные обновления храним, чтобы отбрасывать повторы от telegram
+    deleted, _ = IncomingUpdate.objects.filter(
+        status=IncomingUpdate.Status.DONE,
+        date_processed__lt=timezone.now() - settings.TELEGRAM_QUEUE_KEEP_DONE,
+    ).delete()
+    if deleted:
+        logger.info('Purged %d processed updates', deleted)
+
+
+def get_queue_metrics() -> dict:
+    rows = IncomingUpdate.objects.values('status').annotate(count=Count('id'))
+    return {row['status']: row['count'] for row in rows}
+
+
+class QueueWorker:
+    def __init__(self, threads_count: int, poll_interval=0.5):
+        self.threads_count = threads_count
+        self.poll_interval = poll_interval
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self._counters = metrics.Counters('processed', 'failed')
+
+    def run(self):
+        logger.info('Start queue worker %s with %d threads', self.worker_id, self.threads_count)
+        metrics.register('update_queue_worker', self._counters.as_dict)
+        metrics.register('update_queue', get_queue_metrics)
+
+        for number in range(self.threads_count):
+            threading.Thread(
+                target=self._work, args=(f'{self.worker_id}:{number}',),
+                name=f'queue-worker-{number}', daemon=True,
+            ).start()
+
+        metrics_logger = metrics.PeriodicLogger()
+        while True:
+            try:
+                purge_processed_updates()
+                metrics_logger.maybe_log()
+            except Exception:
+                logger.exception('Queue worker maintenance: exception')
+            finally:
+                close_old_connections()
+            time.sleep(60)
+
+    def _work(self, worker_id: str):
+        while True:
+            close_old_connections()
+            try:
+                item = claim_update(worker_id)
+            except Exception:
+                logger.exception('Fail claim update')
+                item = None
+
+            if not item:
+                time.sleep(self.poll_interval)
+                continue
+
+            try:
+                is_processed = process_item(item)
+            except Exception:
+                # не смогли даже отметить ошибку: обновление заберут после окончания аренды
+                logger.exception('Fail mark update_id=%s as failed', item.update_id)
+                is_processed = False
+            self._counters.incr('processed' if is_processed else 'failed')
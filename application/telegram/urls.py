@@ -0,0 +1,7 @@
+from django.urls import path
+
+from telegram import views
+
+urlpatterns = [
+    path('webhook', views.WebhookView.as_view(), name='telegram_webhook'),
+]
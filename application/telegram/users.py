@@ -0,0 +1,167 @@
+"""
+Пользователь для обновления от telegram за один запрос в БД
+
+Одним SQL запросом (CTE):
+- находим пользователя по chat_id или создаем его вместе с LearningStatus
+- обновляем username, если он изменился
+- достаем LearningStatus с repetition_word_status (со словом) и learn_word
+
+Результат раскладывается в модели так же, как это сделал бы select_related,
+поэтому user.learning_status и текущее слово для повторения не делают запросов.
+
+Если состояние чата есть в app.state_cache, запроса нет вовсе.
+"""
+import functools
+import typing
+
+from django.db import connection, transaction
+from django.db.models import Model
+
+from app.models import LearningStatus, User, Word, WordStatus
+from app.state_cache import UserState, build_user, freeze_values, from_values, state_cache
+
+QUERY = '''
+WITH existing AS (
+    SELECT * FROM {user} WHERE chat_id = %(chat_id)s
+), updated AS (
+    UPDATE {user} SET username = %(username)s, date_updated = %(now)s
+    FROM existing
+    WHERE {user}.id = existing.id AND existing.username IS DISTINCT FROM %(username)s
+    RETURNING {user}.*
+), inserted AS (
+    INSERT INTO {user} ({user_insert_columns})
+    SELECT {user_insert_values} WHERE NOT EXISTS (SELECT 1 FROM existing)
+    ON CONFLICT (chat_id) DO NOTHING
+    RETURNING *
+), inserted_status AS (
+    INSERT INTO {status} ({status_insert_columns})
+    SELECT inserted.id, {status_insert_values} FROM inserted
+    RETURNING *
+), found_user AS (
+    SELECT * FROM updated
+    UNION ALL SELECT * FROM existing WHERE NOT EXISTS (SELECT 1 FROM updated)
+    UNION ALL SELECT * FROM inserted
+), found_status AS (
+    SELECT * FROM {status} WHERE user_id = (SELECT id FROM existing)
+    UNION ALL SELECT * FROM inserted_status
+)
+SELECT
+    {user_columns},
+    EXISTS (SELECT 1 FROM inserted),
+    EXISTS (SELECT 1 FROM updated),
+    {status_columns},
+    {repetition_columns},
+    {repetition_word_columns},
+    {learn_word_columns}
+FROM found_user
+LEFT JOIN found_status ON TRUE
+LEFT JOIN {word_status} rws ON rws.id = found_status.repetition_word_status_id
+LEFT JOIN {word} rw ON rw.id = rws.word_id
+LEFT JOIN {word} lw ON lw.id = found_status.learn_word_id
+'''
+
+
+def _columns(model: typing.Type[Model], alias: str) -> str:
+    return ', '.join(
+        f'{alias}.{connection.ops.quote_name(field.column)}'
+        for field in model._meta.concrete_fields
+    )
+
+
+def _insert_params(instance: Model, exclude=()) -> typing.Tuple[str, typing.List]:
+    """ колонки и значения для INSERT, как их подставил бы instance.save() """
+    columns, values = [], []
+    for field in instance._meta.concrete_fields:
+        if field.primary_key or field.attname in exclude:
+            continue
+        columns.append(connection.ops.quote_name(field.column))
+        values.append(field.get_db_prep_save(field.pre_save(instance, add=True), connection))
+    return ', '.join(columns), values
+
+
+def _pop_values(values: typing.List, model: typing.Type[Model]) -> typing.Optional[tuple]:
+    """ Значения полей модели из начала строки; None, если LEFT JOIN не нашел строку """
+    fields_count = len(model._meta.concrete_fields)
+    model_values = freeze_values(values[:fields_count])
+    del values[:fields_count]
+    return model_values if model_values[0] is not None else None
+
+
+def _build_query(user: User, status: LearningStatus):
+    quote = connection.ops.quote_name
+
+    user_insert_columns, user_insert_values = _insert_params(user)
+    status_insert_columns, status_insert_values = _insert_params(status, exclude=('user_id',))
+    sql = QUERY.format(
+        user=quote(User._meta.db_table),
+        status=quote(LearningStatus._meta.db_table),
+        word_status=quote(WordStatus._meta.db_table),
+        word=quote(Word._meta.db_table),
+        user_insert_columns=user_insert_columns,
+        user_insert_values=', '.join(f'%(user_{i})s' for i in range(len(user_insert_values))),
+        status_insert_columns=(
+            f'{quote(LearningStatus._meta.get_field("user").column)}, {status_insert_columns}'
+        ),
+        status_insert_values=', '.join(
+            f'%(status_{i})s' for i in range(len(status_insert_values))
+        ),
+        user_columns=_columns(User, 'found_user'),
+        status_columns=_columns(LearningStatus, 'found_status'),
+        repetition_columns=_columns(WordStatus, 'rws'),
+        repetition_word_columns=_columns(Word, 'rw'),
+        learn_word_columns=_columns(Word, 'lw'),
+    )
+    params = {
+        'chat_id': user.chat_id,
+        'username': user.username,
+        'now': user.date_created,
+        **{f'user_{i}': value for i, value in enumerate(user_insert_values)},
+        **{f'status_{i}': value for i, value in enumerate(status_insert_values)},
+    }
+    return sql, params
+
+
+def resolve_user(chat_id, username: str) -> typing.Tuple[User, bool]:
+    """ (пользователь с загруженным learning_status, создан ли пользователь) """
+    chat_id = str(chat_id)
+    user = state_cache.get(chat_id, username)
+    if user is not None:
+        return user, False
+
+    seq = state_cache.get_seq()
+    sql, params = _build_query(User(chat_id=chat_id, username=username), LearningStatus())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+        if row is None:
+            # пользователя одновременно создал другой процесс: теперь он уже есть
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+
+    values = list(row)
+    user_values = _pop_values(values, User)
+    is_created = values.pop(0)
+    is_updated = values.pop(0)
+    status_values = _pop_values(values, LearningStatus)
+    repetition_values = _pop_values(values, WordStatus)
+    repetition_word_values = _pop_values(values, Word)
+    learn_word_values = _pop_values(values, Word)
+
+    if status_values is None:
+        # старый пользователь без LearningStatus: создастся в user.learning_status
+        return from_values(User, user_values), is_created
+
+    state = UserState(
+        user=user_values,
+        learning_status=status_values,
+        repetition_word_status=repetition_values,
+        repetition_word=repetition_word_values,
+        learn_word=learn_word_values,
+    )
+    user = build_user(state, seq)
+    # уведомление о нашей же записи (новый пользователь, username) не должно удалять снимок
+    own_pid = connection.connection.get_backend_pid() if is_created or is_updated else None
+    # как write_through: снимок попадет в кэш только после commit-а (в @atomic хэндлере
+    # созданный пользователь мог откатиться), вне транзакции on_commit выполнится сразу
+    transaction.on_commit(functools.partial(state_cache.store, user, state, seq, own_pid=own_pid))
+    return user, is_created
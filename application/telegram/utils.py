@@ -1,40 +1,57 @@
+import concurrent.futures
 import logging
 from random import choice as random_choice
 
 import telebot
 from django.conf import settings
 
-from app.models import User
-from app.utils import retry_if_false, safe_str
-from telegram.exceptions import SendMessageException
+from app.models import User, Word
+from app.utils import safe_str
 
-from . import constants
+from . import aio, constants, outbox
 from .bot import bot
+from .sender import Priority, sender
+from .users import resolve_user
 
 logger = logging.getLogger(__name__)
 
 
-@retry_if_false(attempts_count=5, sleep_time=0.1, use_logging=True)
-def safe_send_message(user: User, text: str, markup=None, parse_mode=None) -> bool:
-    if settings.TELEGRAM_DEBUG:
-        logger.info('User=%d SEND MESSAGE=%s', user.id, safe_str(text))
-        return True
-
+def safe_send_message(user: User, text: str, markup=None, parse_mode=None,
+                      priority=Priority.INTERACTIVE) -> bool:
+    """ Отправляет сообщение сразу и ждет результат, но не дольше TELEGRAM_SEND_WAIT_TIMEOUT """
+    # повторы, лимиты telegram и 429 обрабатывает sender
+    future = sender.send(
+        user.chat_id, text, markup=markup, parse_mode=parse_mode, priority=priority,
+    )
     try:
-        bot.send_message(user.chat_id, text, reply_markup=markup, parse_mode=parse_mode)
-        return True
-    except telebot.apihelper.ApiException as e:
-        logger.info('User=%s cant send message: api_exception=%s, msg=%s', user.username, e, text)
-        return False
-    except Exception as e:
-        logger.exception('User=%s cant send message: base exception=%sm msg=%s',
-                         user.username, e, text)
+        is_sent = future.result(timeout=settings.TELEGRAM_SEND_WAIT_TIMEOUT.total_seconds())
+    except concurrent.futures.TimeoutError:
+        # сообщение останется в очереди sender-а и может уйти позже
+        logger.warning('User=%s message is not sent in time: msg=%s',
+                       user.username, safe_str(text))
         return False
+    if not is_sent:
+        logger.info('User=%s cant send message: msg=%s', user.username, safe_str(text))
+    return is_sent
 
 
 def send_message(user: User, text: str, markup=None, parse_mode=None):
-    if not safe_send_message(user, text, markup=markup, parse_mode=parse_mode):
-        raise SendMessageException()
+    """ Сообщение отправится после commit-а текущей транзакции (см. telegram.outbox) """
+    outbox.add_message(user.chat_id, text, markup=markup, parse_mode=parse_mode)
+
+
+def send_word_sound_data(user: User, word: Word, markup=None):
+    """ Произношение и картинку слова найдем в словаре после commit-а транзакции """
+    outbox.add_message(user.chat_id, markup=markup, word=word)
+
+
+def answer_inline_query(query_id, results):
+    runtime = aio.get_running_runtime()
+    if runtime:
+        # asyncio runtime: запрос выполнит event loop, поток хэндлера его не ждет
+        runtime.spawn(runtime.api.answer_inline_query(query_id, results))
+    else:
+        bot.answer_inline_query(query_id, results=results)
 
 
 def generate_markup(*items):
@@ -53,18 +70,10 @@ def get_learn_repeat_markup():
 
 
 def get_user(message: telebot.types.Message) -> User:
-    user, is_created = User.objects.get_or_create(
-        chat_id=message.chat.id,
-        defaults=dict(
-            username=message.from_user.username,
-        ),
-    )
+    """ Один запрос в БД: пользователь (создается, username обновляется) и его learning_status """
+    user, is_created = resolve_user(message.chat.id, message.from_user.username)
     if is_created:
         logger.info('Added new user chat_id=%s, username=%s', user.chat_id, user.username)
-
-    if user.username != message.from_user.username:
-        user.username = message.from_user.username
-        user.save(update_fields=('username',))
     return user
 
 
@@ -0,0 +1,34 @@
+import json
+
+import telebot
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from telegram import update_queue
+from telegram.webhook import SECRET_TOKEN_HEADER, is_valid_secret_token
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class WebhookView(View):
+    """
+    Сохраняет обновления в очередь в БД (IncomingUpdate), обрабатывают их процессы
+    `manage.py telegram --worker`: gunicorn запускает несколько процессов, обновления
+    одного чата могут прийти в разные процессы, а порядок обработки сохраняет только общая очередь
+    """
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        if not is_valid_secret_token(request.META.get(SECRET_TOKEN_HEADER, '')):
+            return HttpResponseForbidden()
+
+        try:
+            raw_update = json.loads(request.body.decode('utf-8'))
+            telebot.types.Update.de_json(raw_update)
+        except (ValueError, KeyError, TypeError):
+            # json не того вида ([], "x", список - числом): на 500 telegram повторял бы бесконечно
+            return HttpResponseBadRequest()
+
+        update_queue.enqueue_updates([raw_update])
+        return HttpResponse()
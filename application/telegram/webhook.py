@@ -0,0 +1,32 @@
+import hmac
+import json
+
+from django.conf import settings
+from telebot import apihelper
+
+from .bot import bot
+
+# в этом заголовке telegram присылает secret_token, указанный в setWebhook
+SECRET_TOKEN_HEADER = 'HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN'
+ALLOWED_UPDATES = ('message', 'inline_query')
+
+
+def set_webhook(url=None, secret_token=None) -> bool:
+    # telebot.TeleBot.set_webhook не умеет передавать secret_token, поэтому вызываем api напрямую
+    params = {
+        'url': url or settings.TELEGRAM_WEBHOOK_URL,
+        'secret_token': secret_token or settings.TELEGRAM_WEBHOOK_SECRET,
+        'max_connections': settings.TELEGRAM_WORKERS,
+        'allowed_updates': json.dumps(ALLOWED_UPDATES),
+    }
+    return apihelper._make_request(bot.token, 'setWebhook', method='post', params=params)
+
+
+def delete_webhook() -> bool:
+    return bot.delete_webhook()
+
+
+def is_valid_secret_token(secret_token: str) -> bool:
+    if not settings.TELEGRAM_WEBHOOK_SECRET:
+        return False
+    return hmac.compare_digest(secret_token, settings.TELEGRAM_WEBHOOK_SECRET)
@@ -0,0 +1,170 @@
+"""
+Локальный fake Telegram Bot API сервер для ручной проверки бота
+
+    python utils/fake_bot_api.py --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python application/manage.py telegram --set-webhook
+
+    # отправить боту сообщение от пользователя (через webhook или getUpdates)
+    curl -d '{"chat_id": 1, "text": "/start"}' http://127.0.0.1:8081/updates
+    # посмотреть, что бот отправил пользователям
+    curl http://127.0.0.1:8081/sent
+    # следующие 3 отправки ответят 429 Too Many Requests
+    curl -d '{"count": 3, "retry_after": 5}' http://127.0.0.1:8081/too_many_requests
+"""
+import itertools
+import json
+import threading
+import time
+import urllib.request
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class ApiError(Exception):
+    def __init__(self, error_code, description, parameters=None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.parameters = parameters
+
+
+class FakeBotApi:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.updates = []
+        self.sent = []
+        self.webhook_url = ''
+        self.secret_token = ''
+        # столько следующих sendMessage ответят 429 с retry_after
+        self.too_many_requests = 0
+        self.retry_after = 1
+
+    def call(self, method, params):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'fake', 'username': 'fake_bot'}
+        if method == 'setWebhook':
+            self.webhook_url = params.get('url', '')
+            self.secret_token = params.get('secret_token', '')
+            return True
+        if method == 'deleteWebhook':
+            self.webhook_url = ''
+            return True
+        if method == 'getUpdates':
+            return self.get_updates(int(params.get('offset') or 0))
+        if method == 'sendMessage':
+            with self.lock:
+                if self.too_many_requests:
+                    self.too_many_requests -= 1
+                    raise ApiError(429, f'Too Many Requests: retry after {self.retry_after}',
+                                   {'retry_after': self.retry_after})
+                self.sent.append(params)
+            return {
+                'message_id': next(self.message_ids), 'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'private'}, 'text': params['text'],
+            }
+        return True
+
+    def set_too_many_requests(self, count, retry_after=1):
+        with self.lock:
+            self.too_many_requests = count
+            self.retry_after = retry_after
+
+    def get_updates(self, offset):
+        time.sleep(0.5)  # имитируем long polling
+        with self.lock:
+            self.updates = [u for u in self.updates if u['update_id'] >= offset]
+            return list(self.updates)
+
+    def add_update(self, chat_id, text, username='fake_user'):
+        update = {
+            'update_id': next(self.update_ids),
+            'message': {
+                'message_id': next(self.message_ids), 'date': int(time.time()), 'text': text,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': username,
+                         'username': username},
+            },
+        }
+        if text.startswith('/'):
+            update['message']['entities'] = [
+                {'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])},
+            ]
+
+        if not self.webhook_url:
+            with self.lock:
+                self.updates.append(update)
+            return update
+
+        request = urllib.request.Request(
+            self.webhook_url, data=json.dumps(update).encode('utf-8'),
+            headers={'Content-Type': 'application/json',
+                     'X-Telegram-Bot-Api-Secret-Token': self.secret_token},
+        )
+        urllib.request.urlopen(request, timeout=5).read()
+        return update
+
+
+def make_handler(api: FakeBotApi):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.handle_request()
+
+        def do_POST(self):
+            self.handle_request()
+
+        def handle_request(self):
+            url = urlsplit(self.path)
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode('utf-8')
+
+            if url.path == '/updates':
+                data = json.loads(body)
+                return self.send_json(api.add_update(data['chat_id'], data['text'],
+                                                     data.get('username', 'fake_user')))
+            if url.path == '/sent':
+                return self.send_json(api.sent)
+            if url.path == '/too_many_requests':
+                data = json.loads(body)
+                api.set_too_many_requests(data['count'], data.get('retry_after', 1))
+                return self.send_json(True)
+
+            params = dict(parse_qsl(url.query))
+            if body and self.headers.get('Content-Type', '').startswith('application/json'):
+                params.update(json.loads(body))
+            elif body:
+                params.update(parse_qsl(body))
+            method = url.path.rsplit('/', 1)[-1]
+            try:
+                result = api.call(method, params)
+            except ApiError as e:
+                error = {'ok': False, 'error_code': e.error_code, 'description': e.description}
+                if e.parameters:
+                    error['parameters'] = e.parameters
+                return self.send_json(error, status=e.error_code)
+            self.send_json({'ok': True, 'result': result})
+
+        def send_json(self, data, status=200):
+            content = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeBotApi()))
+    print(f'Fake Bot API on http://{args.host}:{args.port}')
+    server.serve_forever()
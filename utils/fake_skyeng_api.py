@@ -0,0 +1,104 @@
+"""
+Локальный fake сервер словаря skyeng для ручной проверки и нагрузочных тестов
+
+    python utils/fake_skyeng_api.py --port 8082 --latency 0.2 --fail-rate 0.1
+    SKYENG_API_URL=http://127.0.0.1:8082 python application/manage.py enrich_words
+
+    # сколько запросов получил сервер
+    curl http://127.0.0.1:8082/stats
+
+Слово находится, если состоит из латинских букв; у слов на "x" нет произношения.
+"""
+import json
+import random
+import re
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SEARCH_PATH = '/api/public/v1/words/search'
+
+
+class FakeSkyengApi:
+    def __init__(self, latency=0.0, fail_rate=0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'failed': 0}
+
+    def search(self, word: str, page_size: int):
+        with self.lock:
+            self.stats['requests'] += 1
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            with self.lock:
+                self.stats['failed'] += 1
+            return None
+
+        word = word.strip().lower()
+        if not re.fullmatch(r'[a-z][a-z \'-]*', word):
+            return []
+
+        has_sound = not word.startswith('x')
+        return [{
+            'id': abs(hash(word)) % 10 ** 6,
+            'text': word,
+            'meanings': [{
+                'id': 1,
+                'soundUrl': f'//d2fmfepycn0xw0.cloudfront.net/?text={word}' if has_sound else None,
+                'imageUrl': f'//d2zkmv5t5kao9.cloudfront.net/images/{word}.jpeg',
+                'previewUrl': f'//d2zkmv5t5kao9.cloudfront.net/images/{word}_preview.jpeg',
+                'translation': {'text': f'перевод {word}', 'note': None},
+            }],
+        }][:page_size]
+
+
+def make_handler(api: FakeSkyengApi):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == '/stats':
+                return self.send_json(200, api.stats)
+            if url.path != SEARCH_PATH:
+                return self.send_json(404, {'message': 'Not found'})
+
+            query = parse_qs(url.query)
+            result = api.search(query.get('search', [''])[0],
+                                int(query.get('pageSize', ['5'])[0]))
+            if result is None:
+                return self.send_json(503, {'message': 'Service unavailable'})
+            return self.send_json(200, result)
+
+        def send_json(self, status, data):
+            content = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            try:
+                self.wfile.write(content)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # клиент не дождался ответа (timeout, отмена)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, секунды')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='Доля запросов, на которые сервер ответит 503')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_handler(FakeSkyengApi(args.latency, args.fail_rate)),
+    )
+    print(f'Fake Skyeng API on http://{args.host}:{args.port}')
+    server.serve_forever()